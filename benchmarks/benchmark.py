@@ -0,0 +1,291 @@
+"""
+=============================================================================
+File: benchmark.py
+Description: Time the stages of fetch-photos.py, check-dates.py and
+move-to-date-taken-folder-2.py on a synthetic tree made by photo_tree.py.
+Stages are timed separately: walking the source, reading dates, checking the
+destination, copying, a rerun over an already imported source, checking
+dates and relocating files. Each reports files/sec, MB/s and the peak RSS so
+far. Startup is measured in fresh interpreters: the time for --help, and for
+one file of each type the time to import fetch-photos.py, the time to handle
+the file and which image libraries were loaded. The results are printed as
+JSON and can be compared with an earlier run's with --compare.
+Author: Praful https://github.com/Praful/fetch-photos
+Licence: GPL v3
+
+# py ./benchmark.py --photos 5000 --videos 20 --output results.json
+# py ./benchmark.py --photos 5000 --videos 20 --compare results.json
+=============================================================================
+"""
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(BENCHMARK_DIR), 'src')
+sys.path.insert(0, SRC_DIR)
+
+import photo_tree
+from file_walker import walk_files
+from photo_metadata import file_dates
+from destination_index import DestinationIndex
+from metadata_cache import MetadataCache, cached_file_dates
+
+
+def load_script(filename):
+    """
+    Import one of the scripts in src, whose names aren't valid module names.
+    """
+    name = filename.replace('-', '_').removesuffix('.py')
+    spec = importlib.util.spec_from_file_location(name, os.path.join(SRC_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+class Timer:
+    """
+    Times a stage and records its throughput in results.
+    """
+
+    def __init__(self, results, stage, quiet=True):
+        self.results = results
+        self.stage = stage
+        self.quiet = quiet
+        self.files = 0
+        self.bytes = 0
+
+    def __enter__(self):
+        self.redirect = contextlib.redirect_stdout(io.StringIO()) if self.quiet else None
+        if self.redirect:
+            self.redirect.__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        if self.redirect:
+            self.redirect.__exit__(*exc)
+        self.results[self.stage] = {
+            'seconds': round(seconds, 4),
+            'files': self.files,
+            'mb': round(self.bytes / 1e6, 2),
+            'files_per_sec': round(self.files / seconds, 1) if seconds else None,
+            'mb_per_sec': round(self.bytes / 1e6 / seconds, 2) if seconds else None,
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+        }
+        print(f'{self.stage:12} {seconds:8.3f}s  {self.files:7} files  '
+              f'{self.results[self.stage]["mb_per_sec"] or 0:9.2f} MB/s', file=sys.stderr)
+        return False
+
+
+# run in a fresh interpreter so nothing is already imported
+STARTUP_CODE = '''
+import importlib.util, json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {src!r})
+spec = importlib.util.spec_from_file_location('fetch_photos', {script!r})
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+imported = time.perf_counter()
+module.move_files({source!r}, {dest!r}, None, None, False, use_journal=False)
+done = time.perf_counter()
+print(json.dumps({{
+    'import_seconds': round(imported - start, 4),
+    'first_file_seconds': round(done - imported, 4),
+    'loaded': sorted(m for m in ('PIL', 'pillow_heif') if m in sys.modules),
+}}))
+'''
+
+
+def startup(source, work_dir):
+    """
+    Measure startup in fresh interpreters: --help, then fetch-photos.py on a
+    folder holding just one file of each type in source.
+    """
+    script = os.path.join(SRC_DIR, 'fetch-photos.py')
+    result = {}
+
+    start = time.perf_counter()
+    subprocess.run([sys.executable, script, '--help'], check=True, stdout=subprocess.DEVNULL)
+    result['help_seconds'] = round(time.perf_counter() - start, 4)
+
+    samples = {}
+    for entry in walk_files(source):
+        samples.setdefault(os.path.splitext(entry.name)[1].lower(), entry.path)
+
+    for ext, filepath in sorted(samples.items()):
+        folder = os.path.join(work_dir, 'startup' + ext)
+        os.makedirs(os.path.join(folder, 'source'))
+        shutil.copy2(filepath, os.path.join(folder, 'source'))
+        code = STARTUP_CODE.format(src=SRC_DIR, script=script,
+                                   source=os.path.join(folder, 'source'),
+                                   dest=os.path.join(folder, 'dest'))
+        out = subprocess.run([sys.executable, '-c', code], check=True,
+                             capture_output=True, text=True).stdout
+        result[ext.lstrip('.')] = json.loads(out.splitlines()[-1])
+        print(f'startup {ext:5} {result[ext.lstrip(".")]}', file=sys.stderr)
+
+    return result
+
+
+def run(args, work_dir):
+    source = os.path.join(work_dir, 'source')
+    dest = os.path.join(work_dir, 'dest')
+    cache_file = os.path.join(work_dir, 'cache.sqlite')
+    results = {}
+
+    tree = photo_tree.generate(
+        source, args.photos, videos=args.videos, large_videos=args.large_videos,
+        photo_kb=args.photo_kb, video_mb=args.video_mb,
+        large_video_mb=args.large_video_mb, excluded=args.excluded, seed=args.seed)
+
+    startup_results = startup(source, work_dir)
+
+    fetch_photos = load_script('fetch-photos.py')
+    check_dates = load_script('check-dates.py')
+    relocate = load_script('move-to-date-taken-folder-2.py')
+
+    with Timer(results, 'scan') as t:
+        entries = list(walk_files(source))
+        t.files = len(entries)
+
+    with Timer(results, 'exif') as t:
+        for entry in entries:
+            file_dates(entry.path, entry.stat(), fetch_photos.has_embedded_date(entry.path))
+        t.files = len(entries)
+
+    with Timer(results, 'copy') as t:
+        stats = fetch_photos.move_files(
+            source, dest, args.exclude, None, False, args.workers, args.copy_workers,
+            cache=None, use_journal=False)
+        t.files = stats['copied']
+        t.bytes = sum(entry.stat().st_size for entry in walk_files(dest))
+
+    # the skip decision for every file in the destination
+    copied = [(os.path.basename(os.path.dirname(entry.path)), entry.name)
+              for entry in walk_files(dest)]
+    with Timer(results, 'dest_check') as t:
+        index = DestinationIndex(dest)
+        for folder, filename in copied:
+            index.exists(folder, filename)
+        t.files = len(copied)
+
+    # a rerun over the same source with a warm cache: nothing to copy
+    cache = MetadataCache(cache_file)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for entry in entries:
+            cached_file_dates(cache, entry.path, fetch_photos.has_embedded_date(entry.path),
+                              entry.stat())
+    with Timer(results, 'rerun') as t:
+        stats = fetch_photos.move_files(source, dest, args.exclude, None, False,
+                                        args.workers, args.copy_workers, cache=cache,
+                                        use_journal=False)
+        t.files = stats['files']
+    cache.close()
+
+    with Timer(results, 'check_dates') as t:
+        check_dates.move_files(dest, None, None, False)
+        t.files = len(list(walk_files(dest)))
+
+    # move every file into the wrong folder so they all need relocating
+    misfiled = os.path.join(dest, '1999-01-01')
+    os.makedirs(misfiled, exist_ok=True)
+    for entry in list(walk_files(dest)):
+        if os.path.dirname(entry.path) != misfiled:
+            os.replace(entry.path, os.path.join(misfiled, entry.name))
+    with Timer(results, 'relocate') as t:
+        relocate.update_file_location(dest + os.sep, None, None, False)
+        t.files = len(list(walk_files(dest)))
+
+    return {
+        'config': {key: value for key, value in vars(args).items()
+                   if key not in ('output', 'compare', 'work_dir', 'keep')},
+        'tree': tree,
+        'platform': {'python': platform.python_version(), 'system': platform.platform()},
+        'startup': startup_results,
+        'stages': results,
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+
+
+def compare(report, baseline_file):
+    """
+    Print each stage's time relative to an earlier report.
+    """
+    with open(baseline_file) as f:
+        baseline = json.load(f)
+    if baseline.get('config') != report['config']:
+        print('Warning: the baseline was run with different settings', file=sys.stderr)
+    for stage, result in report['stages'].items():
+        before = baseline['stages'].get(stage)
+        if before and result['seconds']:
+            print(f'{stage:12} {before["seconds"]:8.3f}s -> {result["seconds"]:8.3f}s '
+                  f'({before["seconds"] / result["seconds"]:.2f}x)', file=sys.stderr)
+
+
+def setup_command_line():
+    """
+    Define command line switches
+    """
+    cmdline = argparse.ArgumentParser(
+        prog='benchmark.py', description='Benchmark fetch-photos on a synthetic photo tree')
+    cmdline.add_argument('--photos', type=int, default=2000)
+    cmdline.add_argument('--videos', type=int, default=10)
+    cmdline.add_argument('--large-videos', type=int, default=1)
+    cmdline.add_argument('--photo-kb', type=int, default=300)
+    cmdline.add_argument('--video-mb', type=int, default=20)
+    cmdline.add_argument('--large-video-mb', type=int, default=500)
+    cmdline.add_argument('--excluded', type=int, default=100,
+                         help='Files in a thumbnail-cache folder excluded from the copy')
+    cmdline.add_argument('--exclude', type=str, default='thumbnail-cache')
+    cmdline.add_argument('--workers', type=int, default=0)
+    cmdline.add_argument('--copy-workers', type=int, default=0)
+    cmdline.add_argument('--seed', type=int, default=1)
+    cmdline.add_argument('--work-dir', type=str, required=False,
+                         help='Folder for the generated tree (default: a temporary folder)')
+    cmdline.add_argument('--keep', action='store_true', help="Don't delete the generated files")
+    cmdline.add_argument('--output', type=str, required=False, help='Write the JSON here')
+    cmdline.add_argument('--compare', type=str, required=False,
+                         help='Earlier JSON results to compare against')
+    return cmdline
+
+
+def main():
+    args = setup_command_line().parse_args()
+    work_dir = tempfile.mkdtemp(prefix='fetch-photos-bench-', dir=args.work_dir)
+    try:
+        report = run(args, work_dir)
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+"""
+=============================================================================
+File: photo_tree.py
+Description: Generate a synthetic camera/phone folder tree for benchmarking:
+DCIM-style nested folders of JPEGs (with and without DateTimeOriginal),
+PNGs, HEICs, MP4s (including large ones), and sub-folders that are usually
+excluded, such as thumbnail caches. The files have real headers so the date
+readers work on them, but the image data is random filler. The same
+arguments and seed always give the same tree.
+Author: Praful https://github.com/Praful/fetch-photos
+Licence: GPL v3
+
+# py ./photo_tree.py --to /tmp/photo-tree --photos 2000 --videos 20
+=============================================================================
+"""
+import argparse
+import os
+import random
+import struct
+import zlib
+from datetime import datetime, timedelta
+
+EXIF_DATATIME = 306
+EXIF_DATATIME_ORIGINAL = 36867
+EXIF_OFFSET = 34665
+
+# seconds between 1904-01-01 (the MP4 epoch) and 1970-01-01
+MP4_EPOCH_OFFSET = 2082844800
+
+FIRST_DATE = datetime(2015, 1, 1)
+DATE_RANGE_DAYS = 10 * 365
+
+
+def tiff_block(date_original, date):
+    """
+    A little-endian TIFF block with DateTime in IFD0 and DateTimeOriginal in
+    the EXIF IFD; either may be None.
+    """
+    ifd0 = []
+    if date is not None:
+        ifd0.append((EXIF_DATATIME, date))
+    exif_ifd = []
+    if date_original is not None:
+        exif_ifd.append((EXIF_DATATIME_ORIGINAL, date_original))
+
+    # layout: header, IFD0, EXIF IFD, then the date strings
+    ifd0_count = len(ifd0) + 1  # + EXIF IFD pointer
+    ifd0_offset = 8
+    exif_offset = ifd0_offset + 2 + 12 * ifd0_count + 4
+    data_offset = exif_offset + 2 + 12 * len(exif_ifd) + 4
+
+    data = b''
+    entries0 = b''
+    for tag, value in ifd0:
+        raw = value.encode() + b'\x00'
+        entries0 += struct.pack('<HHLL', tag, 2, len(raw), data_offset + len(data))
+        data += raw
+    entries0 += struct.pack('<HHLL', EXIF_OFFSET, 4, 1, exif_offset)
+
+    entries1 = b''
+    for tag, value in exif_ifd:
+        raw = value.encode() + b'\x00'
+        entries1 += struct.pack('<HHLL', tag, 2, len(raw), data_offset + len(data))
+        data += raw
+
+    return (b'II*\x00' + struct.pack('<L', ifd0_offset) +
+            struct.pack('<H', ifd0_count) + entries0 + struct.pack('<L', 0) +
+            struct.pack('<H', len(exif_ifd)) + entries1 + struct.pack('<L', 0) +
+            data)
+
+
+def jpeg_bytes(rng, size, date_original, date):
+    header = b'\xff\xd8'
+    # JFIF APP0 as written by most cameras
+    header += b'\xff\xe0' + struct.pack('>H', 16) + b'JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00'
+    if date_original is not None or date is not None:
+        exif = b'Exif\x00\x00' + tiff_block(date_original, date)
+        header += b'\xff\xe1' + struct.pack('>H', len(exif) + 2) + exif
+    # start of scan then filler for the compressed image data
+    header += b'\xff\xda' + struct.pack('>H', 2)
+    filler = rng.randbytes(max(size - len(header) - 2, 0))
+    return header + filler + b'\xff\xd9'
+
+
+def png_chunk(chunk_type, data):
+    return (struct.pack('>L', len(data)) + chunk_type + data +
+            struct.pack('>L', zlib.crc32(chunk_type + data)))
+
+
+def png_bytes(rng, size, date_original):
+    ihdr = struct.pack('>LLBBBBB', 640, 480, 8, 2, 0, 0, 0)
+    out = b'\x89PNG\r\n\x1a\n' + png_chunk(b'IHDR', ihdr)
+    if date_original is not None:
+        out += png_chunk(b'eXIf', tiff_block(date_original, None))
+    out += png_chunk(b'IDAT', rng.randbytes(max(size - len(out) - 24, 0)))
+    return out + png_chunk(b'IEND', b'')
+
+
+def box(box_type, payload):
+    return struct.pack('>L', len(payload) + 8) + box_type + payload
+
+
+def full_box(box_type, version, flags, payload):
+    return box(box_type, struct.pack('>L', (version << 24) | flags) + payload)
+
+
+def heic_bytes(rng, size, date_original, date):
+    """
+    A HEIF file whose only item is the EXIF block, stored in mdat and located
+    through iinf/iloc as phones write it.
+    """
+    ftyp = box(b'ftyp', b'heic' + struct.pack('>L', 0) + b'mif1heic')
+    exif = struct.pack('>L', 6) + b'Exif\x00\x00' + tiff_block(date_original, date)
+
+    hdlr = full_box(b'hdlr', 0, 0, struct.pack('>L', 0) + b'pict' + b'\x00' * 12 + b'\x00')
+    infe = full_box(b'infe', 2, 0, struct.pack('>HH', 1, 0) + b'Exif' + b'\x00')
+    iinf = full_box(b'iinf', 0, 0, struct.pack('>H', 1) + infe)
+
+    def meta_box(exif_offset):
+        iloc = full_box(b'iloc', 0, 0,
+                        bytes([0x44, 0x00]) +  # offset_size=4 length_size=4, base_offset_size=0
+                        struct.pack('>HHHHLL', 1, 1, 0, 1, exif_offset, len(exif)))
+        return full_box(b'meta', 0, 0, hdlr + iinf + iloc)
+
+    # the EXIF block is the start of mdat's payload
+    exif_offset = len(ftyp) + len(meta_box(0)) + 8
+    head = ftyp + meta_box(exif_offset)
+    filler = rng.randbytes(max(size - len(head) - 8 - len(exif), 0))
+    return head + box(b'mdat', exif + filler)
+
+
+def mp4_write(f, rng, size, created):
+    """
+    Write an MP4 with mdat before moov, as most cameras write them, so a
+    date reader has to skip the media data to find mvhd.
+    """
+    ftyp = box(b'ftyp', b'isom' + struct.pack('>L', 512) + b'isomiso2mp41')
+    timestamp = int(created.timestamp()) + MP4_EPOCH_OFFSET
+    mvhd = full_box(b'mvhd', 0, 0, struct.pack('>LLLL', timestamp, timestamp, 1000, 0) +
+                    b'\x00' * 80)
+    moov = box(b'moov', mvhd)
+    mdat_size = max(size - len(ftyp) - len(moov), 8)
+
+    f.write(ftyp)
+    f.write(struct.pack('>L', mdat_size) + b'mdat')
+    # the rest of mdat is left as a hole, which keeps generating multi-GB
+    # videos fast
+    f.write(rng.randbytes(min(mdat_size - 8, 64 * 1024)))
+    f.seek(len(ftyp) + mdat_size)
+    f.write(moov)
+
+
+def exif_date(d):
+    return d.strftime('%Y:%m:%d %H:%M:%S')
+
+
+def generate(root, photos=1000, no_date_fraction=0.05, png_fraction=0.05,
+             heic_fraction=0.3, videos=10, large_videos=1, photo_kb=300,
+             video_mb=20, large_video_mb=500, excluded=100, per_folder=200, seed=1):
+    """
+    Build the tree under root and return a summary of what was written.
+    """
+    rng = random.Random(seed)
+    summary = {'files': 0, 'bytes': 0, 'jpeg': 0, 'jpeg_no_date': 0, 'png': 0,
+               'heic': 0, 'mp4': 0, 'excluded': 0}
+
+    def folder_for(n):
+        folder = os.path.join(root, 'DCIM', f'{100 + n // per_folder}CAMERA')
+        os.makedirs(folder, exist_ok=True)
+        return folder
+
+    def random_date():
+        return FIRST_DATE + timedelta(seconds=rng.randrange(DATE_RANGE_DAYS * 24 * 3600))
+
+    def write(path, data):
+        with open(path, 'wb') as f:
+            f.write(data)
+        summary['files'] += 1
+        summary['bytes'] += len(data)
+
+    for n in range(photos):
+        folder = folder_for(n)
+        taken = random_date()
+        size = int(photo_kb * 1024 * rng.uniform(0.5, 1.5))
+        kind = rng.random()
+        if kind < heic_fraction:
+            write(os.path.join(folder, f'IMG_{n:05d}.HEIC'),
+                  heic_bytes(rng, size, exif_date(taken), exif_date(taken)))
+            summary['heic'] += 1
+        elif kind < heic_fraction + png_fraction:
+            write(os.path.join(folder, f'Screenshot_{n:05d}.png'),
+                  png_bytes(rng, size, exif_date(taken)))
+            summary['png'] += 1
+        elif rng.random() < no_date_fraction:
+            write(os.path.join(folder, f'DSC{n:05d}.JPG'), jpeg_bytes(rng, size, None, None))
+            summary['jpeg_no_date'] += 1
+        else:
+            # some phones only write DateTime
+            original = exif_date(taken) if rng.random() > 0.1 else None
+            write(os.path.join(folder, f'DSC{n:05d}.JPG'),
+                  jpeg_bytes(rng, size, original, exif_date(taken)))
+            summary['jpeg'] += 1
+
+    for n in range(videos):
+        size = (large_video_mb if n < large_videos else video_mb) * 1024 * 1024
+        path = os.path.join(folder_for(n * per_folder // max(videos, 1)), f'MOV_{n:04d}.MP4')
+        with open(path, 'wb') as f:
+            mp4_write(f, rng, size, random_date())
+        summary['files'] += 1
+        summary['bytes'] += size
+        summary['mp4'] += 1
+
+    # thumbnail caches and the like, normally excluded with --exclude cache
+    cache_folder = os.path.join(root, 'DCIM', 'thumbnail-cache')
+    os.makedirs(cache_folder, exist_ok=True)
+    for n in range(excluded):
+        write(os.path.join(cache_folder, f'thumb_{n:05d}.jpg'),
+              jpeg_bytes(rng, 8 * 1024, None, None))
+        summary['excluded'] += 1
+
+    return summary
+
+
+def setup_command_line():
+    """
+    Define command line switches
+    """
+    cmdline = argparse.ArgumentParser(
+        prog='photo_tree.py', description='Generate a synthetic photo folder tree')
+    cmdline.add_argument('--to', dest='root', type=str, required=True,
+                         help='Folder to create the tree in')
+    cmdline.add_argument('--photos', type=int, default=1000, help='Number of photos')
+    cmdline.add_argument('--videos', type=int, default=10, help='Number of MP4s')
+    cmdline.add_argument('--large-videos', type=int, default=1,
+                         help='How many of the MP4s are large')
+    cmdline.add_argument('--photo-kb', type=int, default=300, help='Average photo size')
+    cmdline.add_argument('--video-mb', type=int, default=20, help='Size of normal MP4s')
+    cmdline.add_argument('--large-video-mb', type=int, default=500, help='Size of large MP4s')
+    cmdline.add_argument('--heic-fraction', type=float, default=0.3)
+    cmdline.add_argument('--png-fraction', type=float, default=0.05)
+    cmdline.add_argument('--no-date-fraction', type=float, default=0.05,
+                         help='Fraction of JPEGs without EXIF dates')
+    cmdline.add_argument('--excluded', type=int, default=100,
+                         help='Files in the thumbnail-cache folder')
+    cmdline.add_argument('--per-folder', type=int, default=200, help='Files per DCIM folder')
+    cmdline.add_argument('--seed', type=int, default=1)
+    return cmdline
+
+
+def main():
+    args = setup_command_line().parse_args()
+    print(generate(os.path.expanduser(args.root), args.photos, args.no_date_fraction,
+                   args.png_fraction, args.heic_fraction, args.videos, args.large_videos,
+                   args.photo_kb, args.video_mb, args.large_video_mb, args.excluded,
+                   args.per_folder, args.seed))
+
+
+if __name__ == '__main__':
+    main()
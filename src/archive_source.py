@@ -0,0 +1,85 @@
+"""
+=============================================================================
+File: archive_source.py
+Description: Read the files in zip and tar archives, eg a Google Takeout
+export, without extracting them first. A zip's members are listed from its
+central directory; a tar, compressed or not, is read in a single pass from
+start to end, which is the only way to read a compressed tar without going
+back over it. Each member is handed on as an open file so its start can be
+read for its date and the rest streamed straight into the destination.
+Author: Praful https://github.com/Praful/fetch-photos
+Licence: GPL v3
+=============================================================================
+"""
+import os
+import posixpath
+import tarfile
+import time
+import zipfile
+import zlib
+from collections import namedtuple
+
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tgz', '.tar.gz', '.tbz2', '.tar.bz2', '.txz', '.tar.xz')
+
+# enough for the EXIF of a JPEG and the metadata of most HEICs and videos
+# saved with it at the start; other members are read in full before dating
+HEADER_BYTES = 1024 * 1024
+
+# errors from a damaged or truncated archive, besides OSError
+ARCHIVE_ERRORS = (zipfile.BadZipFile, tarfile.TarError, EOFError, zlib.error)
+
+# path is the archive's path joined with the member's, for display and for
+# --exclude/--include; mtime is in seconds since the epoch
+ArchiveMember = namedtuple('ArchiveMember', 'path name size mtime')
+
+
+def is_archive(path):
+    return path.lower().endswith(ARCHIVE_SUFFIXES) and os.path.isfile(path)
+
+
+def member_name(name):
+    """
+    A member's name without the ./ of a tar made with eg tar czf x.tgz .
+    """
+    return posixpath.normpath(name).lstrip('/')
+
+
+def member_path(archive, name):
+    return os.path.join(archive, *name.split('/'))
+
+
+def hidden(name):
+    # as file_walker.walk_files() skips hidden files and folders, and the
+    # resource forks macOS adds to zips; name is from member_name()
+    return any(part.startswith('.') or part == '__MACOSX' for part in name.split('/'))
+
+
+def iter_members(archive):
+    """
+    Yield (ArchiveMember, open file) for each regular file in archive in the
+    order they're stored. The file is only valid until the next member is
+    asked for; a tar member that isn't read is skipped over. Raises OSError
+    or one of ARCHIVE_ERRORS if the archive can't be read.
+    """
+    if zipfile.is_zipfile(archive):
+        with zipfile.ZipFile(archive) as zf:
+            for info in zf.infolist():
+                name = member_name(info.filename)
+                if info.is_dir() or hidden(name):
+                    continue
+                # zip times are local, with no time zone
+                mtime = time.mktime(info.date_time + (0, 0, -1))
+                member = ArchiveMember(member_path(archive, name), name.rsplit('/', 1)[-1],
+                                       info.file_size, mtime)
+                with zf.open(info) as f:
+                    yield member, f
+        return
+
+    with tarfile.open(archive, 'r|*') as tf:
+        for info in tf:
+            name = member_name(info.name)
+            if not info.isfile() or hidden(name):
+                continue
+            member = ArchiveMember(member_path(archive, name), name.rsplit('/', 1)[-1],
+                                   info.size, info.mtime)
+            yield member, tf.extractfile(info)
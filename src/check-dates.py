@@ -1,67 +1,55 @@
 """
 =============================================================================
 File: check-dates.py
-Description: Check which files have exif dates
+Description: Check which files have exif dates. Audits a library: each
+file's date, where it came from and the camera model, and whether the date
+folder the file is in matches its date. Results can be streamed to a CSV or
+JSON lines report, and counts are printed by date source and by folder.
+Dates are read by a pool of workers while the folders are walked, with a
+bounded number of files in flight, so memory use doesn't grow with the size
+of the library.
 
 Author: Praful https://github.com/Praful/fetch-photos
 Licence: GPL v3
 
 # py ./check-dates.py --dir /mnt/sd512/data/pictures/phone-s24ultra --exclude '.mp4'
+# py ./check-dates.py --dir /mnt/nas/pictures --workers 8 --report audit.csv
 =============================================================================
 """
-import glob
 import os
 import time
 import datetime
 import shutil
 import argparse
 import re
+import csv
+import json
+from collections import Counter, defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
 
-# python -m pip install Pillow
-from PIL import Image
-from PIL.ExifTags import TAGS
+from photo_metadata import SOURCE_CTIME, file_dates
+from metadata_cache import open_cache
+from isobmff import is_video
+from checksums import file_checksum, read_manifests
+from path_filter import PathFilter
+from file_walker import walk_files
+from snapshot import Snapshot, snapshot_file
+from executors import QUEUE_DEPTH_PER_WORKER, make_executor
 
-# python -m pip install Pillow-heif (this provides support for heic files)
-from pillow_heif import register_heif_opener
-register_heif_opener()
+# the folder names fetch-photos.py creates
+DATE_FOLDER = re.compile(r'\d{4}-\d{2}-\d{2}$')
 
-EXIF_DATATIME = 306
-EXIF_DATATIME_ORIGINAL = 36867
-EXIF_OFFSET = 34665
+REPORT_CSV = 'csv'
+REPORT_JSONL = 'jsonl'
+REPORT_FORMATS = (REPORT_CSV, REPORT_JSONL)
+REPORT_FIELDS = ('path', 'source', 'date', 'date_original', 'date_modified', 'model',
+                 'folder_mismatch', 'checksum', 'error')
 
+NO_DATE = 'none'
 
-def exif_date_original(filepath):
-    try:
-        im = Image.open(filepath)
-        exif = im.getexif()
-        ifd_data = exif.get_ifd(EXIF_OFFSET)
-
-        if ifd_data is not None:
-            date = ifd_data.get(EXIF_DATATIME_ORIGINAL)
-            if date is not None:
-                return (date.split(' ')[0]).replace(":", "-")
-    except Exception as ex:
-        #  print(f'Info: {filepath}: no exif date taken:', ex)
-        None
-
-    return None
-    #  print('Error getting date taken: ', ex, filepath)
-
-
-def exif_date(filepath):
-    try:
-        im = Image.open(filepath)
-        exif = im.getexif()
-        if exif is not None:
-            date = exif.get(EXIF_DATATIME)
-            if date is not None:
-                return (date.split(' ')[0]).replace(":", "-")
-    except Exception as ex:
-        #  print(f'Info: {filepath}: no exif date:', ex)
-        None
-
-    return None
-    #  print('Error getting date taken: ', ex, filepath)
+# folders listed in the summary unless --verbose
+SUMMARY_FOLDERS = 20
+HISTOGRAM_WIDTH = 40
 
 
 def filestamp_to_local_date_str(d):
@@ -70,12 +58,6 @@ def filestamp_to_local_date_str(d):
     return "%d-%02d-%02d" % (year, month, day)
 
 
-def filestamp_to_utc_date_str(d):
-    year, month, day, hour, minute, second = time.gmtime(d)[
-        :-3]
-    return "%d-%02d-%02d" % (year, month, day)
-
-
 def setup_command_line():
     """
     Define command line switches
@@ -86,78 +68,312 @@ def setup_command_line():
     cmdline.add_argument('--dir', dest='dir', type=str, required=True,
                          help='Folder to check')
 
-    cmdline.add_argument('--exclude', dest='exclude', type=str, required=False,
-                         help='Exclude paths containing this string')
+    cmdline.add_argument('--exclude', dest='exclude', type=str, action='append',
+                         help='Exclude paths containing this string, or matching glob:PATTERN '
+                         'or re:PATTERN; may be repeated')
+
+    cmdline.add_argument('--include', dest='include', type=str, action='append',
+                         help='Include paths containing this regex, or matching glob:PATTERN; '
+                         'overrides --exclude; may be repeated')
+
 
-    cmdline.add_argument('--include', dest='include', type=str, required=False,
-                         help='Include paths containing this regex; overrides --exclude')
+    cmdline.add_argument('--ignore-file', dest='ignore_file', type=str, required=False,
+                         help='File of glob patterns to exclude, one per line; lines '
+                         'starting with ! are patterns to include')
 
     cmdline.add_argument('--verbose', action=argparse.BooleanOptionalAction,
                          default=False, help='Provides verbose output')
 
-    return cmdline
+    cmdline.add_argument('--verify-checksums', action=argparse.BooleanOptionalAction,
+                         default=False,
+                         help='Check files against the checksum manifests written by '
+                         'fetch-photos.py --checksum; mismatches count as errors')
+
+    cmdline.add_argument('--workers', dest='workers', type=int, default=0,
+                         help='Read dates (and checksums) using this many workers')
+
+    cmdline.add_argument('--process-pool', action=argparse.BooleanOptionalAction,
+                         default=False, help='Use processes rather than threads for workers')
+
+    cmdline.add_argument('--report', dest='report', type=str, required=False,
+                         help='Write a line per file to this file')
+
+    cmdline.add_argument('--report-format', dest='report_format', choices=REPORT_FORMATS,
+                         required=False,
+                         help='Format of the report (default: csv if the file name ends in '
+                         '.csv, otherwise jsonl)')
+
+    cmdline.add_argument('--snapshot', action=argparse.BooleanOptionalAction, default=False,
+                         help='Remember the folders and on the next run only check those that '
+                         'have changed, and those that had problems')
 
+    cmdline.add_argument('--snapshot-file', dest='snapshot_file', type=str, required=False,
+                         help='File to keep the --snapshot in (default: one per folder and '
+                         'filters in the cache folder)')
+
+    cmdline.add_argument('--cache', dest='cache', type=str, required=False,
+                         help='File to cache photo dates in between runs')
+
+    cmdline.add_argument('--no-cache', action='store_true',
+                         default=False, help="Don't use or update the photo date cache")
+
+    return cmdline
 
-def must_include(filepath, regex):
-    return re.search(rf'{regex}', filepath) is not None
 
 def is_photo(filepath):
     return filepath.lower().endswith(('.jpg', '.jpeg', '.png', '.heic'))
 
-def get_creation_date(filepath):
-    # eg may be .mp4
-    if not is_photo(filepath):
-        creation_timestamp = os.path.getctime(filepath)
-        return filestamp_to_utc_date_str(creation_timestamp)
-
-    date_original_exif = exif_date_original(filepath)
-    if date_original_exif is not None:
-        return date_original_exif
-
-    date_exif = exif_date(filepath)
-    if date_exif is not None:
-        return date_exif
-    else:
-        # changed 4/4/2025 - don't use file creation date since we should always
-        # find exif data
+def has_embedded_date(filepath):
+    return is_photo(filepath) or is_video(filepath)
+
+def creation_date_from(filepath, dates):
+    # changed 4/4/2025 - don't use file creation date for photos since we
+    # should always find exif data
+    if dates.source == SOURCE_CTIME and is_photo(filepath):
         return None
-        #  creation_timestamp = os.path.getctime(filepath)
-        #  return filestamp_to_utc_date_str(creation_timestamp)
+    return dates.date
+
+def expected_checksum(filepath, manifests):
+    """
+    The (algorithm, digest) for filepath from the manifest of its folder, or
+    None if it's not in one. manifests caches the manifests by folder.
+    """
+    folder, filename = os.path.split(filepath)
+    if folder not in manifests:
+        manifests.clear()  # walked folder by folder so only keep one
+        manifests[folder] = read_manifests(folder)
+    return manifests[folder].get(filename)
 
-def move_files(source_root, exclude, include_regex, verbose):
-    file_count = files_copied = files_exist = file_errors = files_excluded = 0
 
-    for filepath in glob.iglob(source_root + '**/**', recursive=True):
+def audit_file(filepath, st, dates=None, checksum=None):
+    """
+    Worker task: read the file's dates unless they're already known and, if
+    given the (algorithm, digest) from a manifest, check the file against it.
+    Returns (dates, matches) where matches is None if there was no checksum.
+    """
+    if dates is None:
+        dates = file_dates(filepath, st, has_embedded_date(filepath))
+    matches = None
+    if checksum is not None:
+        algorithm, digest = checksum
+        matches = file_checksum(filepath, algorithm, from_disk=True) == digest
+    return dates, matches
 
-        if os.path.isfile(filepath):
-            file_count += 1
 
-            if exclude is not None and not must_include(filepath, include_regex):
-                if exclude in filepath:
-                    if verbose:
-                        print('Excluding', filepath)
-                    files_excluded += 1
-                    continue
+class ReportWriter:
+    """
+    Writes a row per file as CSV or JSON lines.
+    """
+
+    def __init__(self, filepath, report_format=None):
+        if report_format is None:
+            report_format = REPORT_CSV if filepath.lower().endswith('.csv') else REPORT_JSONL
+        self.file = open(filepath, 'w', newline='', encoding='utf-8')
+        self.csv = None
+        if report_format == REPORT_CSV:
+            self.csv = csv.DictWriter(self.file, REPORT_FIELDS)
+            self.csv.writeheader()
+
+    def write(self, row):
+        if self.csv is not None:
+            self.csv.writerow(row)
+        else:
+            self.file.write(json.dumps(row) + '\n')
+
+    def close(self):
+        self.file.close()
+
+
+def print_histogram(title, counts, limit=None):
+    print(title)
+    biggest = max(counts.values(), default=0)
+    for key, count in counts.most_common(limit):
+        bar = '#' * max(1, round(HISTOGRAM_WIDTH * count / biggest))
+        print(f'  {key:30} {count:8}  {bar}')
+    if limit is not None and len(counts) > limit:
+        print(f'  ... and {len(counts) - limit} more')
+
+
+def move_files(source_root, exclude, include_regex, verbose, cache=None,
+               verify_checksums=False, workers=0, process_pool=False, report_file=None,
+               report_format=None, ignore_file=None, snapshot=None):
+    """
+    Audit the files under source_root and return the counts.
+
+    This thread walks the folders and hands files to a pool that reads their
+    dates (and checks their checksums with verify_checksums). Results are
+    gathered here in order, with a bounded number in flight, and written to
+    report_file as they come. The cache is only used from this thread; cache
+    hits skip the pool unless there's a checksum to check.
+
+    A file's folder mismatches if it's named like a date folder (YYYY-MM-DD)
+    but not for the file's date. Files dated by their ctime aren't checked.
 
-            creation_date = get_creation_date(filepath)
+    exclude and include_regex are a pattern or a list of patterns and
+    ignore_file a file of them; see path_filter.PathFilter.
+
+    With a snapshot.Snapshot, only the folders that changed since it was
+    saved are checked, and it's saved at the end. Folders with problems are
+    checked again next time.
+    """
+    path_filter = PathFilter(exclude, include_regex, ignore_file)
+    stats = Counter()
+    by_source = Counter()
+    folder_problems = defaultdict(Counter)
+    manifests = {}
+    pending = deque()
+    depth = workers * QUEUE_DEPTH_PER_WORKER
+    report = ReportWriter(report_file, report_format) if report_file else None
+
+    def retry(filepath):
+        if snapshot is not None:
+            snapshot.retry(filepath)
+
+    def record(filepath, dates, matches, error=None):
+        folder = os.path.dirname(filepath)
+        row = dict.fromkeys(REPORT_FIELDS)
+        row['path'] = filepath
+        row['error'] = error
+
+        if error is not None:
+            print(f'====> {filepath}: FAILED reading date: {error}')
+            stats['errors'] += 1
+            folder_problems[folder]['errors'] += 1
+            retry(filepath)
+        else:
+            creation_date = creation_date_from(filepath, dates)
+            row.update(source=dates.source if creation_date else NO_DATE,
+                       date=creation_date, date_original=dates.date_original,
+                       date_modified=dates.date_modified, model=dates.model)
+            by_source[row['source']] += 1
             if creation_date is None:
-                print(f'====> {filepath}: no creation date found')
-                files_exist += 1
+                if verbose or report is None:
+                    print(f'====> {filepath}: no creation date found')
+                stats['no_date'] += 1
+                folder_problems[folder]['no date'] += 1
+                retry(filepath)
+            else:
+                stats['checked'] += 1
+                folder_name = os.path.basename(folder)
+                if (dates.source != SOURCE_CTIME and DATE_FOLDER.match(folder_name) and
+                        folder_name != creation_date):
+                    row['folder_mismatch'] = True
+                    if verbose:
+                        print(f'====> {filepath}: dated {creation_date}, in {folder_name}')
+                    stats['mismatches'] += 1
+                    folder_problems[folder]['mismatches'] += 1
+                    retry(filepath)
+                else:
+                    row['folder_mismatch'] = False
+
+        if matches is not None:
+            stats['verified'] += 1
+            row['checksum'] = 'ok' if matches else 'mismatch'
+            if not matches:
+                print(f'====> {filepath}: checksum does not match manifest')
+                stats['errors'] += 1
+                folder_problems[folder]['bad checksums'] += 1
+                retry(filepath)
+
+        if report is not None:
+            report.write(row)
+
+    def drain(limit):
+        while len(pending) > limit:
+            filepath, st, future, cache_miss = pending.popleft()
+            try:
+                dates, matches = future.result()
+            except Exception as ex:
+                record(filepath, None, None, str(ex))
                 continue
+            if cache_miss:
+                cache.put(filepath, st, dates)
+            record(filepath, dates, matches)
+
+    executor = ProcessPoolExecutor if process_pool else ThreadPoolExecutor
+    try:
+        with make_executor(executor, workers) as pool:
+            walk = snapshot.walk if snapshot is not None else walk_files
+            for entry in walk(source_root, path_filter.dir_filter()):
+                filepath = entry.path
+                stats['files'] += 1
+
+                if path_filter.excluded(filepath):
+                    if verbose:
+                        print('Excluding', filepath)
+                    stats['excluded'] += 1
+                    continue
 
+                try:
+                    st = entry.stat()
+                except OSError as ex:
+                    # eg removed since its folder was listed; reported in order
+                    future = Future()
+                    future.set_exception(ex)
+                    pending.append((filepath, None, future, False))
+                    drain(depth)
+                    continue
+                checksum = expected_checksum(filepath, manifests) if verify_checksums else None
+                # only files whose header is read are cached
+                dates = cache.get(filepath, st) if cache and has_embedded_date(filepath) \
+                    else None
+                if dates is None or checksum is not None:
+                    future = pool.submit(audit_file, filepath, st, dates, checksum)
+                else:
+                    future = Future()
+                    future.set_result((dates, None))
+                cache_miss = cache is not None and has_embedded_date(filepath) and dates is None
+                pending.append((filepath, st, future, cache_miss))
+                drain(depth)
+            drain(0)
+        if snapshot is not None:
+            snapshot.save()
+    finally:
+        if report is not None:
+            report.close()
+
+    if snapshot is not None:
+        print(f'Snapshot: {snapshot}')
+    print_histogram('Files by date source:', by_source)
+    problems = Counter({folder: sum(counts.values())
+                        for folder, counts in folder_problems.items()})
+    if problems:
+        print_histogram('Folders with problems (no date, mismatches, errors):', problems,
+                        None if verbose else SUMMARY_FOLDERS)
     print(
-        f'Total files: {file_count}\nCopied: {files_copied}\nSkipped: {files_exist}\nExcluded: {files_excluded}\nErrors: {file_errors}')
+        f'Total files: {stats["files"]}\nChecked: {stats["checked"]}\nNo date: {stats["no_date"]}\nFolder mismatches: {stats["mismatches"]}\nExcluded: {stats["excluded"]}\nErrors: {stats["errors"]}')
+    if verify_checksums:
+        print(f'Checksums verified: {stats["verified"]}')
+    return stats
 
 
 def main():
     """
     Processing begins here if script run directly
     """
-    args = setup_command_line().parse_args()
+    cmdline = setup_command_line()
+    args = cmdline.parse_args()
     print(args)
-
-    move_files(os.path.expanduser(args.dir),
-               args.exclude, args.include, args.verbose)
+    if args.snapshot and args.verify_checksums:
+        # damage to a file's content doesn't change its folder
+        cmdline.error('--snapshot cannot be used with --verify-checksums')
+
+    source_root = os.path.expanduser(args.dir)
+    snapshot = None
+    if args.snapshot:
+        snapshot = Snapshot(os.path.expanduser(args.snapshot_file) if args.snapshot_file else
+                            snapshot_file('check-dates', os.path.abspath(source_root),
+                                          args.exclude, args.include, args.ignore_file))
+
+    cache = open_cache(args.no_cache, args.cache)
+    try:
+        move_files(source_root,
+                   args.exclude, args.include, args.verbose, cache,
+                   args.verify_checksums, args.workers, args.process_pool,
+                   args.report, args.report_format, args.ignore_file, snapshot)
+    finally:
+        if cache is not None:
+            cache.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,116 @@
+"""
+=============================================================================
+File: checksums.py
+Description: Copy a file while hashing it in the same read, optionally check
+the copy by reading it back from disk, and keep a manifest of the hashes in
+each date folder. A manifest is in the format written by sha256sum/b2sum so
+it can also be checked with those, eg 'b2sum -c .checksums.blake2b'.
+Author: Praful https://github.com/Praful/fetch-photos
+Licence: GPL v3
+=============================================================================
+"""
+import hashlib
+import os
+import shutil
+
+# python -m pip install xxhash (optional; a faster, non-cryptographic hash)
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+CHECKSUM_BLAKE2B = 'blake2b'
+CHECKSUM_SHA256 = 'sha256'
+CHECKSUM_XXH128 = 'xxh128'
+CHECKSUM_ALGORITHMS = (CHECKSUM_BLAKE2B, CHECKSUM_SHA256) + \
+    ((CHECKSUM_XXH128,) if xxhash is not None else ())
+
+MANIFEST_PREFIX = '.checksums.'
+
+READ_CHUNK = 1024 * 1024
+
+
+class ChecksumMismatch(Exception):
+    pass
+
+
+def new_hash(algorithm):
+    if algorithm == CHECKSUM_XXH128:
+        return xxhash.xxh3_128()
+    return hashlib.new(algorithm)
+
+
+def drop_from_cache(fd):
+    """
+    Ask the OS to forget its cached copy of a file so the next read comes
+    from the disk.
+    """
+    if hasattr(os, 'posix_fadvise'):
+        os.fsync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+def file_checksum(filepath, algorithm, from_disk=False):
+    h = new_hash(algorithm)
+    with open(filepath, 'rb') as f:
+        if from_disk:
+            drop_from_cache(f.fileno())
+        while chunk := f.read(READ_CHUNK):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def copy_with_checksum(src, dst, algorithm, verify=False):
+    """
+    Copy src to dst, hashing the data as it's copied, and copy timestamps and
+    permissions as shutil.copy2 does. Returns the hex digest. With verify, dst
+    is read back (from the disk, not the page cache) and a ChecksumMismatch
+    raised, after removing dst, if it differs.
+    """
+    h = new_hash(algorithm)
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        while chunk := fsrc.read(READ_CHUNK):
+            h.update(chunk)
+            fdst.write(chunk)
+    shutil.copystat(src, dst)
+    digest = h.hexdigest()
+
+    if verify:
+        copied = file_checksum(dst, algorithm, from_disk=True)
+        if copied != digest:
+            os.remove(dst)
+            raise ChecksumMismatch(f'{dst}: copy has {algorithm} {copied}, source {digest}')
+
+    return digest
+
+
+def manifest_path(folder, algorithm):
+    return os.path.join(folder, MANIFEST_PREFIX + algorithm)
+
+
+def append_manifest(folder, algorithm, filename, digest):
+    with open(manifest_path(folder, algorithm), 'a', encoding='utf-8') as f:
+        f.write(f'{digest}  {filename}\n')
+
+
+def read_manifests(folder):
+    """
+    Return {filename: (algorithm, digest)} from all the manifests in folder.
+    Later lines win if a file appears more than once.
+    """
+    result = {}
+    try:
+        names = [name for name in os.listdir(folder) if name.startswith(MANIFEST_PREFIX)]
+    except OSError:
+        return result
+
+    for name in sorted(names):
+        algorithm = name[len(MANIFEST_PREFIX):]
+        if algorithm not in CHECKSUM_ALGORITHMS:
+            continue
+        with open(os.path.join(folder, name), encoding='utf-8') as f:
+            for line in f:
+                digest, _, filename = line.rstrip('\n').partition('  ')
+                if filename:
+                    result[filename] = (algorithm, digest)
+    return result
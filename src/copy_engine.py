@@ -0,0 +1,205 @@
+"""
+=============================================================================
+File: copy_engine.py
+Description: Copy files without moving the data through Python where the
+operating system can do it. In order of preference: a reflink (FICLONE), so
+the copy shares the source's blocks on btrfs/XFS; os.copy_file_range, which
+the kernel or file server does itself; os.sendfile; then shutil.copy2.
+Optionally hard links instead of copying. Timestamps and permissions are
+copied as shutil.copy2 does.
+Author: Praful https://github.com/Praful/fetch-photos
+Licence: GPL v3
+=============================================================================
+"""
+import errno
+import os
+import shutil
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+COPY_AUTO = 'auto'
+COPY_REFLINK = 'reflink'
+COPY_RANGE = 'copy-range'
+COPY_SENDFILE = 'sendfile'
+COPY_PLAIN = 'copy2'
+COPY_LINK = 'link'
+COPY_METHODS = (COPY_AUTO, COPY_REFLINK, COPY_RANGE, COPY_SENDFILE, COPY_PLAIN, COPY_LINK)
+
+# from linux/fs.h
+FICLONE = 0x40049409
+
+# errors that mean "this method isn't available here", rather than a failure
+# of the copy itself
+UNSUPPORTED_ERRORS = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EBADF,
+                      errno.EPERM, errno.ENOTTY, errno.EOPNOTSUPP,
+                      getattr(errno, 'ENOTSUP', errno.EOPNOTSUPP)}
+
+CHUNK = 64 * 1024 * 1024
+
+# copies are written to a hidden file next to the destination and renamed
+# into place once complete
+TEMP_PREFIX = '.'
+TEMP_SUFFIX = '.fetch-tmp'
+
+
+class MethodUnavailable(Exception):
+    pass
+
+
+def _unavailable(ex):
+    return isinstance(ex, OSError) and ex.errno in UNSUPPORTED_ERRORS
+
+
+def _reflink(src_fd, dst_fd, size):
+    if fcntl is None:
+        raise MethodUnavailable('no fcntl')
+    fcntl.ioctl(dst_fd, FICLONE, src_fd)
+
+
+def _copy_range(src_fd, dst_fd, size):
+    if not hasattr(os, 'copy_file_range'):
+        raise MethodUnavailable('no copy_file_range')
+    copied = 0
+    while copied < size:
+        n = os.copy_file_range(src_fd, dst_fd, min(CHUNK, size - copied))
+        if n == 0:
+            break
+        copied += n
+
+
+def _sendfile(src_fd, dst_fd, size):
+    copied = 0
+    while copied < size:
+        n = os.sendfile(dst_fd, src_fd, copied, min(CHUNK, size - copied))
+        if n == 0:
+            break
+        copied += n
+
+
+KERNEL_METHODS = {
+    COPY_REFLINK: _reflink,
+    COPY_RANGE: _copy_range,
+    COPY_SENDFILE: _sendfile,
+}
+
+
+def _kernel_copy(src, dst, methods):
+    """
+    Try each method in turn on an open pair of files. Returns the method that
+    worked or None if none were available.
+    """
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        src_fd, dst_fd = fsrc.fileno(), fdst.fileno()
+        size = os.fstat(src_fd).st_size
+        for method in methods:
+            try:
+                KERNEL_METHODS[method](src_fd, dst_fd, size)
+                return method
+            except (MethodUnavailable, OSError) as ex:
+                if not isinstance(ex, MethodUnavailable) and not _unavailable(ex):
+                    raise
+                # start again from an empty file for the next method
+                os.ftruncate(dst_fd, 0)
+                os.lseek(src_fd, 0, os.SEEK_SET)
+                os.lseek(dst_fd, 0, os.SEEK_SET)
+    return None
+
+
+def copy(src, dst, method=COPY_AUTO):
+    """
+    Copy src to the file dst, which is overwritten, with the given method.
+    COPY_AUTO tries the methods from fastest to slowest. COPY_LINK hard links
+    if possible and otherwise copies as COPY_AUTO. Returns the method used.
+    """
+    if method == COPY_LINK:
+        try:
+            os.link(src, dst)
+            return COPY_LINK
+        except OSError:
+            method = COPY_AUTO
+
+    if method == COPY_PLAIN:
+        shutil.copy2(src, dst)
+        return COPY_PLAIN
+
+    if method == COPY_AUTO:
+        methods = (COPY_REFLINK, COPY_RANGE, COPY_SENDFILE)
+    else:
+        methods = (method,)
+
+    used = _kernel_copy(src, dst, methods)
+    if used is None:
+        shutil.copy2(src, dst)
+        return COPY_PLAIN
+
+    shutil.copystat(src, dst)
+    return used
+
+
+def temp_path(dest_file):
+    folder, filename = os.path.split(dest_file)
+    return os.path.join(folder, TEMP_PREFIX + filename + TEMP_SUFFIX)
+
+
+def fsync_dir(folder):
+    try:
+        fd = os.open(folder, os.O_RDONLY)
+    except OSError:
+        return  # eg Windows, which can't open folders
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def commit(temp_file, dest_file):
+    """
+    Make temp_file durable and move it to dest_file, so dest_file either
+    doesn't exist or is complete even if the program or machine stops.
+    An existing file is never replaced, including, on a case-insensitive
+    file system, one whose name differs only in case: FileExistsError is
+    raised and temp_file left for the caller to remove.
+    """
+    fd = os.open(temp_file, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    try:
+        # unlike a rename, a link fails if dest_file exists
+        os.link(temp_file, dest_file)
+    except FileExistsError:
+        raise
+    except OSError as ex:
+        if not _unavailable(ex) and ex.errno != errno.EMLINK:
+            raise
+        # eg FAT and exFAT cards, which have no hard links
+        if os.path.lexists(dest_file):
+            raise FileExistsError(errno.EEXIST, 'destination exists', dest_file)
+        os.rename(temp_file, dest_file)
+    else:
+        os.remove(temp_file)
+    fsync_dir(os.path.dirname(dest_file))
+
+
+def atomic_copy(src, dst, copier=copy, *args):
+    """
+    Copy src to dst via a temporary file using copier(src, temp, *args),
+    which defaults to copy(). Returns copier's result.
+    """
+    temp_file = temp_path(dst)
+    try:
+        res = copier(src, temp_file, *args)
+        commit(temp_file, dst)
+    except BaseException:
+        try:
+            os.remove(temp_file)
+        except OSError:
+            pass
+        raise
+    return res
@@ -0,0 +1,94 @@
+"""
+=============================================================================
+File: destination_index.py
+Description: In-memory index of the date folders in a destination and the
+files in them. The destination is listed with os.scandir rather than probed
+with os.path.exists for every file, which matters on network mounts.
+Author: Praful https://github.com/Praful/fetch-photos
+Licence: GPL v3
+=============================================================================
+"""
+import os
+
+
+class DestinationIndex:
+    """
+    The folders under dest_root and, once a folder has been asked about, the
+    names of the files in it. Folders and files added during a run are
+    recorded here so the disk is never asked again. Not thread safe.
+
+    With defer, make_folder() only records new folders until
+    create_deferred() is called, so a plan can be made without changing the
+    destination.
+    """
+
+    def __init__(self, dest_root, defer=False):
+        self.dest_root = dest_root
+        self.folders = {}
+        self.defer = defer
+        self.deferred = []
+        try:
+            with os.scandir(dest_root) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        # listed on first use
+                        self.folders[entry.name] = None
+        except FileNotFoundError:
+            pass
+
+    def folder_path(self, folder):
+        return os.path.join(self.dest_root, folder)
+
+    def files(self, folder):
+        """
+        Return the set of file names in folder (empty if it doesn't exist).
+        """
+        if folder not in self.folders:
+            return set()
+
+        names = self.folders[folder]
+        if names is None:
+            with os.scandir(self.folder_path(folder)) as entries:
+                names = {entry.name for entry in entries}
+            self.folders[folder] = names
+        return names
+
+    def exists(self, folder, filename):
+        return filename in self.files(folder)
+
+    def add(self, folder, filename):
+        """
+        Record filename as being in folder; make_folder must be called first.
+        """
+        self.files(folder).add(filename)
+
+    def unique_name(self, folder, filename):
+        """
+        Return filename with a numbered suffix, eg DSC01234_1.JPG, that isn't
+        already used in folder.
+        """
+        stem, ext = os.path.splitext(filename)
+        n = 1
+        while self.exists(folder, f'{stem}_{n}{ext}'):
+            n += 1
+        return f'{stem}_{n}{ext}'
+
+    def discard(self, folder, filename):
+        if self.folders.get(folder):
+            self.folders[folder].discard(filename)
+
+    def make_folder(self, folder):
+        """
+        Create folder if it isn't already known to exist.
+        """
+        if folder not in self.folders:
+            if self.defer:
+                self.deferred.append(folder)
+            else:
+                os.makedirs(self.folder_path(folder), exist_ok=True)
+            self.folders[folder] = set()
+
+    def create_deferred(self):
+        for folder in self.deferred:
+            os.makedirs(self.folder_path(folder), exist_ok=True)
+        self.deferred = []
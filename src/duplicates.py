@@ -0,0 +1,115 @@
+"""
+=============================================================================
+File: duplicates.py
+Description: Find files whose content is already in the destination, whatever
+they're called. Files are compared by size first, then by a hash of their
+first and last blocks and only then by a hash of the whole file, so most
+files are never read in full.
+Author: Praful https://github.com/Praful/fetch-photos
+Licence: GPL v3
+=============================================================================
+"""
+import hashlib
+import os
+import threading
+from collections import defaultdict
+
+from file_walker import walk_files
+
+# what to do with a file whose content is already in the destination
+DEDUP_SKIP = 'skip'      # don't copy it
+DEDUP_LINK = 'link'      # hard link it into its date folder
+DEDUP_RENAME = 'rename'  # don't copy it; copy files that only share a name under a new name
+DEDUP_ACTIONS = (DEDUP_SKIP, DEDUP_LINK, DEDUP_RENAME)
+
+PARTIAL_BLOCK = 64 * 1024
+READ_CHUNK = 1024 * 1024
+
+PARTIAL = 'partial'
+FULL = 'full'
+
+
+def partial_hash(filepath, size):
+    h = hashlib.blake2b(str(size).encode())
+    with open(filepath, 'rb') as f:
+        h.update(f.read(PARTIAL_BLOCK))
+        if size > 2 * PARTIAL_BLOCK:
+            f.seek(-PARTIAL_BLOCK, os.SEEK_END)
+            h.update(f.read(PARTIAL_BLOCK))
+        elif size > PARTIAL_BLOCK:
+            h.update(f.read())
+    return h.digest()
+
+
+def full_hash(filepath):
+    h = hashlib.blake2b()
+    with open(filepath, 'rb') as f:
+        while chunk := f.read(READ_CHUNK):
+            h.update(chunk)
+    return h.digest()
+
+
+class DuplicateIndex:
+    """
+    The files in a destination grouped by size. Hashes are worked out when
+    first needed and remembered. Lookups may be made from several threads so
+    the hashing is spread over them; add and remove should only be called
+    from one thread.
+    """
+
+    def __init__(self, dest_root):
+        # size -> {dest path: path to read the content from}. These only differ
+        # for files claimed during this run whose copy may not be finished.
+        self.by_size = defaultdict(dict)
+        self.hashes = {}
+        self.lock = threading.Lock()
+        if os.path.isdir(dest_root):
+            for entry in walk_files(dest_root):
+                self.by_size[entry.stat().st_size][entry.path] = entry.path
+
+    def _hash(self, filepath, size, kind):
+        key = (filepath, kind)
+        with self.lock:
+            digest = self.hashes.get(key)
+        if digest is None:
+            digest = partial_hash(filepath, size) if kind == PARTIAL else full_hash(filepath)
+            with self.lock:
+                self.hashes[key] = digest
+        return digest
+
+    def find(self, filepath, size):
+        """
+        Return the destination path of a file with the same content as
+        filepath, or None.
+        """
+        with self.lock:
+            candidates = list(self.by_size.get(size, {}).items())
+        if not candidates:
+            return None
+
+        try:
+            source_partial = self._hash(filepath, size, PARTIAL)
+            matches = [(dest, content) for dest, content in candidates
+                       if self._hash(content, size, PARTIAL) == source_partial]
+            if not matches:
+                return None
+
+            source_full = self._hash(filepath, size, FULL)
+            for dest, content in matches:
+                if self._hash(content, size, FULL) == source_full:
+                    return dest
+        except OSError as ex:
+            print(f'====> {filepath}: cannot check for duplicates: {ex}')
+        return None
+
+    def add(self, dest_file, size, content_path):
+        """
+        Record that dest_file has (or is about to have) the content of
+        content_path.
+        """
+        with self.lock:
+            self.by_size[size][dest_file] = content_path
+
+    def remove(self, dest_file, size):
+        with self.lock:
+            self.by_size[size].pop(dest_file, None)
@@ -0,0 +1,42 @@
+"""
+=============================================================================
+File: executors.py
+Description: Helpers for the worker pools shared by the scripts: a stand-in
+for a pool that runs tasks inline when no workers are asked for, so there's
+only one code path, and the number of tasks to keep in flight per worker.
+Author: Praful https://github.com/Praful/fetch-photos
+Licence: GPL v3
+=============================================================================
+"""
+from concurrent.futures import Future
+
+# files allowed in flight per worker between pipeline stages
+QUEUE_DEPTH_PER_WORKER = 4
+
+
+class InlineExecutor:
+    """
+    Runs each task as soon as it's submitted. Used in place of a pool when no
+    workers are asked for so there's only one code path.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as ex:
+            future.set_exception(ex)
+        return future
+
+    def shutdown(self, wait=True):
+        pass
+
+
+def make_executor(executor_class, workers):
+    return executor_class(max_workers=workers) if workers else InlineExecutor()
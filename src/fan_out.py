@@ -0,0 +1,145 @@
+"""
+=============================================================================
+File: fan_out.py
+Description: Copy a file to several destinations, eg the library and a
+backup disk, reading it once. Each chunk read is queued for every
+destination and written by a thread per destination, so a slow memory card
+is only read once however many copies are made, and the disks are written
+to at the same time. Each copy is made under a temporary name and renamed
+into place when complete, as copy_engine.atomic_copy() does. A destination
+that fails is dropped and the others carried on with.
+Author: Praful https://github.com/Praful/fetch-photos
+Licence: GPL v3
+=============================================================================
+"""
+import os
+import queue
+import shutil
+import threading
+
+from checksums import READ_CHUNK, ChecksumMismatch, file_checksum, new_hash
+from copy_engine import commit, temp_path
+
+# reported as the copy method when no checksum is asked for
+COPY_FAN_OUT = 'fan-out'
+
+# chunks read ahead of the slowest destination
+WRITE_QUEUE_CHUNKS = 8
+
+
+def remove_quietly(filepath):
+    try:
+        os.remove(filepath)
+    except OSError:
+        pass
+
+
+def _write_chunks(f, temp, chunks, results, i):
+    """
+    Writer thread: write each chunk taken from the queue chunks to f, the
+    open file temp, until None. An error is put in results[i], temp is
+    removed and the remaining chunks thrown away, so the reader is never
+    held up by a destination that has failed.
+    """
+    while True:
+        chunk = chunks.get()
+        if chunk is None:
+            break
+        if results[i] is None:
+            try:
+                f.write(chunk)
+            except OSError as ex:
+                results[i] = ex
+    try:
+        f.close()
+    except OSError as ex:
+        if results[i] is None:
+            results[i] = ex
+    if results[i] is not None:
+        remove_quietly(temp)
+
+
+def write_to_all(fsrc, temps, algorithm=None, first=b''):
+    """
+    Write first and then the rest of fsrc, an open file, to each file in
+    temps, hashing the data with algorithm if given. Each file is written by
+    its own thread from a queue of chunks, so a slow destination only holds
+    up the others once its queue is full. Returns (results, digest): results
+    has an entry per temp, None if it was written or the exception that
+    stopped it, in which case it's removed; digest is the hex digest, or
+    COPY_FAN_OUT without algorithm. An error reading fsrc is raised, after
+    removing every file.
+    """
+    results = [None] * len(temps)
+    writers = []
+    try:
+        for i, temp in enumerate(temps):
+            try:
+                f = open(temp, 'wb')
+            except OSError as ex:
+                results[i] = ex
+                continue
+            chunks = queue.Queue(WRITE_QUEUE_CHUNKS)
+            writer = threading.Thread(target=_write_chunks, args=(f, temp, chunks, results, i),
+                                      daemon=True)
+            writer.start()
+            writers.append((writer, chunks))
+
+        h = new_hash(algorithm) if algorithm is not None else None
+        chunk = first or fsrc.read(READ_CHUNK)
+        # stop reading if every destination has failed
+        while chunk and any(result is None for result in results):
+            if h is not None:
+                h.update(chunk)
+            for _, chunks in writers:
+                chunks.put(chunk)
+            chunk = fsrc.read(READ_CHUNK)
+    except BaseException:
+        for i in range(len(temps)):
+            if results[i] is None:
+                results[i] = OSError('not copied')
+        raise
+    finally:
+        for writer, chunks in writers:
+            chunks.put(None)
+        for writer, _ in writers:
+            writer.join()
+    return results, h.hexdigest() if h is not None else COPY_FAN_OUT
+
+
+def copy_to_all(src, dsts, algorithm=None, verify=False):
+    """
+    Copy src to each file in dsts, hashing it with algorithm if given, and
+    copy timestamps and permissions as shutil.copy2 does. Returns a list
+    with an entry per dst: the hex digest (COPY_FAN_OUT without algorithm),
+    or the exception that stopped that copy. With verify, each copy is read
+    back from disk and checked against the digest. An error reading src is
+    raised, after removing every unfinished copy.
+    """
+    temps = [temp_path(dst) for dst in dsts]
+    with open(src, 'rb') as fsrc:
+        results, digest = write_to_all(fsrc, temps, algorithm)
+
+    for i, result in enumerate(results):
+        if result is not None:
+            continue
+        try:
+            shutil.copystat(src, temps[i])
+            if verify and algorithm is not None:
+                verify_copy(temps[i], dsts[i], algorithm, digest)
+            commit(temps[i], dsts[i])
+            results[i] = digest
+        except (OSError, ChecksumMismatch) as ex:
+            results[i] = ex
+            remove_quietly(temps[i])
+    return results
+
+
+def verify_copy(temp, dst, algorithm, digest):
+    """
+    Raise ChecksumMismatch unless temp, the copy being made of dst, read
+    back from disk has the given digest.
+    """
+    copied = file_checksum(temp, algorithm, from_disk=True)
+    if copied != digest:
+        raise ChecksumMismatch(f'{dst}: copy has {algorithm} {copied}, source {digest}')
@@ -14,62 +14,49 @@ Author: Praful https://github.com/Praful/fetch-photos
 Licence: GPL v3
 =============================================================================
 """
-import glob
+import io
 import os
 import time
 import datetime
-import shutil
 import argparse
-import re
+import sys
+from collections import defaultdict, deque, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
 
 # python -m pip install colorama
 from colorama import init, Fore, Style
 
-# python -m pip install Pillow
-from PIL import Image
-from PIL.ExifTags import TAGS
+from photo_metadata import (MAX_HEADER_BYTES, SOURCE_CTIME, SOURCE_MTIME, FileDates,
+                            embedded_dates, file_dates, filestamp_to_utc_date_str)
+from isobmff import is_video
+from metadata_cache import open_cache
+from path_filter import PathFilter
+from file_walker import group_by_stem, grouped, walk_files, walk_roots
+from io_scheduler import DeviceScheduler, device_of
+from executors import QUEUE_DEPTH_PER_WORKER, make_executor
+from metrics import Metrics
+from plan import ACTION_COPY, ACTION_LINK, ORDER_WALK, ORDERS, Plan, PlannedCopy
+from destination_index import DestinationIndex
+import copy_engine
+from copy_engine import (COPY_AUTO, COPY_LINK, COPY_METHODS, COPY_REFLINK, TEMP_PREFIX,
+                         TEMP_SUFFIX, atomic_copy, commit, temp_path)
+from fan_out import copy_to_all, remove_quietly, verify_copy, write_to_all
+from journal import Journal
+from checksums import (CHECKSUM_ALGORITHMS, ChecksumMismatch, append_manifest,
+                       copy_with_checksum)
+from duplicates import DuplicateIndex, DEDUP_ACTIONS, DEDUP_LINK, DEDUP_RENAME
+from watcher import WATCH_AUTO, WATCH_METHODS, Watcher
+from snapshot import Snapshot, snapshot_file
+from archive_source import ARCHIVE_ERRORS, HEADER_BYTES, is_archive, iter_members
+from thumbnails import THUMBNAIL_SIZE, Thumbnailer
 
-# python -m pip install Pillow-heif (this provides support for heic files)
-from pillow_heif import register_heif_opener
-register_heif_opener()
+# a folder being copied to and what's kept about it during a run: its
+# DestinationIndex, Journal and DuplicateIndex (either may be None), its
+# st_dev and its Metrics
+Destination = namedtuple('Destination', 'root index journal duplicates device stats')
 
-EXIF_DATATIME = 306
-EXIF_DATATIME_ORIGINAL = 36867
-EXIF_OFFSET = 34665
-
-
-def exif_date_original(filepath):
-    try:
-        im = Image.open(filepath)
-        exif = im.getexif()
-        ifd_data = exif.get_ifd(EXIF_OFFSET)
-
-        if ifd_data is not None:
-            date = ifd_data.get(EXIF_DATATIME_ORIGINAL)
-            if date is not None:
-                return (date.split(' ')[0]).replace(":", "-")
-    except Exception as ex:
-        #  print(f'Info: {filepath}: no exif date taken:', ex)
-        None
-
-    return None
-    #  print('Error getting date taken: ', ex, filepath)
-
-
-def exif_date(filepath):
-    try:
-        im = Image.open(filepath)
-        exif = im.getexif()
-        if exif is not None:
-            date = exif.get(EXIF_DATATIME)
-            if date is not None:
-                return (date.split(' ')[0]).replace(":", "-")
-    except Exception as ex:
-        #  print(f'Info: {filepath}: no exif date:', ex)
-        None
-
-    return None
-    #  print('Error getting date taken: ', ex, filepath)
+# what a Journal keys an archive member by, in place of its os.stat_result
+MemberStat = namedtuple('MemberStat', 'st_size st_mtime_ns')
 
 
 def filestamp_to_local_date_str(d):
@@ -78,12 +65,6 @@ def filestamp_to_local_date_str(d):
     return "%d-%02d-%02d" % (year, month, day)
 
 
-def filestamp_to_utc_date_str(d):
-    year, month, day, hour, minute, second = time.gmtime(d)[
-        :-3]
-    return "%d-%02d-%02d" % (year, month, day)
-
-
 def setup_command_line():
     """
     Define command line switches
@@ -91,116 +72,1011 @@ def setup_command_line():
     cmdline = argparse.ArgumentParser(
         prog='fetch-photos.py', description='Fetch photos and put them into date folders')
 
-    cmdline.add_argument('--from', dest='source', type=str, required=True,
-                         help='Folder to copy from')
+    cmdline.add_argument('--from', dest='source', type=str, required=True, action='append',
+                         help='Folder to copy from; repeat to copy from several, eg one '
+                         'per memory card. A zip or tar archive, eg a Google Takeout '
+                         'export, is read without extracting it')
+
+    cmdline.add_argument('--to', dest='dest', type=str, required=True, action='append',
+                         help='Folder to copy to; repeat to copy to several, eg a library '
+                         'and a backup, reading each file once')
 
-    cmdline.add_argument('--to', dest='dest', type=str, required=True,
-                         help='Folder to copy to')
+    cmdline.add_argument('--exclude', dest='exclude', type=str, action='append',
+                         help='Exclude paths containing this string, or matching glob:PATTERN '
+                         'or re:PATTERN; may be repeated')
 
-    cmdline.add_argument('--exclude', dest='exclude', type=str, required=False,
-                         help='Exclude paths containing this string')
+    cmdline.add_argument('--include', dest='include', type=str, action='append',
+                         help='Include paths containing this regex, or matching glob:PATTERN; '
+                         'overrides --exclude; may be repeated')
 
-    cmdline.add_argument('--include', dest='include', type=str, required=False,
-                         help='Include paths containing this regex; overrides --exclude')
+
+    cmdline.add_argument('--ignore-file', dest='ignore_file', type=str, required=False,
+                         help='File of glob patterns to exclude, one per line; lines '
+                         'starting with ! are patterns to include')
 
     cmdline.add_argument('--verbose', action=argparse.BooleanOptionalAction,
                          default=False, help='Provides verbose output')
 
-    return cmdline
+    cmdline.add_argument('--workers', dest='workers', type=int, default=0,
+                         help='Read dates using this many workers, overlapped with copying')
+
+    cmdline.add_argument('--copy-workers', dest='copy_workers', type=int, default=0,
+                         help='Copy using this many threads, overlapped with reading dates')
+
+    cmdline.add_argument('--reads-per-device', dest='reads_per_device', type=int,
+                         help='Copy at most this many files at once from each source device '
+                         '(default: --copy-workers). Below --copy-workers, it limits the '
+                         'copies from a single card; 1 suits most SD card readers')
+
+    cmdline.add_argument('--writes-per-device', dest='writes_per_device', type=int,
+                         help='Copy at most this many files at once to each destination device '
+                         '(default: --copy-workers). Below --copy-workers, it limits the '
+                         'copies to a single disk')
+
+    cmdline.add_argument('--process-pool', action=argparse.BooleanOptionalAction,
+                         default=False, help='Read dates in processes rather than threads')
+
+    cmdline.add_argument('--dedup', dest='dedup', choices=DEDUP_ACTIONS, required=False,
+                         help='Check file contents for duplicates already in the destination: '
+                         'skip them, link them, or skip them and copy different files '
+                         'with the same name under a new name')
+
+    cmdline.add_argument('--copy-method', dest='copy_method', choices=COPY_METHODS,
+                         default=COPY_AUTO,
+                         help='How to copy: auto tries reflink, copy-range and sendfile before copy2')
 
+    cmdline.add_argument('--link', dest='copy_method', action='store_const', const=COPY_LINK,
+                         help='Hard link files into the destination instead of copying '
+                         'when on the same file system')
+
+    cmdline.add_argument('--checksum', dest='checksum', choices=CHECKSUM_ALGORITHMS,
+                         required=False,
+                         help='Hash files while copying them and record the hashes in a '
+                         'manifest in each date folder')
+
+    cmdline.add_argument('--verify', action=argparse.BooleanOptionalAction, default=False,
+                         help='With --checksum, read each copy back from disk and check its hash')
+
+    cmdline.add_argument('--journal', action=argparse.BooleanOptionalAction, default=True,
+                         help='Record copies in a journal in the destination so an '
+                         'interrupted run can be resumed')
+
+    cmdline.add_argument('--order', dest='order', choices=ORDERS, default=ORDER_WALK,
+                         help='Order to copy in: as found, or planned first and then by '
+                         'inode or by position on disk (extent), to save seeking')
+
+    cmdline.add_argument('--plan', dest='plan', type=str, required=False,
+                         help='Plan all the copies before making any, and write the plan '
+                         'to this file (JSON lines)')
+
+    cmdline.add_argument('--plan-only', action='store_true', default=False,
+                         help="Plan but don't copy anything (a dry run)")
+
+    cmdline.add_argument('--watch', action='store_true', default=False,
+                         help='Copy what is there, then keep running and copy new files '
+                         'as they appear')
+
+    cmdline.add_argument('--settle', dest='settle', type=float, default=2.0,
+                         help='With --watch, seconds a new file must stay unchanged before '
+                         'it is copied')
+
+    cmdline.add_argument('--watch-method', dest='watch_method', choices=WATCH_METHODS,
+                         default=WATCH_AUTO,
+                         help='How to watch: auto uses inotify where available, else polls')
+
+    cmdline.add_argument('--poll-interval', dest='poll_interval', type=float, default=10,
+                         help='Seconds between listings of the source when polling')
+
+    cmdline.add_argument('--snapshot', action=argparse.BooleanOptionalAction, default=False,
+                         help='Remember the source folders and on the next run only look in '
+                         'those that have changed; files changed in place are missed')
+
+    cmdline.add_argument('--snapshot-file', dest='snapshot_file', type=str, required=False,
+                         help='File to keep the --snapshot in (default: one per source, '
+                         'destination and filters in the cache folder)')
+
+    cmdline.add_argument('--group', action=argparse.BooleanOptionalAction, default=True,
+                         help='Date files with the same name but a different extension, eg '
+                         'RAW+JPEG pairs and .xmp sidecars, together from the photo and put '
+                         'them in the same folder (default: on)')
+
+    cmdline.add_argument('--thumbnails', dest='thumbnails', type=str, required=False,
+                         help='Make a thumbnail of each photo copied, in the same date '
+                         'folders under this folder')
+
+    cmdline.add_argument('--thumbnail-size', dest='thumbnail_size', type=int,
+                         default=THUMBNAIL_SIZE,
+                         help=f'Largest side of a thumbnail in pixels (default: {THUMBNAIL_SIZE})')
+
+    cmdline.add_argument('--thumbnail-workers', dest='thumbnail_workers', type=int,
+                         default=os.cpu_count() or 1,
+                         help='Processes making thumbnails (default: one per CPU)')
+
+    cmdline.add_argument('--progress', action=argparse.BooleanOptionalAction, default=None,
+                         help='Show a progress line (default: when not --verbose and '
+                         'writing to a terminal)')
+
+    cmdline.add_argument('--metrics-json', dest='metrics_json', type=str, required=False,
+                         help='Write counts, throughput and stage timings to this JSON file')
+
+    cmdline.add_argument('--prometheus', dest='prometheus', type=str, required=False,
+                         help='Write the same metrics to this file for the node_exporter '
+                         'textfile collector')
+
+    cmdline.add_argument('--cache', dest='cache', type=str, required=False,
+                         help='File to cache photo dates in between runs')
+
+    cmdline.add_argument('--no-cache', action='store_true',
+                         default=False, help="Don't use or update the photo date cache")
+
+    return cmdline
 
-def must_include(filepath, regex):
-    return re.search(rf'{regex}', filepath) is not None
 
 def is_photo(filepath):
     return filepath.lower().endswith(('.jpg', '.jpeg', '.png', '.heic'))
 
-def get_creation_date(filepath):
-    # eg may be .mp4
-    if not is_photo(filepath):
-        creation_timestamp = os.path.getctime(filepath)
-        return filestamp_to_utc_date_str(creation_timestamp)
+def has_embedded_date(filepath):
+    return is_photo(filepath) or is_video(filepath)
 
-    date_original_exif = exif_date_original(filepath)
-    if date_original_exif is not None:
-        return date_original_exif
+def dating_entry(candidates):
+    """
+    The (entry, stat) to date a group of files from: a photo, as it has the
+    date taken, then a video, then the first.
+    """
+    for wanted in (is_photo, is_video):
+        for entry, st in candidates:
+            if wanted(entry.path):
+                return entry, st
+    return candidates[0]
 
-    date_exif = exif_date(filepath)
-    if date_exif is not None:
-        return date_exif
-    else:
+def creation_date_from(filepath, dates):
+    if dates.source in (SOURCE_CTIME, SOURCE_MTIME) and is_photo(filepath):
         # changed 4/4/2025 - don't use file creation date since we should always
         # changed 7/1/2026 - sometimes exif data is missing; use creation date otherwise
         # file won't be copied.
-        #  return None
-        creation_timestamp = os.path.getctime(filepath)
-        result = filestamp_to_utc_date_str(creation_timestamp)
-        print(f'====> {filepath}: no exif data found. Using creation date {result}')
-        return result
+        print(f'====> {filepath}: no exif data found. Using creation date {dates.date}')
+    return dates.date
+
 
 def print_color(color, *text):
     print(color, *text, Style.RESET_ALL)
 
-def move_files(source_root, dest_root, exclude, include_regex, verbose):
-    file_count = files_copied = files_exist = file_errors = files_excluded = file_no_date = 0
 
-    for filepath in glob.iglob(source_root + '**/**', recursive=True):
+def claim_dest(index, creation_date, filename):
+    """
+    Return (dest_file, claimed) where claimed is False if dest_file is already
+    in the destination. Otherwise the date folder is created if needed (or
+    recorded, for a plan) and the file is recorded in the index so later
+    files with the same name are skipped.
+    """
+    dest_file = os.path.join(index.folder_path(creation_date), filename)
+    if index.exists(creation_date, filename):
+        return dest_file, False
 
-        if os.path.isfile(filepath):
-            file_count += 1
+    index.make_folder(creation_date)
+    index.add(creation_date, filename)
+    return dest_file, True
 
-            # TODO accept more than one string to exclude and include
 
-            if exclude is not None and not must_include(filepath, include_regex):
-                if exclude in filepath:
-                    if verbose:
-                        print_color(Fore.RED, 'Excluding', filepath)
-                    files_excluded += 1
+def copy_file(filepath, dest_file, copy_method=COPY_AUTO, checksum=None, verify=False):
+    """
+    Returns (status, dest_file, result) where status is 'copied', 'exists'
+    or 'error'. result is the error, the checksum if checksum names an
+    algorithm (the copy is then made by streaming the data through the
+    hash), or else the copy method used. The copy is made under a temporary
+    name and moved into place when complete so dest_file is never left
+    partly written, nor replaced if it turns out to exist, eg as IMG_1.JPG
+    when img_1.jpg is copied to a case-insensitive card.
+    """
+    try:
+        if checksum is not None:
+            res = atomic_copy(filepath, dest_file, copy_with_checksum, checksum, verify)
+        else:
+            res = atomic_copy(filepath, dest_file, copy_engine.copy, copy_method)
+    except FileExistsError:
+        return 'exists', dest_file, None
+    except (OSError, ChecksumMismatch) as ex:
+        return 'error', dest_file, ex
+    return 'copied', dest_file, res
+
+
+def link_file(filepath, duplicate, dest_file, copy_method=COPY_AUTO, checksum=None,
+              verify=False):
+    """
+    Hard link dest_file to duplicate, a destination file with the same
+    content as filepath. Copies filepath if a link can't be made, eg because
+    they're on different file systems.
+    """
+    try:
+        os.link(duplicate, dest_file)
+    except OSError:
+        return copy_file(filepath, dest_file, copy_method, checksum, verify)
+    return 'linked', dest_file, duplicate
+
+
+def prepare_file(filepath, st, read_exif, dates=None, duplicates=None):
+    """
+    Worker task: read the file's dates unless they're already known and, when
+    looking for duplicates, hash it against the files of the same size in
+    each destination's DuplicateIndex, so the hashes are ready when the main
+    thread checks. duplicates has a (DuplicateIndex, root) per destination;
+    with a root, a file whose name is already in its date folder there isn't
+    hashed since it will be skipped as existing. Returns the dates and the
+    seconds taken to read them, or None if they were known.
+    """
+    seconds = None
+    if dates is None:
+        start = time.perf_counter()
+        dates = file_dates(filepath, st, read_exif)
+        seconds = time.perf_counter() - start
+    filename = os.path.basename(filepath)
+    for index, root in duplicates or ():
+        if root is None or dates.date is None or \
+                not os.path.exists(os.path.join(root, dates.date, filename)):
+            index.find(filepath, st.st_size)
+    return dates, seconds
+
+
+def report_copy(stats, filepath, creation_date, status, dest_file, res, verbose, size=0):
+    if verbose:
+        print(filepath, dest_file)
+
+    if status == 'copied':
+        if verbose:
+            print('Copying', filepath,
+                  f'====> done: {dest_file} (created on {creation_date}, {res})')
+        stats['copied'] += 1
+        stats.add_copied(size)
+    elif status == 'linked':
+        if verbose:
+            print('Linking', filepath, f'====> done: {dest_file} (same as {res})')
+        stats['linked'] += 1
+    elif status == 'exists':
+        if verbose:
+            print('====> Skipping: file already exists in destination folder')
+        stats['exists'] += 1
+    elif status == 'duplicate':
+        if verbose:
+            print(f'====> Skipping: same content as {res}')
+        stats['duplicates'] += 1
+    else:
+        print_color(Fore.RED, 'Copying', filepath,
+                    f'====> FAILED: {dest_file} ({res})')
+        stats['errors'] += 1
+
+
+def report_no_date(all_stats, filepath):
+    print_color(Fore.RED, f'====> {filepath}: skipping - no creation date found')
+    for stats in all_stats:
+        stats['no_date'] += 1
+
+
+def print_summary(stats, dedup=None):
+    print(
+        f'Total files: {stats["files"]}\nCopied: {stats["copied"]}\nSkipped: {stats["exists"]}\nExcluded: {stats["excluded"]}\nNo date: {stats["no_date"]}\nErrors: {stats["errors"]}')
+    if dedup is not None:
+        print(f'Duplicates: {stats["duplicates"]}\nLinked: {stats["linked"]}')
+    if stats['planned']:
+        print(f'Planned: {stats["planned"]}')
+
+
+def copy_to_dests(filepath, dest_files, checksum=None, verify=False):
+    """
+    Copy filepath to each of dest_files, reading it once. Returns a list of
+    (status, dest_file, result), as copy_file() does, per dest_file.
+    """
+    try:
+        results = copy_to_all(filepath, dest_files, checksum, verify)
+    except (OSError, ChecksumMismatch) as ex:
+        return [('error', dest_file, ex) for dest_file in dest_files]
+    return [copy_status(dest_file, result) for dest_file, result in zip(dest_files, results)]
+
+
+def copy_status(dest_file, result):
+    if isinstance(result, FileExistsError):
+        return 'exists', dest_file, None
+    if isinstance(result, Exception):
+        return 'error', dest_file, result
+    return 'copied', dest_file, result
+
+
+def claim_member(dest, member, creation_date, verbose):
+    """
+    claim_dest() for an archive member, reporting why not if it's not to be
+    copied to dest. Returns the destination file or None.
+    """
+    try:
+        dest_file, claimed = claim_dest(dest.index, creation_date, member.name)
+    except OSError as ex:
+        report_copy(dest.stats, member.path, creation_date, 'error',
+                    os.path.join(dest.index.folder_path(creation_date), member.name), ex,
+                    verbose)
+        return None
+    if not claimed:
+        report_copy(dest.stats, member.path, creation_date, 'exists', dest_file, None, verbose)
+        return None
+    return dest_file
+
+
+def spooled_dates(member, temp):
+    """
+    The dates of a member written in full to temp, falling back to its time
+    in the archive.
+    """
+    dates = None
+    if has_embedded_date(member.name):
+        try:
+            with open(temp, 'rb') as f:
+                dates = embedded_dates(member.name, f)
+        except OSError:
+            pass
+    if dates is None:
+        dates = FileDates(filestamp_to_utc_date_str(member.mtime), SOURCE_MTIME, None, None)
+    return dates
+
+
+def ingest_member(member, f, dests, path_filter, checksum=None, verify=False, verbose=False,
+                  thumbnailer=None):
+    """
+    Copy one member of an archive, open as f, to each destination. See
+    ingest_archive().
+    """
+    stats = dests[0].stats
+    for dest in dests:
+        dest.stats['files'] += 1
+    if path_filter.excluded(member.path):
+        if verbose:
+            print_color(Fore.RED, 'Excluding', member.path)
+        for dest in dests:
+            dest.stats['excluded'] += 1
+        return
+
+    dates = None
+    header = b''
+    if has_embedded_date(member.name):
+        start = time.perf_counter()
+        try:
+            header = f.read(HEADER_BYTES)
+        except (OSError, *ARCHIVE_ERRORS) as ex:
+            for dest in dests:
+                report_copy(dest.stats, member.path, None, 'error', dest.root, ex, verbose)
+            return
+        dates = embedded_dates(member.name, io.BytesIO(header))
+        stats.observe('exif', time.perf_counter() - start)
+    else:
+        dates = FileDates(filestamp_to_utc_date_str(member.mtime), SOURCE_MTIME, None, None)
+
+    # (dest, dest_file, temporary file); dest_file is None until the member
+    # has been dated
+    targets = []
+    if dates is not None:
+        creation_date = creation_date_from(member.path, dates)
+        for dest in dests:
+            dest_file = claim_member(dest, member, creation_date, verbose)
+            if dest_file is not None:
+                targets.append((dest, dest_file, temp_path(dest_file)))
+    else:
+        creation_date = None
+        for dest in dests:
+            try:
+                os.makedirs(dest.root, exist_ok=True)
+            except OSError:
+                pass  # reported when the temporary file can't be made
+            targets.append((dest, None,
+                            os.path.join(dest.root, TEMP_PREFIX + member.name + TEMP_SUFFIX)))
+    if not targets:
+        return
+
+    # so an interrupted run's temporary files are removed by the next
+    member_st = MemberStat(member.size, int(member.mtime * 1e9))
+    for dest, dest_file, _ in targets:
+        if dest.journal is not None:
+            dest.journal.planned(member.path, member_st,
+                                 dest_file or os.path.join(dest.root, member.name))
+    ingest_copies(member, f, targets, stats, header, creation_date, checksum, verify,
+                  verbose, thumbnailer)
+    for dest, dest_file, _ in targets:
+        if dest.journal is not None:
+            dest.journal.completed(member.path, member_st,
+                                   dest_file or os.path.join(dest.root, member.name))
+
+
+def ingest_copies(member, f, targets, stats, header, creation_date, checksum, verify,
+                  verbose, thumbnailer):
+    """
+    Write header and the rest of member, open as f, to the temporary file of
+    each of targets and move them into their date folders. See
+    ingest_member().
+    """
+    try:
+        results, digest = stats.timed('copy', write_to_all, f, [temp for _, _, temp in targets],
+                                      checksum, header)
+    except (OSError, *ARCHIVE_ERRORS) as ex:
+        results = [ex] * len(targets)
+
+    if creation_date is None:
+        written = [temp for (_, _, temp), result in zip(targets, results) if result is None]
+        if written:
+            creation_date = creation_date_from(member.path, spooled_dates(member, written[0]))
+
+    for (dest, dest_file, temp), result in zip(targets, results):
+        claimed = dest_file is not None
+        if result is None and not claimed:
+            dest_file = claim_member(dest, member, creation_date, verbose)
+            if dest_file is None:
+                remove_quietly(temp)
+                continue
+            claimed = True
+        try:
+            if result is not None:
+                raise result
+            os.utime(temp, (member.mtime, member.mtime))
+            if verify and checksum is not None:
+                verify_copy(temp, dest_file, checksum, digest)
+            commit(temp, dest_file)
+        except FileExistsError:
+            remove_quietly(temp)
+            report_copy(dest.stats, member.path, creation_date, 'exists', dest_file, None,
+                        verbose)
+            continue
+        except (OSError, ChecksumMismatch, *ARCHIVE_ERRORS) as ex:
+            remove_quietly(temp)
+            if claimed:
+                dest.index.discard(creation_date, member.name)
+            report_copy(dest.stats, member.path, creation_date, 'error',
+                        dest_file or dest.root, ex, verbose)
+            continue
+        if checksum is not None:
+            append_manifest(dest.index.folder_path(creation_date), checksum, member.name,
+                            digest)
+        if thumbnailer is not None:
+            # from the first copy made, with the EXIF read for the date
+            thumbnailer.submit(dest_file, creation_date, member.name,
+                               header[:MAX_HEADER_BYTES] or None)
+            thumbnailer = None
+        report_copy(dest.stats, member.path, creation_date, 'copied', dest_file,
+                    digest if checksum is not None else 'from archive', verbose, member.size)
+
+
+def ingest_archive(archive, dests, path_filter, checksum=None, verify=False, verbose=False,
+                   thumbnailer=None):
+    """
+    Copy the files in archive, a zip or tar, into date folders in each of
+    dests without extracting it; see archive_source. Each member is read
+    once, in the order stored, however many destinations there are. A photo
+    or video dated from its first archive_source.HEADER_BYTES, and any other
+    file, which is dated by its time in the archive, is streamed straight
+    into its date folders. Other photos and videos are streamed into each
+    destination's root under a temporary name, dated from the whole file
+    (or its time in the archive) and then renamed into their date folders.
+
+    Either way a member only appears in the destination once complete, so a
+    rerun skips what was copied. The journal only records the temporary
+    files, so an interrupted run's are removed by the next. Members aren't
+    checked for duplicates.
+    """
+    try:
+        for member, f in iter_members(archive):
+            ingest_member(member, f, dests, path_filter, checksum, verify, verbose, thumbnailer)
+            dests[0].stats.tick()
+    except (OSError, *ARCHIVE_ERRORS) as ex:
+        print_color(Fore.RED, f'====> {archive}: cannot read archive: {ex}')
+        for dest in dests:
+            dest.stats['errors'] += 1
+
+
+def move_files(source_root, dest_root, exclude, include_regex, verbose,
+               workers=0, copy_workers=0, process_pool=False, cache=None,
+               dedup=None, copy_method=COPY_AUTO, checksum=None, verify=False,
+               use_journal=True, reads_per_device=None, writes_per_device=None,
+               progress=False, metrics_json=None, prometheus_file=None,
+               order=ORDER_WALK, plan_file=None, plan_only=False, ignore_file=None,
+               entries=None, dest_index=None, duplicate_index=None, snapshot=None,
+               thumbnailer=None, group=True):
+    """
+    Copy the files under source_root, a folder or a list of folders, into
+    date folders under dest_root, a folder or a list of folders.
+
+    The work is done in stages: this thread walks the source and hands files
+    to a pool that reads their dates, which in turn feed a pool that copies
+    them. Each stage has a bounded number of files in flight. With no
+    workers, each stage runs inline. Results are gathered here, in order, so
+    the counts stay exact. The cache and the destination index are only used
+    from this thread; cache hits skip the date pool.
+
+    With dedup set, files whose content is already in the destination aren't
+    copied again; see duplicates.DEDUP_ACTIONS. copy_method is one of
+    copy_engine.COPY_METHODS.
+
+    With checksum set to one of checksums.CHECKSUM_ALGORITHMS, each file is
+    hashed as it's copied and the hash appended to its date folder's
+    manifest; verify also reads each copy back from disk to check it.
+
+    With use_journal, copies are recorded in a journal in dest_root so that
+    an interrupted run can be resumed; see journal.Journal.
+
+    Several source folders are walked together, a file from each in turn.
+    Copies are queued by source device and at most reads_per_device run at
+    once per source device and writes_per_device per destination device,
+    each copy_workers if None; see io_scheduler.DeviceScheduler. Throughput
+    is reported per device.
+
+    With several destinations, each file is dated once and then each
+    destination decides for itself whether the file exists there, is a
+    duplicate and so on, with its own index, journal and counts. The copies
+    of a file are made by one task that reads it once and writes it to them
+    all (fan_out.copy_to_all), unless they're links or reflinks, which don't
+    read it anyway. A destination that fails doesn't stop the others.
+
+    Counts, bytes copied and stage timings are kept in a metrics.Metrics
+    per destination; the first destination's is returned. progress shows a
+    progress line. The source is only walked once, as the files are needed,
+    so there's a total and an ETA once the walk has finished. metrics_json
+    and prometheus_file name files to write the metrics to at the end.
+
+    Copies are normally started as soon as their destination is decided.
+    With an order other than plan.ORDER_WALK, a plan_file or plan_only, every
+    file is planned first: dated, skipped or given a destination. The plan is
+    written to plan_file if given. Unless plan_only, the copies are then made
+    in the order given, provided the destination has room for them all.
+    plan_only changes nothing in the destination. Planning needs a single
+    destination.
+
+    exclude and include_regex are a pattern or a list of patterns and
+    ignore_file a file of them; see path_filter.PathFilter.
+
+    entries, if given, are the files to handle instead of walking
+    source_root, as objects like os.DirEntry. dest_index and duplicate_index
+    are lists of a DestinationIndex and DuplicateIndex per destination to
+    use instead of listing them again, so that watch() can call this for
+    each batch of new files without planning options.
+
+    With a snapshot.Snapshot, the folders unchanged since it was saved
+    aren't walked, and it's saved when the run finishes. Files that weren't
+    copied because of an error are retried next time.
+
+    Sources that are zip or tar archives are read, once the folders are
+    done, without being extracted; see ingest_archive(). They can't be
+    planned.
+
+    With a thumbnails.Thumbnailer, a thumbnail is made of each photo copied
+    or linked, from its first copy, as the copies finish.
+
+    With group, files in the same folder with the same name but for their
+    extension, eg RAW+JPEG pairs and .xmp sidecars, are dated once, from
+    the best of them (see dating_entry()), and go to the same date folder;
+    see file_walker.group_by_stem(). Otherwise each file is dated by itself,
+    so eg a RAW file is dated by its ctime.
+    """
+    all_sources = [source_root] if isinstance(source_root, str) else list(source_root)
+    archives = [source for source in all_sources if is_archive(source)]
+    source_roots = [source for source in all_sources if source not in archives]
+    dest_roots = [dest_root] if isinstance(dest_root, str) else list(dest_root)
+    path_filter = PathFilter(exclude, include_regex, ignore_file)
+    date_depth = workers * QUEUE_DEPTH_PER_WORKER
+    copy_depth = copy_workers * QUEUE_DEPTH_PER_WORKER
+
+    planning = order != ORDER_WALK or plan_file is not None or plan_only
+    if planning and len(dest_roots) > 1:
+        raise ValueError('planning needs a single destination')
+    if planning and archives:
+        raise ValueError('archives cannot be planned')
+    plan = Plan(plan_file) if planning else None
+
+    dests = []
+    for i, root in enumerate(dest_roots):
+        journal = Journal(root) if use_journal and not plan_only else None
+        if journal is not None and journal.resumed:
+            print('Resuming an interrupted run to', root)
+        index = dest_index[i] if dest_index is not None else DestinationIndex(root, defer=planning)
+        duplicates = None
+        if dedup is not None:
+            duplicates = duplicate_index[i] if duplicate_index is not None else \
+                DuplicateIndex(root)
+        # only the first destination's metrics drive the progress line
+        dests.append(Destination(root, index, journal, duplicates, device_of(root),
+                                 Metrics(progress and not dests)))
+    stats = dests[0].stats
+    all_stats = [dest.stats for dest in dests]
+    fan_out = len(dests) > 1 and copy_method not in (COPY_LINK, COPY_REFLINK)
+
+    # processes can't share the duplicate hashes so the main thread does them
+    worker_duplicates = None
+    if dedup is not None and workers and not process_pool:
+        worker_duplicates = [(dest.duplicates, None if dedup == DEDUP_RENAME else dest.root)
+                             for dest in dests]
+    pending_dates = deque()
+    # by source device so a slow card doesn't hold up the others' results
+    pending_copies = defaultdict(deque)
+
+    def count(outcome):
+        # an outcome decided before the destinations are counts for each
+        for dest_stats in all_stats:
+            dest_stats[outcome] += 1
+
+    def drain_copy(targets, future):
+        # targets are the (Destination, PlannedCopy) made by one task
+        results = future.result() if len(targets) > 1 else [future.result()]
+        thumbnails = thumbnailer
+        for (dest, copy), result in zip(targets, results):
+            if thumbnails is not None and result[0] in ('copied', 'linked'):
+                thumbnails.submit(result[1], copy.date, copy.filename)
+                thumbnails = None
+            if result[0] == 'error':
+                dest.index.discard(copy.date, copy.filename)
+                if snapshot is not None:
+                    snapshot.retry(copy.source)
+            if result[0] in ('error', 'exists') and dest.duplicates is not None:
+                # not this file's content; an existing file stays in the index
+                dest.duplicates.remove(result[1], copy.st.st_size)
+            if result[0] != 'error' and dest.journal is not None:
+                dest.journal.completed(copy.source, copy.st, result[1])
+            if result[0] == 'copied' and checksum is not None:
+                append_manifest(dest.index.folder_path(copy.date), checksum,
+                                copy.filename, result[2])
+            report_copy(dest.stats, copy.source, copy.date, *result, verbose,
+                        copy.st.st_size)
+        stats.tick()
+
+    def drain_copies(limit):
+        for pending in pending_copies.values():
+            while len(pending) > limit:
+                drain_copy(*pending.popleft())
+
+    def submit(st, targets, fn, *args):
+        future = scheduler.submit(st.st_dev, tuple(dest.device for dest, _ in targets),
+                                  st.st_size, stats.timed, 'copy', fn, *args)
+        pending_copies[st.st_dev].append((targets, future))
+
+    def start_copies(targets):
+        for dest, copy in targets:
+            if dest.journal is not None:
+                dest.journal.planned(copy.source, copy.st, copy.dest)
+        copies = [target for target in targets if target[1].action == ACTION_COPY]
+        if fan_out and len(copies) > 1:
+            _, first = copies[0]
+            submit(first.st, copies, copy_to_dests, first.source,
+                   [copy.dest for _, copy in copies], checksum, verify)
+            targets = [target for target in targets if target[1].action != ACTION_COPY]
+        for dest, copy in targets:
+            submit(copy.st, [(dest, copy)], *copy.task, copy.dest, copy_method, checksum,
+                   verify)
+        drain_copies(copy_depth)
+
+    def skipped(filepath, reason, dest_file=None):
+        if plan is not None:
+            plan.skip(filepath, reason, dest_file)
+
+    def place(dest, filepath, st, creation_date):
+        """
+        Decide what to do with the file in dest. Returns a PlannedCopy, or
+        None if it's not to be copied there.
+        """
+        index = dest.index
+        duplicates = dest.duplicates
+        _, filename = os.path.split(filepath)
+        task, action = (copy_file, filepath), ACTION_COPY
+        name_taken = index.exists(creation_date, filename)
+        # a file whose name is taken is skipped as existing without reading
+        # it, unless it may be a different photo to copy under a new name
+        if duplicates is not None and (dedup == DEDUP_RENAME or not name_taken):
+            duplicate = duplicates.find(filepath, st.st_size)
+            if duplicate is not None:
+                if dedup != DEDUP_LINK:
+                    report_copy(dest.stats, filepath, creation_date, 'duplicate',
+                                duplicate, duplicate, verbose)
+                    skipped(filepath, 'duplicate', duplicate)
+                    return None
+                if not os.path.exists(duplicate):
+                    # it's being copied in this run
+                    drain_copies(0)
+                task, action = (link_file, filepath, duplicate), ACTION_LINK
+            elif dedup == DEDUP_RENAME and name_taken:
+                # same name, different photo
+                filename = index.unique_name(creation_date, filename)
+
+        try:
+            dest_file, claimed = claim_dest(index, creation_date, filename)
+        except OSError as ex:
+            # eg the date folder can't be made; the other destinations carry on
+            dest_file = os.path.join(index.folder_path(creation_date), filename)
+            report_copy(dest.stats, filepath, creation_date, 'error', dest_file, ex, verbose)
+            if snapshot is not None:
+                snapshot.retry(filepath)
+            skipped(filepath, f'error: {ex}', dest_file)
+            return None
+        if not claimed:
+            report_copy(dest.stats, filepath, creation_date,
+                        'exists', dest_file, None, verbose)
+            if plan is not None and plan.claimed_by(dest_file):
+                skipped(filepath, f'collision with {plan.claimed_by(dest_file)}', dest_file)
+            else:
+                skipped(filepath, 'exists', dest_file)
+            return None
+
+        if duplicates is not None:
+            duplicates.add(dest_file, st.st_size, filepath)
+        return PlannedCopy(filepath, st, creation_date, filename, dest_file, action, task)
+
+    def drain_dates(limit):
+        while len(pending_dates) > limit:
+            filepath, st, future, cache_miss, members = pending_dates.popleft()
+            try:
+                dates, seconds = future.result()
+            except Exception as ex:
+                print_color(Fore.RED, f'====> {filepath}: FAILED reading date: {ex}')
+                for member, _, _ in members:
+                    count('errors')
+                    if snapshot is not None:
+                        snapshot.retry(member)
+                    skipped(member, f'error: {ex}')
+                continue
+
+            if seconds is not None:
+                stats.observe('exif', seconds)
+            if cache_miss:
+                cache.put(filepath, st, dates)
+            creation_date = creation_date_from(filepath, dates)
+
+            for member, member_st, file_dests in members:
+                if creation_date is None:
+                    report_no_date(all_stats, member)
+                    skipped(member, 'no date')
                     continue
+                if verbose and member != filepath:
+                    print(member, f'====> dated from {filepath}')
 
-            creation_date = get_creation_date(filepath)
-            if creation_date is None:
-                print_color(Fore.RED, f'====> {filepath}: skipping - no creation date found')
-                file_no_date += 1
+                targets = []
+                for dest in file_dests:
+                    copy = place(dest, member, member_st, creation_date)
+                    if copy is not None:
+                        targets.append((dest, copy))
+                if not targets:
+                    continue
+                if plan is not None:
+                    plan.add(targets[0][1])
+                    stats['planned'] += 1
+                else:
+                    start_copies(targets)
+
+    def scan(group):
+        # the files of a shot, eg RAW+JPEG and sidecars, are dated together
+        # from the best of them; see dating_entry()
+        members = []
+        candidates = []
+        for entry in group:
+            filepath = entry.path
+            count('files')
+
+            if path_filter.excluded(filepath):
+                if verbose:
+                    print_color(Fore.RED, 'Excluding', filepath)
+                count('excluded')
+                skipped(filepath, 'excluded')
                 continue
 
-            _, filename = os.path.split(filepath)
-
-            dest_file = os.path.join(dest_root, creation_date, filename)
-            photo_dir = os.path.join(dest_root, creation_date)
-            if verbose:
-                print(filepath, dest_file)
-
-            if not os.path.exists(dest_file):
-                print('Copying', filepath, end=' ')
-                if not os.path.exists(photo_dir):
-                    os.makedirs(photo_dir)
-                res = shutil.copy2(filepath, photo_dir)
-                if os.path.exists(dest_file):
-                    print(
-                        f'====> done: {dest_file} ({res} created on {creation_date})')
-                    files_copied += 1
+            try:
+                st = stats.timed('stat', entry.stat)
+            except OSError as ex:
+                # eg removed, or the card pulled, since the folder was listed
+                print_color(Fore.RED, f'====> {filepath}: FAILED reading file details: {ex}')
+                count('errors')
+                if snapshot is not None:
+                    snapshot.retry(filepath)
+                skipped(filepath, f'error: {ex}')
+                continue
+            candidates.append((entry, st))
+            file_dests = []
+            for dest in dests:
+                if dest.journal is not None and dest.journal.is_done(filepath, st):
+                    if verbose:
+                        print(filepath, '====> Skipping: copied by the interrupted run')
+                    dest.stats['exists'] += 1
                 else:
-                    print_color(Fore.RED, f'====> FAILED: {dest_file} ({res})')
-                    file_errors += 1
+                    file_dests.append(dest)
+            if file_dests:
+                members.append((filepath, st, file_dests))
             else:
-                if verbose:
-                    print('====> Skipping: file already exists in destination folder')
-                files_exist += 1
+                skipped(filepath, 'copied by the interrupted run')
+        if not members:
+            return
 
-    print(
-            f'Total files: {file_count}\nCopied: {files_copied}\nSkipped: {files_exist}\nExcluded: {files_excluded}\nNo date: {file_no_date}\nErrors: {file_errors}')
+        entry, st = dating_entry(candidates)
+        filepath = entry.path
+        read_exif = has_embedded_date(filepath)
+        dates = cache.get(filepath, st) if cache and read_exif else None
+        if dates is None or worker_duplicates is not None:
+            future = date_pool.submit(prepare_file, filepath, st, read_exif,
+                                      dates, worker_duplicates)
+        else:
+            future = Future()
+            future.set_result((dates, None))
+        cache_miss = cache is not None and read_exif and dates is None
+        pending_dates.append((filepath, st, future, cache_miss, members))
+        drain_dates(date_depth)
+        stats.tick()
+
+    def run_plan(plan):
+        dest = dests[0]
+        copies = plan.ordered(order)
+        summary = plan.close(copies, dest.root, order)
+        print(f'Plan: {summary["copies"]} copies, {summary["links"]} links, '
+              f'{summary["bytes_needed"] / 1e6:.1f} MB needed, '
+              f'{summary["bytes_free"] / 1e6:.1f} MB free')
+        if plan_only:
+            return
+        if not summary['enough_space']:
+            print_color(Fore.RED, f'====> Not enough space in {dest.root}: nothing copied')
+            if snapshot is not None:
+                for copy in copies:
+                    snapshot.retry(copy.source)
+            return
+        dest.index.create_deferred()
+        for copy in copies:
+            start_copies([(dest, copy)])
+            stats['planned'] -= 1
+
+    date_executor = ProcessPoolExecutor if process_pool else ThreadPoolExecutor
+    finished = False
+    try:
+        with make_executor(date_executor, workers) as date_pool, \
+                make_executor(ThreadPoolExecutor, copy_workers) as copy_pool:
+            scheduler = DeviceScheduler(copy_pool, reads_per_device or max(copy_workers, 1),
+                                        writes_per_device or max(copy_workers, 1))
+            walk = snapshot.walk if snapshot is not None else walk_files
+            if entries is not None:
+                # folder by folder, for group_by_stem()
+                groups = sorted(entries, key=lambda entry: os.path.split(entry.path))
+                groups = group_by_stem(groups) if group else ([entry] for entry in groups)
+            elif group:
+                groups = walk_roots(source_roots, path_filter.dir_filter(), grouped(walk))
+            else:
+                groups = ([entry] for entry in walk_roots(source_roots,
+                                                          path_filter.dir_filter(), walk))
+            if progress and not archives and entries is not None:
+                stats.expected_files = len(entries)
+            for files in groups:
+                scan(files)
+            if progress and not archives:
+                stats.expected_files = stats['files']
+            drain_dates(0)
+            if plan is not None:
+                run_plan(plan)
+            drain_copies(0)
+        for archive in archives:
+            ingest_archive(archive, dests, path_filter, checksum, verify, verbose, thumbnailer)
+        if thumbnailer is not None:
+            thumbnailer.drain(0)
+        finished = True
+        if snapshot is not None and not plan_only:
+            snapshot.save()
+    finally:
+        for dest in dests:
+            if dest.journal is not None:
+                dest.journal.close(finished)
+
+    stats.clear_progress()
+    if len(dests) == 1:
+        print_summary(stats, dedup)
+    else:
+        for dest in dests:
+            print(f'To {dest.root}:')
+            print_summary(dest.stats, dedup)
+    if snapshot is not None:
+        print(f'Snapshot: {snapshot}')
+    if thumbnailer is not None:
+        print(f'Thumbnails: {thumbnailer}')
+    labels = {}
+    for root in dest_roots + all_sources:
+        device = device_of(root)
+        labels[device] = ', '.join(filter(None, (labels.get(device), root)))
+    scheduler.print_throughput(labels)
+    _, files_per_sec, mb_per_sec, _ = stats.rates()
+    print(f'{files_per_sec:.1f} files/s, {stats.bytes_copied / 1e6:.1f} MB copied at '
+          f'{mb_per_sec:.1f} MB/s')
+
+    destinations = [(dest.root, dest.stats) for dest in dests] if len(dests) > 1 else None
+    if metrics_json:
+        stats.write_json(metrics_json, scheduler.summary(labels), destinations)
+    if prometheus_file:
+        stats.write_prometheus(prometheus_file, scheduler.summary(labels), destinations)
+    return stats
+
+
+def watch(run, source_roots, dest_roots, path_filter, dedup=None, settle=2.0,
+          method=WATCH_AUTO, poll_interval=10):
+    """
+    Copy the files already in source_roots and then each new file once it
+    has settled, until interrupted. run(entries, dest_index,
+    duplicate_index) calls move_files() with the other options. The watches
+    are set up before the first scan so nothing that arrives during it is
+    missed, and that scan picks up anything that arrived while not
+    running. The destinations are listed once and the listings kept up to
+    date between batches.
+    """
+    watcher = Watcher(source_roots, path_filter.dir_filter(), settle, method, poll_interval)
+    index = [DestinationIndex(root) for root in dest_roots]
+    duplicates = [DuplicateIndex(root) for root in dest_roots] if dedup is not None else None
+    try:
+        run(None, index, duplicates)
+        print(f'Watching {", ".join(source_roots)} using {watcher.method}; Ctrl-C to stop')
+        for batch in watcher.batches():
+            run(batch, index, duplicates)
+    except KeyboardInterrupt:
+        print('Stopped watching')
+    finally:
+        watcher.close()
 
 
 def main():
     """
     Processing begins here if script run directly
     """
-    args = setup_command_line().parse_args()
+    cmdline = setup_command_line()
+    args = cmdline.parse_args()
     print(args)
+    planning = args.plan or args.plan_only or args.order != ORDER_WALK
+    if args.watch and planning:
+        cmdline.error('--watch cannot be used with --plan, --plan-only or --order')
+    if len(args.dest) > 1 and planning:
+        cmdline.error('--plan, --plan-only and --order need a single --to')
+    if (args.watch or planning) and any(is_archive(os.path.expanduser(source))
+                                        for source in args.source):
+        cmdline.error('--watch, --plan, --plan-only and --order cannot be used with archives')
 
-    move_files(os.path.expanduser(args.source), os.path.expanduser(
-        args.dest), args.exclude, args.include, args.verbose)
+    for option, limit in (('--reads-per-device', args.reads_per_device),
+                          ('--writes-per-device', args.writes_per_device)):
+        if limit is not None and limit < args.copy_workers:
+            print(f'====> {option} {limit}: at most {limit} of the {args.copy_workers} '
+                  f'--copy-workers will copy from or to each device')
+
+    progress = args.progress
+    if progress is None:
+        progress = not args.verbose and sys.stderr.isatty() and not args.watch
+    source_roots = [os.path.expanduser(source) for source in args.source]
+    dest_roots = [os.path.expanduser(dest) for dest in args.dest]
+
+    snapshot = None
+    if args.snapshot:
+        snapshot = Snapshot(os.path.expanduser(args.snapshot_file) if args.snapshot_file else
+                            snapshot_file('fetch-photos', [os.path.abspath(source)
+                                                           for source in source_roots],
+                                          [os.path.abspath(dest) for dest in dest_roots],
+                                          args.exclude,
+                                          args.include, args.ignore_file))
+
+    def run(entries=None, dest_index=None, duplicate_index=None):
+        return move_files(source_roots, dest_roots, args.exclude, args.include, args.verbose,
+                          workers=args.workers, copy_workers=args.copy_workers,
+                          process_pool=args.process_pool, cache=cache, dedup=args.dedup,
+                          copy_method=args.copy_method, checksum=args.checksum,
+                          verify=args.verify, use_journal=args.journal,
+                          reads_per_device=args.reads_per_device,
+                          writes_per_device=args.writes_per_device, progress=progress,
+                          metrics_json=args.metrics_json, prometheus_file=args.prometheus,
+                          order=args.order, plan_file=args.plan, plan_only=args.plan_only,
+                          ignore_file=args.ignore_file, entries=entries,
+                          dest_index=dest_index, duplicate_index=duplicate_index,
+                          snapshot=snapshot if entries is None else None,
+                          thumbnailer=thumbnailer, group=args.group)
+
+    cache = open_cache(args.no_cache, args.cache)
+    thumbnailer = None
+    if args.thumbnails:
+        thumbnailer = Thumbnailer(os.path.expanduser(args.thumbnails), args.thumbnail_size,
+                                  args.thumbnail_workers)
+    try:
+        if args.watch:
+            watch(run, source_roots, dest_roots,
+                  PathFilter(args.exclude, args.include, args.ignore_file), args.dedup,
+                  args.settle, args.watch_method, args.poll_interval)
+        else:
+            run()
+    finally:
+        if thumbnailer is not None:
+            thumbnailer.close()
+        if cache is not None:
+            cache.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,120 @@
+"""
+=============================================================================
+File: file_walker.py
+Description: Walk a folder tree with os.scandir. The file type returned by
+scandir is used instead of a stat per entry, folders excluded by a folder
+glob are not entered at all (see path_filter.py) and entries come out in the
+same order every run.
+Author: Praful https://github.com/Praful/fetch-photos
+Licence: GPL v3
+=============================================================================
+"""
+import os
+
+# files editors write alongside a photo, named after it with or without its
+# extension
+SIDECAR_EXTENSIONS = ('.xmp',)
+
+
+def walk_files(root, skip_dir=None):
+    """
+    Yield an os.DirEntry for each file under root. Within a folder, files are
+    yielded in name order, then each sub-folder is walked in name order.
+    Hidden files and folders (names starting with '.') are ignored, as glob
+    does. skip_dir(path) returning True stops a folder being entered.
+    """
+    stack = [root]
+    while stack:
+        dirpath = stack.pop()
+        try:
+            with os.scandir(dirpath) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError as ex:
+            print(f'====> {dirpath}: cannot list folder: {ex}')
+            continue
+
+        subdirs = []
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            if entry.is_dir():
+                if skip_dir is None or not skip_dir(entry.path):
+                    subdirs.append(entry.path)
+            elif entry.is_file():
+                yield entry
+
+        stack.extend(reversed(subdirs))
+
+
+def walk_roots(roots, skip_dir=None, walk=walk_files):
+    """
+    Walk each folder in roots as walk_files() does, or with walk, taking one
+    file from each in turn so that work on several devices, eg memory
+    cards, can overlap.
+    """
+    walkers = [walk(root, skip_dir) for root in roots]
+    while walkers:
+        for walker in list(walkers):
+            entry = next(walker, None)
+            if entry is None:
+                walkers.remove(walker)
+            else:
+                yield entry
+
+
+def stem_groups(entries):
+    """
+    Group the files of one folder as group_by_stem() does.
+    """
+    groups = {}  # stem -> entries
+    by_name = {}
+    sidecars = []
+    for entry in entries:
+        name = os.path.basename(entry.path)
+        stem, extension = os.path.splitext(name)
+        if extension.lower() in SIDECAR_EXTENSIONS:
+            sidecars.append((stem, entry))
+            continue
+        group = groups.setdefault(stem, [])
+        group.append(entry)
+        by_name[name] = group
+
+    for stem, entry in sidecars:
+        # DSC00001.ARW.xmp goes with DSC00001.ARW, DSC00001.xmp with DSC00001.*
+        group = by_name.get(stem) or groups.get(stem)
+        if group is None:
+            group = groups.setdefault(stem, [])
+        group.append(entry)
+    return list(groups.values())
+
+
+def group_by_stem(entries):
+    """
+    Group files that are in the same folder and have the same name but for
+    their extension, eg the DSC00001.JPG and DSC00001.ARW a camera writes
+    for one shot, along with their sidecars, eg DSC00001.xmp or
+    DSC00001.ARW.xmp. Yields a list of entries at a time, most of them a
+    single file. Each folder's files are held until the next folder's
+    start, so entries must come folder by folder, as walk_files() gives
+    them.
+    """
+    folder = None
+    batch = []
+    for entry in entries:
+        entry_folder = os.path.dirname(entry.path)
+        if entry_folder != folder:
+            yield from stem_groups(batch)
+            folder = entry_folder
+            batch = []
+        batch.append(entry)
+    yield from stem_groups(batch)
+
+
+def grouped(walk):
+    """
+    walk, eg walk_files, yielding lists of entries as group_by_stem() does.
+    """
+    def walk_groups(root, skip_dir=None):
+        return group_by_stem(walk(root, skip_dir))
+
+    return walk_groups
@@ -0,0 +1,167 @@
+"""
+=============================================================================
+File: io_scheduler.py
+Description: Run copies on a thread pool while limiting how many read from
+each source device, and write to each destination device, at once. SD card
+readers slow down badly when asked for several files in parallel, so each
+source device has its own queue and by default one copy at a time, while
+several cards plugged in together are all kept busy. Devices are told apart
+by st_dev. The bytes copied and the time spent are recorded per device so
+throughput can be reported.
+Author: Praful https://github.com/Praful/fetch-photos
+Licence: GPL v3
+=============================================================================
+"""
+import os
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from concurrent.futures import Future
+
+
+def nearest_existing(path):
+    """
+    path, or its nearest parent that exists if it doesn't exist yet.
+    """
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return path
+
+
+def device_of(path):
+    """
+    The st_dev of path, or of its nearest parent if it doesn't exist yet.
+    """
+    return os.stat(nearest_existing(path)).st_dev
+
+
+def device_name(device):
+    return f'{os.major(device)}:{os.minor(device)}'
+
+
+class Throughput:
+    """
+    Files and bytes handled by a device, and the span of time it was busy.
+    """
+
+    def __init__(self):
+        self.files = 0
+        self.bytes = 0
+        self.start = None
+        self.end = None
+
+    def add(self, size, start, end):
+        self.files += 1
+        self.bytes += size
+        self.start = start if self.start is None else min(self.start, start)
+        self.end = end if self.end is None else max(self.end, end)
+
+    def mb_per_sec(self):
+        seconds = self.end - self.start
+        return self.bytes / 1e6 / seconds if seconds > 0 else 0
+
+    def __str__(self):
+        return (f'{self.files} files, {self.bytes / 1e6:.1f} MB, '
+                f'{self.mb_per_sec():.1f} MB/s')
+
+
+class DeviceScheduler:
+    """
+    Thread safe. Tasks for a source device start in the order submitted.
+    A task only reaches the pool when all its devices have a free slot, so
+    the pool's threads are never tied up waiting for a busy card.
+    """
+
+    def __init__(self, pool, reads_per_device=1, writes_per_device=2):
+        self.pool = pool
+        self.reads_per_device = reads_per_device
+        self.writes_per_device = writes_per_device
+        self.lock = threading.Lock()
+        self.waiting = defaultdict(deque)  # source device -> tasks
+        self.reading = Counter()
+        self.writing = Counter()
+        self.reads = defaultdict(Throughput)
+        self.writes = defaultdict(Throughput)
+
+    def submit(self, read_device, write_devices, size, fn, *args):
+        """
+        Run fn(*args) once read_device and each of write_devices, a tuple,
+        have a free slot. size is the number of bytes it will copy to each.
+        Returns a Future.
+        """
+        future = Future()
+        with self.lock:
+            self.waiting[read_device].append((future, read_device, write_devices, size,
+                                              fn, args))
+        self._dispatch()
+        return future
+
+    def _dispatch(self):
+        ready = []
+        with self.lock:
+            for read_device, tasks in self.waiting.items():
+                while (tasks and self.reading[read_device] < self.reads_per_device and
+                       all(self.writing[device] < self.writes_per_device
+                           for device in tasks[0][2])):
+                    task = tasks.popleft()
+                    self.reading[read_device] += 1
+                    for device in task[2]:
+                        self.writing[device] += 1
+                    ready.append(task)
+        # submitted outside the lock since an inline pool runs the task now
+        for task in ready:
+            self.pool.submit(self._run, *task)
+
+    def _run(self, future, read_device, write_devices, size, fn, args):
+        start = time.perf_counter()
+        try:
+            result, error = fn(*args), None
+        except Exception as ex:
+            result, error = None, ex
+        end = time.perf_counter()
+
+        with self.lock:
+            self.reading[read_device] -= 1
+            for device in write_devices:
+                self.writing[device] -= 1
+            if error is None:
+                self.reads[read_device].add(size, start, end)
+                for device in write_devices:
+                    self.writes[device].add(size, start, end)
+        self._dispatch()
+
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+
+    def summary(self, labels):
+        """
+        Return a dict per device and direction for metrics. labels maps a
+        device to a description, eg the folders on it.
+        """
+        result = []
+        for direction, devices in (('read', self.reads), ('write', self.writes)):
+            for device, throughput in sorted(devices.items()):
+                result.append({
+                    'direction': direction,
+                    'device': device_name(device),
+                    'label': labels.get(device, ''),
+                    'files': throughput.files,
+                    'bytes': throughput.bytes,
+                    'mb_per_sec': round(throughput.mb_per_sec(), 2),
+                })
+        return result
+
+    def print_throughput(self, labels):
+        """
+        Print the throughput of each device; labels are as for summary().
+        """
+        for heading, devices in (('Read from', self.reads), ('Written to', self.writes)):
+            for device, throughput in sorted(devices.items()):
+                label = labels.get(device, '')
+                print(f'{heading} {device_name(device)} {label}: {throughput}')
@@ -0,0 +1,294 @@
+"""
+=============================================================================
+File: isobmff.py
+Description: Read the recording date of MP4/MOV videos from their headers,
+and the EXIF block of HEIF (eg HEIC) photos without decoding them. These are
+ISO base media files: a run of boxes, each a size and a type, some of which
+hold further boxes. The boxes are walked by seeking from header to header,
+so the media data (mdat) is never read, however large, and only a few KB
+are read per file even when the movie header (moov) is at the end.
+Author: Praful https://github.com/Praful/fetch-photos
+Licence: GPL v3
+=============================================================================
+"""
+import io
+import os
+import re
+import struct
+import time
+
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.m4v', '.3gp')
+
+# seconds between 1904-01-01, when MP4 times start, and 1970-01-01
+MP4_EPOCH_OFFSET = 2082844800
+
+# boxes bigger than this aren't read; the ones wanted are tiny
+MAX_BOX_READ = 64 * 1024
+
+# stop walking a damaged file after this many boxes
+MAX_BOXES = 10000
+
+# a HEIF meta box lists every item in the file, so can run to a few
+# hundred KB for photos made of many tiles
+MAX_META_BYTES = 1024 * 1024
+MAX_ITEM_BYTES = 256 * 1024
+
+DAY_BOX = b'\xa9day'
+DAY_PATTERN = re.compile(r'(\d{4})-(\d{2})-(\d{2})')
+
+
+def is_video(filepath):
+    return filepath.lower().endswith(VIDEO_EXTENSIONS)
+
+
+def iter_boxes(f, start, end):
+    """
+    Yield (type, payload start, box end) for each box between start and end,
+    seeking over the payloads. end is None for the end of the file. Stops at
+    the first box that doesn't fit.
+    """
+    position = start
+    for _ in range(MAX_BOXES):
+        if end is not None and position + 8 > end:
+            return
+        f.seek(position)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack('>L4s', header)
+        payload = position + 8
+        if size == 1:
+            large = f.read(8)
+            if len(large) < 8:
+                return
+            (size,) = struct.unpack('>Q', large)
+            payload += 8
+        elif size == 0:
+            # the box runs to the end of the file
+            yield box_type, payload, end if end is not None else os.fstat(f.fileno()).st_size
+            return
+
+        box_end = position + size
+        if box_end < payload or (end is not None and box_end > end):
+            return
+        yield box_type, payload, box_end
+        position = box_end
+
+
+def find_box(f, box_type, start, end):
+    """
+    Return (payload start, box end) of the first box_type between start and
+    end, or None.
+    """
+    for found, payload, box_end in iter_boxes(f, start, end):
+        if found == box_type:
+            return payload, box_end
+    return None
+
+
+def read_payload(f, payload, box_end, limit=MAX_BOX_READ):
+    f.seek(payload)
+    return f.read(min(box_end - payload, limit))
+
+
+def _header_time(data):
+    """
+    The creation_time of an mvhd or tkhd payload in seconds since 1970, or
+    None if it isn't set.
+    """
+    if data[0] == 1:
+        (created,) = struct.unpack_from('>Q', data, 4)
+    else:
+        (created,) = struct.unpack_from('>L', data, 4)
+    if created <= MP4_EPOCH_OFFSET:
+        return None
+    return created - MP4_EPOCH_OFFSET
+
+
+def _day_to_str(text):
+    match = DAY_PATTERN.match(text.decode('utf-8', errors='replace').strip())
+    return '-'.join(match.groups()) if match else None
+
+
+def _meta_children(f, payload):
+    """
+    Where the boxes in a meta box start. MP4's meta is a full box, with a
+    version and flags before its boxes; QuickTime's isn't.
+    """
+    f.seek(payload + 4)
+    return payload if f.read(4) == b'hdlr' else payload + 4
+
+
+def _udta_day(f, start, end):
+    """
+    The date of the ©day tag in a udta box as 'YYYY-MM-DD', or None.
+    """
+    for box_type, payload, box_end in iter_boxes(f, start, end):
+        if box_type == DAY_BOX:
+            # QuickTime: text length and language, then the text
+            return _day_to_str(read_payload(f, payload, box_end)[4:])
+        if box_type == b'meta':
+            # MP4: meta/ilst/©day/data, where data has a type and locale
+            # before the text
+            ilst = find_box(f, b'ilst', _meta_children(f, payload), box_end)
+            day = ilst and find_box(f, DAY_BOX, *ilst)
+            data = day and find_box(f, b'data', *day)
+            if data:
+                return _day_to_str(read_payload(f, *data)[8:])
+    return None
+
+
+def video_date(filepath):
+    """
+    Return the date a video was recorded as 'YYYY-MM-DD', or None. The ©day
+    tag is preferred since it's in local time, then the movie header's
+    creation time, then the first track's (both UTC).
+    """
+    try:
+        with open(filepath, 'rb') as f:
+            return video_date_from(f)
+    except OSError:
+        return None
+
+
+def video_date_from(f):
+    """
+    video_date() for an open, seekable file, which may be just the start of
+    the video, eg in memory.
+    """
+    day = created = track_created = None
+    try:
+        moov = find_box(f, b'moov', 0, None)
+        if moov is None:
+            return None
+        for box_type, payload, box_end in iter_boxes(f, *moov):
+            if box_type == b'mvhd' and created is None:
+                created = _header_time(read_payload(f, payload, box_end, 12))
+            elif box_type == b'trak' and track_created is None:
+                tkhd = find_box(f, b'tkhd', payload, box_end)
+                if tkhd:
+                    track_created = _header_time(read_payload(f, *tkhd, 12))
+            elif box_type == b'udta' and day is None:
+                day = _udta_day(f, payload, box_end)
+    except (OSError, struct.error, IndexError):
+        return None
+
+    if day is not None:
+        return day
+    for seconds in (created, track_created):
+        if seconds is not None:
+            return time.strftime('%Y-%m-%d', time.gmtime(seconds))
+    return None
+
+
+def _uint(data, offset, size):
+    """
+    Read a big-endian unsigned int of size bytes, where a size of 0 means
+    the field is absent. Returns the value and the offset after it.
+    """
+    if size == 0:
+        return 0, offset
+    if size not in (2, 4, 8):
+        raise ValueError(f'unsupported field size {size}')
+    (value,) = struct.unpack_from({2: '>H', 4: '>L', 8: '>Q'}[size], data, offset)
+    return value, offset + size
+
+
+def _exif_item_id(iinf):
+    """
+    The ID of the Exif item in an iinf payload, or None.
+    """
+    # version and flags, then a 16-bit count in version 0 or 32-bit after
+    start = 6 if iinf[0] == 0 else 8
+    for box_type, payload, box_end in iter_boxes(io.BytesIO(iinf), start, len(iinf)):
+        if box_type != b'infe':
+            continue
+        version = iinf[payload]
+        if version == 2:
+            item_id, item_type = struct.unpack_from('>H2x4s', iinf, payload + 4)
+        elif version == 3:
+            item_id, item_type = struct.unpack_from('>L2x4s', iinf, payload + 4)
+        else:
+            continue  # versions 0 and 1 don't give a type
+        if item_type == b'Exif':
+            return item_id
+    return None
+
+
+def _item_extents(iloc, item_id):
+    """
+    Return (construction method, [(offset, length)]) for item_id from an
+    iloc payload, or None if it isn't there.
+    """
+    version = iloc[0]
+    offset_size, length_size = iloc[4] >> 4, iloc[4] & 0x0F
+    base_offset_size = iloc[5] >> 4
+    index_size = iloc[5] & 0x0F if version in (1, 2) else 0
+    id_size = 2 if version < 2 else 4
+
+    count, position = _uint(iloc, 6, id_size)
+    for _ in range(count):
+        this_id, position = _uint(iloc, position, id_size)
+        method = 0
+        if version in (1, 2):
+            method, position = _uint(iloc, position, 2)
+            method &= 0x0F
+        position += 2  # data reference index
+        base_offset, position = _uint(iloc, position, base_offset_size)
+        extent_count, position = _uint(iloc, position, 2)
+        extents = []
+        for _ in range(extent_count):
+            _, position = _uint(iloc, position, index_size)
+            offset, position = _uint(iloc, position, offset_size)
+            length, position = _uint(iloc, position, length_size)
+            extents.append((base_offset + offset, length))
+        if this_id == item_id:
+            return method, extents
+    return None
+
+
+def heif_exif_block(f):
+    """
+    Return the TIFF block of the Exif item of an open HEIF file, found
+    through the meta box's iinf and iloc, or None if there's no Exif item.
+    Raises ValueError if the file's layout isn't understood.
+    """
+    meta = find_box(f, b'meta', 0, None)
+    if meta is None:
+        raise ValueError('no meta box')
+    payload, box_end = meta
+    if box_end - payload > MAX_META_BYTES:
+        raise ValueError('meta box too big')
+    data = read_payload(f, payload, box_end, MAX_META_BYTES)
+
+    # meta is a full box so its boxes start after the version and flags
+    boxes = {}
+    for box_type, start, end in iter_boxes(io.BytesIO(data), 4, len(data)):
+        boxes.setdefault(box_type, (start, end))
+    if b'iinf' not in boxes or b'iloc' not in boxes:
+        raise ValueError('no iinf or iloc box')
+
+    item_id = _exif_item_id(data[slice(*boxes[b'iinf'])])
+    if item_id is None:
+        return None
+    location = _item_extents(data[slice(*boxes[b'iloc'])], item_id)
+    if location is None:
+        return None
+
+    method, extents = location
+    if method == 0:
+        source, base = f, 0  # offsets in the file
+    elif method == 1 and b'idat' in boxes:
+        source, base = io.BytesIO(data), boxes[b'idat'][0]  # offsets in idat
+    else:
+        raise ValueError(f'unsupported item construction method {method}')
+
+    item = b''
+    for offset, length in extents:
+        source.seek(base + offset)
+        # a length of 0 means to the end of the file
+        item += source.read(min(length or MAX_ITEM_BYTES, MAX_ITEM_BYTES - len(item)))
+
+    # the item starts with the offset of the TIFF header, after 'Exif\0\0'
+    (tiff_offset,) = struct.unpack_from('>L', item)
+    return item[4 + tiff_offset:]
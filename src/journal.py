@@ -0,0 +1,85 @@
+"""
+=============================================================================
+File: journal.py
+Description: Append-only record of the copies made by a run of
+fetch-photos.py, kept in the destination folder. If a run is interrupted,
+the next run skips the files the journal says were copied without looking
+at them again, and removes the temporary files of copies that didn't finish.
+The journal is deleted when a run completes.
+Author: Praful https://github.com/Praful/fetch-photos
+Licence: GPL v3
+=============================================================================
+"""
+import json
+import os
+
+from copy_engine import temp_path
+
+JOURNAL_FILE = '.fetch-photos.journal'
+
+OP_PLANNED = 'planned'
+OP_DONE = 'done'
+
+
+def source_key(filepath, st):
+    return os.path.abspath(filepath), st.st_size, st.st_mtime_ns
+
+
+class Journal:
+    """
+    Not thread safe; use from the thread that created it.
+    """
+
+    def __init__(self, dest_root):
+        self.path = os.path.join(dest_root, JOURNAL_FILE)
+        self.done = set()
+        self.resumed = False
+        planned = {}
+
+        if os.path.exists(self.path):
+            self.resumed = True
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break  # last line cut short
+                    key = tuple(record['source'])
+                    if record['op'] == OP_PLANNED:
+                        planned[key] = record['dest']
+                    elif record['op'] == OP_DONE:
+                        self.done.add(key)
+                        planned.pop(key, None)
+
+        # copies that were started but not finished
+        for dest_file in planned.values():
+            try:
+                os.remove(temp_path(dest_file))
+                print(f'====> {dest_file}: removed incomplete copy')
+            except FileNotFoundError:
+                pass
+
+        os.makedirs(dest_root, exist_ok=True)
+        self.file = open(self.path, 'a', encoding='utf-8')
+
+    def _write(self, op, filepath, st, dest_file):
+        record = {'op': op, 'source': source_key(filepath, st), 'dest': dest_file}
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+
+    def is_done(self, filepath, st):
+        return source_key(filepath, st) in self.done
+
+    def planned(self, filepath, st, dest_file):
+        self._write(OP_PLANNED, filepath, st, dest_file)
+
+    def completed(self, filepath, st, dest_file):
+        self._write(OP_DONE, filepath, st, dest_file)
+
+    def close(self, finished):
+        """
+        Close the journal, deleting it if the run finished.
+        """
+        self.file.close()
+        if finished:
+            os.remove(self.path)
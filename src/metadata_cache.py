@@ -0,0 +1,153 @@
+"""
+=============================================================================
+File: metadata_cache.py
+Description: On-disk cache of photo dates so that reruns over files that
+haven't changed don't read their EXIF data again. Entries are keyed by path
+and are only used if the file's size, mtime and inode still match. Entries
+not used for a while are removed when the cache is closed.
+Author: Praful https://github.com/Praful/fetch-photos
+Licence: GPL v3
+=============================================================================
+"""
+import os
+import sqlite3
+import time
+
+from photo_metadata import FileDates, file_dates
+
+DEFAULT_CACHE_FILE = os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+    'fetch-photos', 'metadata.sqlite')
+
+# entries not looked up for this long are removed when the cache is closed
+MAX_AGE_DAYS = 365
+
+# last_seen is only rewritten when it's older than this, so a rerun on the
+# same day doesn't write to the cache at all
+TOUCH_INTERVAL = 24 * 60 * 60
+
+# uncommitted changes before they're written out
+COMMIT_EVERY = 1000
+
+# VACUUM after compaction if at least this fraction of rows was removed
+VACUUM_FRACTION = 0.25
+
+
+class MetadataCache:
+    """
+    Photo dates and camera models keyed by (path, size, mtime, inode). Not thread safe; use it
+    from the thread that created it.
+    """
+
+    def __init__(self, cache_file=DEFAULT_CACHE_FILE, max_age_days=MAX_AGE_DAYS):
+        os.makedirs(os.path.dirname(os.path.abspath(cache_file)), exist_ok=True)
+        self.max_age = max_age_days * 24 * 60 * 60
+        self.pending = 0
+        self.db = sqlite3.connect(cache_file)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('''
+            CREATE TABLE IF NOT EXISTS file_dates (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                date TEXT,
+                source TEXT,
+                date_original TEXT,
+                date_modified TEXT,
+                last_seen INTEGER NOT NULL,
+                model TEXT)''')
+        columns = {row[1] for row in self.db.execute('PRAGMA table_info(file_dates)')}
+        if 'model' not in columns:
+            # made before camera models were kept, so read the files again
+            self.db.execute('DELETE FROM file_dates')
+            self.db.execute('ALTER TABLE file_dates ADD COLUMN model TEXT')
+            self.db.commit()
+
+    def _written(self):
+        self.pending += 1
+        if self.pending >= COMMIT_EVERY:
+            self.db.commit()
+            self.pending = 0
+
+    def get(self, filepath, st):
+        """
+        Return the cached FileDates for filepath, or None if there isn't one
+        or the file has changed since it was cached.
+        """
+        path = os.path.abspath(filepath)
+        row = self.db.execute(
+            'SELECT size, mtime_ns, inode, date, source, date_original, date_modified, model, '
+            'last_seen FROM file_dates WHERE path = ?', (path,)).fetchone()
+        if row is None or tuple(row[:3]) != (st.st_size, st.st_mtime_ns, st.st_ino):
+            return None
+
+        # read each time since a --watch run can last for weeks
+        now = int(time.time())
+        if now - row[8] > TOUCH_INTERVAL:
+            self.db.execute('UPDATE file_dates SET last_seen = ? WHERE path = ?',
+                            (now, path))
+            self._written()
+
+        return FileDates(*row[3:8])
+
+    def put(self, filepath, st, dates):
+        self.db.execute(
+            'INSERT OR REPLACE INTO file_dates (path, size, mtime_ns, inode, date, source, '
+            'date_original, date_modified, model, last_seen) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (os.path.abspath(filepath), st.st_size, st.st_mtime_ns, st.st_ino,
+             *dates, int(time.time())))
+        self._written()
+
+    def moved(self, old_path, new_path):
+        """
+        Record that a file was renamed so its entry stays valid.
+        """
+        self.db.execute('UPDATE OR REPLACE file_dates SET path = ? WHERE path = ?',
+                        (os.path.abspath(new_path), os.path.abspath(old_path)))
+        self._written()
+
+    def compact(self):
+        """
+        Remove entries that haven't been used within max_age and reclaim the
+        space if enough was removed.
+        """
+        (total,) = self.db.execute('SELECT COUNT(*) FROM file_dates').fetchone()
+        removed = self.db.execute('DELETE FROM file_dates WHERE last_seen < ?',
+                                  (int(time.time()) - self.max_age,)).rowcount
+        self.db.commit()
+        if total and removed / total >= VACUUM_FRACTION:
+            self.db.execute('VACUUM')
+
+    def close(self):
+        self.compact()
+        self.db.close()
+
+
+def open_cache(no_cache=False, cache_file=None):
+    """
+    Return a MetadataCache, or None if caching is turned off.
+    """
+    if no_cache:
+        return None
+    return MetadataCache(os.path.expanduser(cache_file or DEFAULT_CACHE_FILE))
+
+
+def cached_file_dates(cache, filepath, read_exif=True, st=None):
+    """
+    file_dates() via the cache; cache may be None. Only files whose EXIF data
+    is read are cached since the others cost no more than a stat. Pass st if
+    the file has already been stat'ed.
+    """
+    if st is None:
+        st = os.stat(filepath)
+    if cache is None or not read_exif:
+        return file_dates(filepath, st, read_exif)
+
+    dates = cache.get(filepath, st)
+    if dates is None:
+        dates = file_dates(filepath, st, read_exif)
+        cache.put(filepath, st, dates)
+    return dates
@@ -0,0 +1,249 @@
+"""
+=============================================================================
+File: metrics.py
+Description: Counters, throughput and per-stage latency for a run of
+fetch-photos.py. Drives a progress line, updated at most a few times a
+second, and writes a summary at the end as JSON or in the Prometheus
+textfile collector format, eg to alert when an import runs slower than
+usual because a card or reader is failing.
+Author: Praful https://github.com/Praful/fetch-photos
+Licence: GPL v3
+=============================================================================
+"""
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# counters that each file ends up in exactly one of
+OUTCOMES = ('copied', 'linked', 'exists', 'duplicates', 'excluded', 'no_date', 'errors')
+
+STAGES = ('stat', 'exif', 'copy')
+
+# histogram bucket upper bounds, in seconds
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float('inf'))
+
+PROGRESS_INTERVAL = 0.5
+
+PROMETHEUS_PREFIX = 'fetch_photos'
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours}:{minutes:02d}:{seconds:02d}'
+
+
+class Histogram:
+    """
+    Counts of observations by bucket, as Prometheus keeps them.
+    """
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q):
+        """
+        The upper bound of the bucket holding the q'th quantile.
+        """
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank and count:
+                return bound
+        return None
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'sum_seconds': round(self.sum, 6),
+            'mean_seconds': round(self.sum / self.count, 6) if self.count else None,
+            'p50_seconds': self.quantile(0.5),
+            'p95_seconds': self.quantile(0.95),
+            'p99_seconds': self.quantile(0.99),
+        }
+
+
+class Metrics(Counter):
+    """
+    The run's counters, eg metrics['copied'] += 1, plus bytes copied and
+    stage latencies. Counters are only updated from the main thread;
+    observe() may be called from any thread.
+    """
+
+    def __init__(self, progress=False, out=sys.stderr):
+        super().__init__()
+        self.progress = progress
+        self.out = out
+        self.start = time.perf_counter()
+        self.last_progress = 0
+        self.expected_files = None
+        self.bytes_copied = 0
+        self.histograms = {stage: Histogram() for stage in STAGES}
+        self.lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            self.histograms[stage].observe(seconds)
+
+    def timed(self, stage, fn, *args):
+        """
+        Return fn(*args), recording how long it took under stage.
+        """
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def add_copied(self, size):
+        self.bytes_copied += size
+
+    def finished(self):
+        return sum(self[outcome] for outcome in OUTCOMES)
+
+    def rates(self):
+        """
+        Return (seconds so far, files/sec, MB/s copied, seconds left or None).
+        """
+        elapsed = time.perf_counter() - self.start
+        finished = self.finished()
+        files_per_sec = finished / elapsed if elapsed else 0
+        mb_per_sec = self.bytes_copied / 1e6 / elapsed if elapsed else 0
+        eta = None
+        if self.expected_files is not None and files_per_sec:
+            eta = max(self.expected_files - finished, 0) / files_per_sec
+        return elapsed, files_per_sec, mb_per_sec, eta
+
+    def tick(self):
+        """
+        Redraw the progress line if it's due.
+        """
+        if not self.progress:
+            return
+        now = time.perf_counter()
+        if now - self.last_progress < PROGRESS_INTERVAL:
+            return
+        self.last_progress = now
+
+        _, files_per_sec, mb_per_sec, eta = self.rates()
+        total = f'/{self.expected_files}' if self.expected_files is not None else ''
+        line = (f'{self.finished()}{total} files  {self.bytes_copied / 1e6:.1f} MB copied  '
+                f'{files_per_sec:.1f} files/s  {mb_per_sec:.1f} MB/s')
+        if eta is not None:
+            line += f'  ETA {format_duration(eta)}'
+        if self['errors']:
+            line += f'  errors {self["errors"]}'
+        # end at the start of the line so anything printed next overwrites it
+        self.out.write(f'\x1b[K{line}\r')
+        self.out.flush()
+
+    def clear_progress(self):
+        if self.progress:
+            self.out.write('\x1b[K')
+            self.out.flush()
+
+    def summary(self, devices=None, destinations=None):
+        """
+        The run as a dict for JSON. devices is the per-device throughput
+        from io_scheduler.DeviceScheduler.summary(). destinations, when
+        copying to several, is a list of (folder, Metrics) for each.
+        """
+        elapsed, files_per_sec, mb_per_sec, _ = self.rates()
+        result = {
+            'timestamp': time.time(),
+            'seconds': round(elapsed, 3),
+            'files': self['files'],
+            'outcomes': {outcome: self[outcome] for outcome in OUTCOMES},
+            'bytes_copied': self.bytes_copied,
+            'files_per_sec': round(files_per_sec, 2),
+            'mb_per_sec': round(mb_per_sec, 2),
+            'stages': {stage: histogram.summary()
+                       for stage, histogram in self.histograms.items()},
+            'devices': devices or [],
+        }
+        if destinations:
+            result['destinations'] = [
+                {'folder': folder, 'outcomes': {outcome: metrics[outcome] for outcome in OUTCOMES},
+                 'bytes_copied': metrics.bytes_copied}
+                for folder, metrics in destinations]
+        return result
+
+    def write_json(self, filepath, devices=None, destinations=None):
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(devices, destinations), f, indent=2)
+            f.write('\n')
+
+    def write_prometheus(self, filepath, devices=None, destinations=None):
+        """
+        Write the summary for node_exporter's textfile collector. The file is
+        replaced in one go so the collector never reads half of it.
+        """
+        summary = self.summary(devices, destinations)
+        p = PROMETHEUS_PREFIX
+        lines = [
+            f'# HELP {p}_files Files handled by the last run, by outcome',
+            f'# TYPE {p}_files gauge',
+        ]
+        lines += [f'{p}_files{{outcome="{outcome}"}} {count}'
+                  for outcome, count in summary['outcomes'].items()]
+        for name, value, help_text in (
+                ('bytes_copied', summary['bytes_copied'], 'Bytes copied by the last run'),
+                ('duration_seconds', summary['seconds'], 'Length of the last run'),
+                ('copy_bytes_per_second', round(summary['mb_per_sec'] * 1e6),
+                 'Bytes copied per second over the last run'),
+                ('last_run_timestamp_seconds', round(summary['timestamp']),
+                 'When the last run finished')):
+            lines += [f'# HELP {p}_{name} {help_text}', f'# TYPE {p}_{name} gauge',
+                      f'{p}_{name} {value}']
+
+        lines += [f'# HELP {p}_stage_seconds Time per file for each stage',
+                  f'# TYPE {p}_stage_seconds histogram']
+        for stage, histogram in self.histograms.items():
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram.counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{p}_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+            lines.append(f'{p}_stage_seconds_sum{{stage="{stage}"}} {histogram.sum:.6f}')
+            lines.append(f'{p}_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+
+        lines += [f'# HELP {p}_device_bytes_per_second Throughput of each device',
+                  f'# TYPE {p}_device_bytes_per_second gauge']
+        for device in summary['devices']:
+            label = escape_label(device['label'])
+            lines.append(f'{p}_device_bytes_per_second{{direction="{device["direction"]}",'
+                         f'device="{device["device"]}",path="{label}"}} '
+                         f'{round(device["mb_per_sec"] * 1e6)}')
+
+        if destinations:
+            lines += [f'# HELP {p}_destination_files Files handled by the last run, by '
+                      'destination and outcome',
+                      f'# TYPE {p}_destination_files gauge']
+            for destination in summary['destinations']:
+                folder = escape_label(destination['folder'])
+                lines += [f'{p}_destination_files{{destination="{folder}",outcome="{outcome}"}} '
+                          f'{count}' for outcome, count in destination['outcomes'].items()]
+
+        temp_file = filepath + '.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(temp_file, filepath)
@@ -14,28 +14,27 @@ Licence: GPL v3
 """
 # py ./move-to-date-taken-folder-2.py --dir /mnt/sd512/data/pictures/phone-s24ultra --exclude '.mp4'
 #
-import glob
 import os
+import errno
 import time
 #  import datetime
 from datetime import datetime, timezone
 import shutil
 import argparse
-import re
-# python -m pip install Pillow
-from PIL import Image
-from PIL.ExifTags import TAGS
-
-# python -m pip install Pillow-heif (this provides support for heic files)
-from pillow_heif import register_heif_opener
-register_heif_opener()
-
-EXIF_DATATIME = 306
-EXIF_DATATIME_ORIGINAL = 36867
-EXIF_OFFSET = 34665
+from collections import Counter, defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from photo_metadata import exif_dates, file_dates
+from metadata_cache import open_cache
+from path_filter import PathFilter
+from file_walker import group_by_stem, walk_files
+from destination_index import DestinationIndex
+from executors import QUEUE_DEPTH_PER_WORKER, make_executor
+from isobmff import is_video
 
 
 def print_exif_ifd(exif):
+    from PIL.ExifTags import TAGS
+
     print("EXIF IFD ---------------------------------------")
     for key, value in TAGS.items():
         if value == "ExifOffset":
@@ -49,8 +48,11 @@ def print_exif_ifd(exif):
 
 
 def test():
+    from PIL.ExifTags import TAGS
+    from photo_metadata import pillow_open as open_image
+
     filename = "/home/praful/data/pictures/sdcard/phone-s24ultra/2025-02-23/DSC05043~2.JPG"
-    image = Image.open(filename)
+    image = open_image(filename)
     exifdata = image.getexif()
     # getting the basic metadata from the image
     info_dict = {
@@ -92,37 +94,11 @@ def test2(filepath):
 
 
 def exif_date_original(filepath):
-    try:
-        im = Image.open(filepath)
-        exif = im.getexif()
-        ifd_data = exif.get_ifd(EXIF_OFFSET)
-
-        if ifd_data is not None:
-            date = ifd_data.get(EXIF_DATATIME_ORIGINAL)
-            if date is not None:
-                return (date.split(' ')[0]).replace(":", "-")
-    except Exception as ex:
-        print('No date taken:', ex)
-        #  None
-
-    return None
-    #  print('Error getting date taken: ', ex, filepath)
+    return exif_dates(filepath)[0]
 
 
 def exif_date(filepath):
-    try:
-        im = Image.open(filepath)
-        exif = im.getexif()
-        if exif is not None:
-            date = exif.get(EXIF_DATATIME)
-            if date is not None:
-                return (date.split(' ')[0]).replace(":", "-")
-    except Exception as ex:
-        #  print('No date taken:', ex)
-        None
-
-    return None
-    #  print('Error getting date taken: ', ex, filepath)
+    return exif_dates(filepath)[1]
 
 
 def filestamp_to_local_date_str(d):
@@ -158,88 +134,201 @@ def setup_command_line():
     cmdline.add_argument('--dir', dest='dir', type=str, required=True,
                          help='Folder to copy from')
 
-    cmdline.add_argument('--exclude', dest='exclude', type=str, required=False,
-                         help='Exclude paths containing this string')
+    cmdline.add_argument('--exclude', dest='exclude', type=str, action='append',
+                         help='Exclude paths containing this string, or matching glob:PATTERN '
+                         'or re:PATTERN; may be repeated')
+
+    cmdline.add_argument('--include', dest='include', type=str, action='append',
+                         help='Include paths containing this regex, or matching glob:PATTERN; '
+                         'overrides --exclude; may be repeated')
 
-    cmdline.add_argument('--include', dest='include', type=str, required=False,
-                         help='Include paths containing this regex; overrides --exclude')
+
+    cmdline.add_argument('--ignore-file', dest='ignore_file', type=str, required=False,
+                         help='File of glob patterns to exclude, one per line; lines '
+                         'starting with ! are patterns to include')
 
     cmdline.add_argument('--verbose', action=argparse.BooleanOptionalAction,
                          default=False, help='Provides verbose output')
 
-    return cmdline
+    cmdline.add_argument('--cache', dest='cache', type=str, required=False,
+                         help='File to cache photo dates in between runs')
 
+    cmdline.add_argument('--no-cache', action='store_true',
+                         default=False, help="Don't use or update the photo date cache")
 
-def must_include(filepath, regex):
-    return re.search(rf'{regex}', filepath) is not None
+    cmdline.add_argument('--workers', dest='workers', type=int, default=0,
+                         help='Threads reading dates and moving files (default 0: none)')
 
+    cmdline.add_argument('--group', action=argparse.BooleanOptionalAction, default=True,
+                         help='Date files with the same name but a different extension, eg '
+                         'RAW+JPEG pairs and .xmp sidecars, together from the photo and move '
+                         'them to the same folder (default: on)')
+
+    return cmdline
 
-def update_file_location(source_root, exclude, include_regex, verbose):
-    file_count = files_copied = files_exist = file_errors = files_excluded = 0
 
-    dest_root = source_root
+def is_photo(filepath):
+    return filepath.lower().endswith(('.jpg', '.jpeg', '.png', '.heic'))
 
-    for filepath in glob.iglob(source_root + '**/**', recursive=True):
 
-        if os.path.isfile(filepath):
-            file_count += 1
+def dating_entry(candidates):
+    """
+    The (entry, stat) to date a group of files from: a photo, as it has the
+    date taken, then a video, then the first.
+    """
+    for wanted in (is_photo, is_video):
+        for entry, st in candidates:
+            if wanted(entry.path):
+                return entry, st
+    return candidates[0]
 
-            # TODO accept more than one string to exclude and include
 
-            if exclude is not None and not must_include(filepath, include_regex):
-                if exclude in filepath:
+def rename_files(moves):
+    """
+    Move each (source, dest) in moves with os.rename, falling back to
+    shutil.move across file systems. A file is never moved over another.
+    Returns (source, dest, error) for each, error being None on success.
+    """
+    results = []
+    for source, dest in moves:
+        try:
+            if os.path.lexists(dest):
+                raise FileExistsError(errno.EEXIST, 'destination exists', dest)
+            try:
+                os.rename(source, dest)
+            except OSError as ex:
+                if ex.errno != errno.EXDEV:
+                    raise
+                shutil.move(source, dest)
+            results.append((source, dest, None))
+        except OSError as ex:
+            results.append((source, dest, ex))
+    return results
+
+
+def update_file_location(source_root, exclude, include_regex, verbose, cache=None,
+                         workers=0, ignore_file=None, group=True):
+    """
+    Move each file under source_root into the date folder for its date.
+
+    Dates come from the cache where it has them, so a library that has been
+    checked before is only stat'ed; otherwise they're read from the file
+    headers, on a pool when workers are given. Files already in their date
+    folder are left alone. The moves are planned first, with a move whose
+    destination name is already taken, on disk or by another move, reported
+    and skipped. Then the new folders are made and the files are renamed,
+    each source folder's files in turn on one of the workers.
+
+    exclude and include_regex are a pattern or a list of patterns and
+    ignore_file a file of them; see path_filter.PathFilter.
+
+    With group, files in the same folder with the same name but for their
+    extension, eg RAW+JPEG pairs and .xmp sidecars, are dated once, from
+    the best of them, and moved to the same date folder, as fetch-photos.py
+    places them; see file_walker.group_by_stem().
+    """
+    path_filter = PathFilter(exclude, include_regex, ignore_file)
+    stats = Counter()
+    dest_root = os.path.normpath(source_root)
+    index = DestinationIndex(dest_root, defer=True)
+    moves = defaultdict(list)  # source folder -> [(source, dest)]
+    pending = deque()
+    depth = workers * QUEUE_DEPTH_PER_WORKER
+
+    def plan(filepath, dates):
+        # date taken, else date modified, else the file's UTC ctime date
+        date_to_use = dates.date
+        folder, filename = os.path.split(filepath)
+        dest_file = os.path.join(dest_root, date_to_use, filename)
+
+        if folder == os.path.join(dest_root, date_to_use):
+            if verbose:
+                print(filepath, 'already in place')
+            stats['in_place'] += 1
+            return
+
+        if index.exists(date_to_use, filename):
+            print(f'====> {filepath}: not moved, {dest_file} already exists')
+            stats['collisions'] += 1
+            return
+
+        index.make_folder(date_to_use)
+        index.add(date_to_use, filename)
+        if os.path.dirname(folder) == dest_root:
+            index.discard(os.path.basename(folder), filename)
+        moves[folder].append((filepath, dest_file))
+
+    def drain(limit):
+        while len(pending) > limit:
+            filepath, st, future, cache_miss, members = pending.popleft()
+            try:
+                dates = future.result()
+            except Exception as ex:
+                print(f'====> {filepath}: FAILED reading date: {ex}')
+                stats['errors'] += len(members)
+                continue
+            if cache_miss:
+                cache.put(filepath, st, dates)
+            for member in members:
+                plan(member, dates)
+
+    entries = walk_files(source_root, path_filter.dir_filter())
+    groups = group_by_stem(entries) if group else ([entry] for entry in entries)
+    with make_executor(ThreadPoolExecutor, workers) as pool:
+        for files in groups:
+            candidates = []
+            for entry in files:
+                stats['files'] += 1
+                if path_filter.excluded(entry.path):
                     if verbose:
-                        print('Excluding', filepath)
-                    files_excluded += 1
+                        print('Excluding', entry.path)
+                    stats['excluded'] += 1
                     continue
-
-            creation_timestamp = os.path.getctime(filepath)
-            date_local = filestamp_to_local_date_str(creation_timestamp)
-            date_utc = filestamp_to_utc_date_str(creation_timestamp)
-            date_exif = exif_date(filepath)
-            date_original_exif = exif_date_original(filepath)
-
-            if date_original_exif is not None:
-                date_to_use = date_original_exif
-            elif date_exif is not None:
-                date_to_use = date_exif
+                try:
+                    candidates.append((entry, entry.stat()))
+                except OSError as ex:
+                    # eg removed since its folder was listed
+                    print(f'====> {entry.path}: FAILED reading file details: {ex}')
+                    stats['errors'] += 1
+            if not candidates:
+                continue
+
+            entry, st = dating_entry(candidates)
+            filepath = entry.path
+            # every file's header is read, with Pillow for formats the header
+            # reader doesn't know (TIFF variants, WebP, RAW), so a file is
+            # only dated by its ctime if it really has no date in it
+            dates = cache.get(filepath, st) if cache else None
+            if dates is None:
+                future = pool.submit(file_dates, filepath, st, True)
             else:
-                date_to_use = date_utc
-
-            _, filename = os.path.split(filepath)
-
-            #  dest_file_old = os.path.join( dest_root, get_creation_date2(filepath), filename)
-            dest_file_old = filepath
-            dest_file_new = os.path.join(dest_root, date_to_use, filename)
-            photo_dir = os.path.join(dest_root, date_to_use)
-
-            if verbose:
-                print(filepath, dest_file_new)
-
-            if not os.path.exists(dest_file_new):
-                if not os.path.exists(photo_dir):
-                    os.makedirs(photo_dir)
-                    print("making dir", photo_dir)
-                if not os.path.exists(dest_file_old):
-                    print(dest_file_old,
-                          "does not exist and therefore can't be moved")
+                future = Future()
+                future.set_result(dates)
+            pending.append((filepath, st, future, cache is not None and dates is None,
+                            [entry.path for entry, _ in candidates]))
+            drain(depth)
+        drain(0)
+
+        for folder in index.deferred:
+            print('making dir', index.folder_path(folder))
+        index.create_deferred()
+
+        futures = [pool.submit(rename_files, folder_moves) for folder_moves in moves.values()]
+        for future in futures:
+            for source, dest, error in future.result():
+                print('move', source, ' ===> ', dest)
+                if error is None:
+                    print('====> done')
+                    if cache is not None:
+                        cache.moved(source, dest)
+                    stats['moved'] += 1
                 else:
-                    print("move", dest_file_old, " ===> ", dest_file_new)
-                    res = shutil.move(dest_file_old, photo_dir)
-                    #  res = 0
-                    if os.path.exists(dest_file_new):
-                        print('====> done:', res)
-                        files_copied += 1
-                    else:
-                        print('====> FAILED:', res)
-                        file_errors += 1
-            else:
-                if verbose:
-                    print('====> Skipping: file already exists in destination folder')
-                files_exist += 1
+                    print('====> FAILED:', error)
+                    stats['errors'] += 1
 
     print(
-        f'Total files: {file_count}\nCopied: {files_copied}\nSkipped: {files_exist}\nExcluded: {files_excluded}\nErrors: {file_errors}')
+        f'Total files: {stats["files"]}\nMoved: {stats["moved"]}\nAlready in place: {stats["in_place"]}\nSkipped (name taken): {stats["collisions"]}\nExcluded: {stats["excluded"]}\nErrors: {stats["errors"]}')
+    return stats
 
 
 def main():
@@ -248,8 +337,14 @@ def main():
     """
     args = setup_command_line().parse_args()
     print(args)
-    update_file_location(os.path.expanduser(args.dir),
-                         args.exclude, args.include, args.verbose)
+    cache = open_cache(args.no_cache, args.cache)
+    try:
+        update_file_location(os.path.expanduser(args.dir),
+                             args.exclude, args.include, args.verbose, cache, args.workers,
+                             args.ignore_file, args.group)
+    finally:
+        if cache is not None:
+            cache.close()
 
     #  test()
 
@@ -12,28 +12,24 @@ Licence: GPL v3
 =============================================================================
 """
 
-import glob
 import os
 import time
 #  import datetime
 from datetime import datetime, timezone
 import shutil
 import argparse
-import re
-# python -m pip install Pillow
-from PIL import Image
-from PIL.ExifTags import TAGS
-
-# python -m pip install Pillow-heif (this provides support for heic files)
-from pillow_heif import register_heif_opener
-register_heif_opener()
-
-EXIF_DATATIME = 306
+from photo_metadata import exif_dates
+from metadata_cache import open_cache, cached_file_dates
+from path_filter import PathFilter
+from file_walker import walk_files
 
 
 def test():
-    image = Image.open("/mnt/sd512/data/pictures/asia-2023/2023-04-15/DSC07105.JPG")
-    image = Image.open(
+    from PIL.ExifTags import TAGS
+    from photo_metadata import pillow_open as open_image
+
+    image = open_image("/mnt/sd512/data/pictures/asia-2023/2023-04-15/DSC07105.JPG")
+    image = open_image(
         "/mnt/sd512/data/pictures/phone-s10lite/2023-04-18/20230418_103520.heic")
     exifdata = image.getexif()
     # getting the basic metadata from the image
@@ -73,19 +69,7 @@ def test2(filepath):
 
 
 def date_taken(filepath):
-    try:
-        im = Image.open(filepath)
-        exif = im.getexif()
-        if exif is not None:
-            date = exif.get(EXIF_DATATIME)
-            if date is not None:
-                return (date.split(' ')[0]).replace(":", "-")
-    except Exception as ex:
-        print('No date taken:', ex)
-        #  None
-
-    return None
-    #  print('Error getting date taken: ', ex, filepath)
+    return exif_dates(filepath)[1]
 
 
 def filestamp_to_local_date_str(d):
@@ -110,81 +94,90 @@ def setup_command_line():
                          help='Folder to copy from')
     cmdline.add_argument('--to', dest='dest', type=str, required=True,
                          help='Folder to copy to')
-    cmdline.add_argument('--exclude', dest='exclude', type=str, required=False,
-                         help='Exclude paths containing this string')
-    cmdline.add_argument('--include', dest='include', type=str, required=False,
-                         help='Include paths containing this regex; overrides --exclude')
+    cmdline.add_argument('--exclude', dest='exclude', type=str, action='append',
+                         help='Exclude paths containing this string, or matching glob:PATTERN '
+                         'or re:PATTERN; may be repeated')
+    cmdline.add_argument('--include', dest='include', type=str, action='append',
+                         help='Include paths containing this regex, or matching glob:PATTERN; '
+                         'overrides --exclude; may be repeated')
+
+    cmdline.add_argument('--ignore-file', dest='ignore_file', type=str, required=False,
+                         help='File of glob patterns to exclude, one per line; lines '
+                         'starting with ! are patterns to include')
     cmdline.add_argument('--verbose', action=argparse.BooleanOptionalAction,
                          default=False, help='Provides verbose output')
 
-    return cmdline
+    cmdline.add_argument('--cache', dest='cache', type=str, required=False,
+                         help='File to cache photo dates in between runs')
 
+    cmdline.add_argument('--no-cache', action='store_true',
+                         default=False, help="Don't use or update the photo date cache")
 
-def must_include(filepath, regex):
-    return re.search(rf'{regex}', filepath) is not None
+    return cmdline
 
 
-def update_file_location(source_root, dest_root, exclude, include_regex, verbose):
+def update_file_location(source_root, dest_root, exclude, include_regex, verbose, cache=None,
+                         ignore_file=None):
+    path_filter = PathFilter(exclude, include_regex, ignore_file)
     file_count = files_copied = files_exist = file_errors = files_excluded = 0
 
-    for filepath in glob.iglob(source_root + '**/**', recursive=True):
-
-        if os.path.isfile(filepath):
-            file_count += 1
+    for entry in walk_files(source_root, path_filter.dir_filter()):
+        filepath = entry.path
 
-            # TODO accept more than one string to exclude and include
+        file_count += 1
 
-            if exclude is not None and not must_include(filepath, include_regex):
-                if exclude in filepath:
-                    if verbose:
-                        print('Excluding', filepath)
-                    files_excluded += 1
-                    continue
+        if path_filter.excluded(filepath):
+            if verbose:
+                print('Excluding', filepath)
+            files_excluded += 1
+            continue
 
-            creation_timestamp = os.path.getctime(filepath)
-            date_local = filestamp_to_local_date_str(creation_timestamp)
-            date_utc = filestamp_to_utc_date_str(creation_timestamp)
-            date_taken_exif = date_taken(filepath)
+        creation_timestamp = entry.stat().st_ctime
+        date_local = filestamp_to_local_date_str(creation_timestamp)
+        date_utc = filestamp_to_utc_date_str(creation_timestamp)
+        date_taken_exif = cached_file_dates(cache, filepath, st=entry.stat()).date_modified
 
-            if date_taken_exif is not None and date_taken_exif != date_utc:
-                print("date taken not utc", filepath,
-                      date_taken_exif, date_utc, date_local)
+        if date_taken_exif is not None and date_taken_exif != date_utc:
+            print("date taken not utc", filepath,
+                  date_taken_exif, date_utc, date_local)
 
-            if date_taken_exif is not None:
-                date_to_use = date_taken_exif
-            else:
-                date_to_use = date_utc
+        if date_taken_exif is not None:
+            date_to_use = date_taken_exif
+        else:
+            date_to_use = date_utc
 
-            _, filename = os.path.split(filepath)
+        _, filename = os.path.split(filepath)
 
-            #  print(filepath, date_local, date_utc, date_taken_exif)
+        #  print(filepath, date_local, date_utc, date_taken_exif)
 
-            dest_file_old = os.path.join(dest_root, date_local, filename)
-            dest_file_new = os.path.join(dest_root, date_to_use, filename)
-            photo_dir = os.path.join(dest_root, date_to_use)
+        dest_file_old = os.path.join(dest_root, date_local, filename)
+        dest_file_new = os.path.join(dest_root, date_to_use, filename)
+        photo_dir = os.path.join(dest_root, date_to_use)
 
-            if verbose:
-                print(filepath, dest_file_new)
+        if verbose:
+            print(filepath, dest_file_new)
 
-            if not os.path.exists(dest_file_new):
-                if not os.path.exists(photo_dir):
-                    os.makedirs(photo_dir)
-                if not os.path.exists(dest_file_old):
-                    print(dest_file_old, "does not exist and therefore can't be moved")
-                else:
-                    print("move", dest_file_old, " ===> ", dest_file_new)
-                    res = shutil.move(dest_file_old, photo_dir)
-                    #
-                    if os.path.exists(dest_file_new):
-                        print('====> done:', res)
-                        files_copied += 1
-                    else:
-                        print('====> FAILED:', res)
-                        file_errors += 1
+        if not os.path.exists(dest_file_new):
+            if not os.path.exists(photo_dir):
+                os.makedirs(photo_dir)
+            if not os.path.exists(dest_file_old):
+                print(dest_file_old, "does not exist and therefore can't be moved")
             else:
-                if verbose:
-                    print('====> Skipping: file already exists in destination folder')
-                files_exist += 1
+                print("move", dest_file_old, " ===> ", dest_file_new)
+                res = shutil.move(dest_file_old, photo_dir)
+                #
+                if os.path.exists(dest_file_new):
+                    print('====> done:', res)
+                    if cache is not None:
+                        cache.moved(dest_file_old, dest_file_new)
+                    files_copied += 1
+                else:
+                    print('====> FAILED:', res)
+                    file_errors += 1
+        else:
+            if verbose:
+                print('====> Skipping: file already exists in destination folder')
+            files_exist += 1
 
     print(
         f'Total files: {file_count}\nCopied: {files_copied}\nSkipped: {files_exist}\nExcluded: {files_excluded}\nErrors: {file_errors}')
@@ -196,8 +189,14 @@ def main():
     """
     args = setup_command_line().parse_args()
     print(args)
-    update_file_location(os.path.expanduser(args.source), os.path.expanduser(
-        args.dest), args.exclude, args.include, args.verbose)
+    cache = open_cache(args.no_cache, args.cache)
+    try:
+        update_file_location(os.path.expanduser(args.source), os.path.expanduser(
+            args.dest), args.exclude, args.include, args.verbose, cache,
+            args.ignore_file)
+    finally:
+        if cache is not None:
+            cache.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,198 @@
+"""
+=============================================================================
+File: path_filter.py
+Description: The --exclude, --include and --ignore-file options of the
+scripts, compiled once into a matcher. A path is excluded if it matches any
+exclude pattern and no include pattern. Patterns can be given more than
+once and in three forms:
+
+  glob:PATTERN  matches whole names in the path, eg glob:*.mp4 or
+                glob:thumbnail-cache, or runs of them, eg glob:Android/media;
+                ending in /, eg glob:thumbnail-cache/, it only matches folders
+  re:PATTERN    a regex searched for in the path
+  PATTERN       for --exclude a string the path contains, for --include a
+                regex, as before these options took more than one pattern
+
+An ignore file has a pattern per line, globs unless prefixed. Lines starting
+with ! are include patterns; blank lines and lines starting with # are
+ignored. When there are no include patterns, folders matched by a glob
+ending in / aren't entered at all, so the files in them aren't counted as
+excluded; other patterns are checked against every file, as they always
+were. Globs such as *.mp4 are checked with one endswith() before the
+combined regex is tried. All of this is done on names from os.scandir,
+before any file is stat'ed.
+Author: Praful https://github.com/Praful/fetch-photos
+Licence: GPL v3
+=============================================================================
+"""
+import os
+import re
+
+GLOB_PREFIX = 'glob:'
+REGEX_PREFIX = 're:'
+
+FORM_SUBSTRING = 'substring'
+FORM_GLOB = 'glob'
+FORM_REGEX = 'regex'
+
+SEP = re.escape(os.sep)
+
+# eg *.mp4 but not *.mp? or a*.mp4
+EXTENSION_GLOB = re.compile(r'\*(\.[^*?\[\]/\\]+)')
+
+
+def as_list(patterns):
+    """
+    patterns as a list; they may be given as None, one string or several.
+    """
+    if patterns is None:
+        return []
+    if isinstance(patterns, str):
+        return [patterns]
+    return list(patterns)
+
+
+def parse_pattern(pattern, default_form):
+    """
+    Return (form, pattern) with any glob: or re: prefix removed.
+    """
+    if pattern.startswith(GLOB_PREFIX):
+        return FORM_GLOB, pattern[len(GLOB_PREFIX):]
+    if pattern.startswith(REGEX_PREFIX):
+        return FORM_REGEX, pattern[len(REGEX_PREFIX):]
+    return default_form, pattern
+
+
+def glob_to_regex(glob):
+    """
+    A regex matching the names in a path that glob matches: * and ? don't
+    match the separator and / in glob matches it on any system. A glob
+    ending in / only matches folders, ie names followed by a separator.
+    """
+    if glob.endswith('/'):
+        return f'(?:^|{SEP}){glob_body(glob.rstrip("/"))}{SEP}'
+    return f'(?:^|{SEP}){glob_body(glob)}(?:{SEP}|$)'
+
+
+def glob_body(glob):
+    not_sep = f'[^{SEP}]'
+    result = []
+    i = 0
+    while i < len(glob):
+        c = glob[i]
+        if c == '*':
+            result.append(f'{not_sep}*')
+        elif c == '?':
+            result.append(not_sep)
+        elif c == '[':
+            end = glob.find(']', i + 2)
+            if end < 0:
+                result.append(re.escape(c))
+            else:
+                chars = glob[i + 1:end]
+                if chars.startswith('!'):
+                    chars = '^' + chars[1:]
+                result.append(f'[{chars}]')
+                i = end
+        elif c == '/':
+            result.append(SEP)
+        else:
+            result.append(re.escape(c))
+        i += 1
+    return ''.join(result)
+
+
+def read_ignore_file(filepath):
+    """
+    Return (excludes, includes) from an ignore file, as prefixed patterns.
+    """
+    excludes = []
+    includes = []
+    with open(filepath, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            patterns = excludes
+            if line.startswith('!'):
+                patterns = includes
+                line = line[1:]
+            if not line.startswith((GLOB_PREFIX, REGEX_PREFIX)):
+                line = GLOB_PREFIX + line
+            patterns.append(line)
+    return excludes, includes
+
+
+def combine(regexes):
+    if not regexes:
+        return None
+    return re.compile('|'.join(f'(?:{regex})' for regex in regexes))
+
+
+class PathFilter:
+    """
+    excludes and includes are None, a pattern or a list of patterns.
+    Raises re.error if a pattern isn't a valid regex.
+    """
+
+    def __init__(self, excludes=None, includes=None, ignore_file=None):
+        excludes = as_list(excludes)
+        includes = as_list(includes)
+        if ignore_file is not None:
+            more_excludes, more_includes = read_ignore_file(ignore_file)
+            excludes += more_excludes
+            includes += more_includes
+
+        # folder globs match everything under a matching folder, so those
+        # folders can be pruned
+        prunable = []
+        other = []
+        extensions = []
+        for pattern in excludes:
+            form, pattern = parse_pattern(pattern, FORM_SUBSTRING)
+            if form == FORM_SUBSTRING:
+                other.append(re.escape(pattern))
+            elif form == FORM_GLOB:
+                extension = EXTENSION_GLOB.fullmatch(pattern)
+                if extension:
+                    extensions.append(extension.group(1))
+                elif pattern.endswith('/'):
+                    prunable.append(glob_to_regex(pattern))
+                else:
+                    other.append(glob_to_regex(pattern))
+            else:
+                other.append(pattern)
+
+        include_regexes = []
+        for pattern in includes:
+            form, pattern = parse_pattern(pattern, FORM_REGEX)
+            include_regexes.append(glob_to_regex(pattern) if form == FORM_GLOB else pattern)
+
+        self.extensions = tuple(extensions)
+        self.prunable = combine(prunable)
+        self.exclude = combine(prunable + other)
+        self.include = combine(include_regexes)
+
+    def excluded(self, filepath):
+        matched = (self.extensions and filepath.endswith(self.extensions)) or \
+            (self.exclude is not None and self.exclude.search(filepath) is not None)
+        return bool(matched) and (self.include is None or self.include.search(filepath) is None)
+
+    def dir_filter(self):
+        """
+        Return a function that says whether a folder can be skipped, for
+        file_walker.walk_files(), or None if no folder can be. A folder can
+        only be skipped if no include pattern could bring back the files
+        under it. Only folder globs, eg glob:thumbnail-cache/, skip folders,
+        so the files under folders that other patterns exclude are still
+        counted.
+        """
+        if self.include is not None or self.prunable is None:
+            return None
+        prunable = self.prunable
+
+        def skip_dir(dirpath):
+            # with a trailing separator so the folder itself matches
+            return prunable.search(dirpath + os.sep) is not None
+
+        return skip_dir
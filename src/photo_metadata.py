@@ -0,0 +1,400 @@
+"""
+=============================================================================
+File: photo_metadata.py
+Description: Read photo dates without decoding the image. Only the leading
+APP1/TIFF bytes of a file, or the Exif item of a HEIC, are read and the
+EXIF IFDs are walked once, giving DateTimeOriginal and DateTime together.
+Pillow is used as a fallback for containers this reader does not
+understand. Pillow, and the HEIF plugin, are only imported when first
+needed so runs that don't need them start faster.
+Videos are dated from their headers by isobmff.py.
+Author: Praful https://github.com/Praful/fetch-photos
+Licence: GPL v3
+=============================================================================
+"""
+import os
+import struct
+import time
+from collections import namedtuple
+
+from isobmff import heif_exif_block, is_video, video_date, video_date_from
+
+EXIF_DATATIME = 306
+EXIF_DATATIME_ORIGINAL = 36867
+EXIF_OFFSET = 34665
+EXIF_MODEL = 272
+EXIF_ORIENTATION = 274
+EXIF_THUMBNAIL_OFFSET = 513
+EXIF_THUMBNAIL_LENGTH = 514
+
+# TIFF field types
+TIFF_ASCII = 2
+TIFF_SHORT = 3
+TIFF_LONG = 4
+TIFF_IFD = 13
+
+# Upper bound on the bytes read looking for EXIF data. A JPEG segment is at
+# most 64KB so the EXIF block is always found well within this.
+MAX_HEADER_BYTES = 256 * 1024
+TIFF_PREFIX_BYTES = 64 * 1024
+
+JPEG_SOI = b'\xff\xd8'
+JPEG_SOS = 0xDA
+JPEG_EOI = 0xD9
+JPEG_APP1 = 0xE1
+EXIF_HEADER = b'Exif\x00\x00'
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+HEIF_EXTENSIONS = ('.heic', '.heif')
+_heif_registered = False
+
+# where a file's date came from
+SOURCE_DATE_ORIGINAL = 'DateTimeOriginal'
+SOURCE_DATE = 'DateTime'
+SOURCE_VIDEO = 'CreationTime'
+SOURCE_CTIME = 'ctime'
+# the time recorded for a file in an archive
+SOURCE_MTIME = 'mtime'
+
+# date: the date to file a photo under; source: which of the other fields
+# it came from; model: the camera model, if the EXIF data gives it
+FileDates = namedtuple('FileDates', 'date source date_original date_modified model',
+                       defaults=(None,))
+
+
+class UnsupportedFormat(Exception):
+    """Raised when the header reader can't handle a file; use Pillow instead"""
+
+
+def exif_date_to_str(date):
+    """
+    Convert an EXIF date, eg '2022:03:21 10:15:00', to '2022-03-21'.
+    """
+    date = exif_text(date)
+    if date is None:
+        return None
+    return (date.split(' ')[0]).replace(":", "-")
+
+
+def exif_text(value):
+    """
+    An EXIF ASCII value, raw or from Pillow, as a string or None if empty.
+    """
+    if value is None:
+        return None
+    if isinstance(value, bytes):
+        value = value.decode('ascii', errors='ignore')
+    value = value.strip('\x00 ')
+    return value or None
+
+
+def _read_ascii(tiff, byte_order, value_type, count, value_offset):
+    if value_type != TIFF_ASCII:
+        return None
+    if count <= 4:
+        return value_offset[:count]
+    offset = struct.unpack(byte_order + 'L', value_offset)[0]
+    if offset + count > len(tiff):
+        raise UnsupportedFormat('EXIF value outside header')
+    return tiff[offset:offset + count]
+
+
+def _read_ifd(tiff, byte_order, offset, wanted):
+    """
+    Return {tag: (type, count, value_offset)} for the wanted tags of the IFD
+    starting at offset.
+    """
+    result = {}
+    (entry_count,) = struct.unpack_from(byte_order + 'H', tiff, offset)
+    entry = offset + 2
+    for _ in range(entry_count):
+        tag, value_type, count = struct.unpack_from(byte_order + 'HHL', tiff, entry)
+        if tag in wanted:
+            result[tag] = (value_type, count, tiff[entry + 8:entry + 12])
+        entry += 12
+    return result
+
+
+def parse_tiff_fields(tiff):
+    """
+    Walk IFD0 and the EXIF IFD of a TIFF block and return the raw
+    (DateTimeOriginal, DateTime, Model) values; any may be None.
+    """
+    if tiff[:4] == b'II*\x00':
+        byte_order = '<'
+    elif tiff[:4] == b'MM\x00*':
+        byte_order = '>'
+    else:
+        raise UnsupportedFormat('not a TIFF header')
+
+    (ifd0_offset,) = struct.unpack_from(byte_order + 'L', tiff, 4)
+    ifd0 = _read_ifd(tiff, byte_order, ifd0_offset,
+                     (EXIF_DATATIME, EXIF_OFFSET, EXIF_MODEL))
+
+    date = model = None
+    if EXIF_DATATIME in ifd0:
+        date = _read_ascii(tiff, byte_order, *ifd0[EXIF_DATATIME])
+    if EXIF_MODEL in ifd0:
+        model = _read_ascii(tiff, byte_order, *ifd0[EXIF_MODEL])
+
+    date_original = None
+    if EXIF_OFFSET in ifd0:
+        value_type, _, value_offset = ifd0[EXIF_OFFSET]
+        if value_type in (TIFF_LONG, TIFF_IFD):
+            (exif_ifd_offset,) = struct.unpack(byte_order + 'L', value_offset)
+            exif_ifd = _read_ifd(tiff, byte_order, exif_ifd_offset,
+                                 (EXIF_DATATIME_ORIGINAL,))
+            if EXIF_DATATIME_ORIGINAL in exif_ifd:
+                date_original = _read_ascii(
+                    tiff, byte_order, *exif_ifd[EXIF_DATATIME_ORIGINAL])
+
+    return date_original, date, model
+
+
+def _jpeg_exif_block(f):
+    """
+    Step through the JPEG segments before the image data and return the TIFF
+    block of the EXIF APP1 segment, or None if there isn't one.
+    """
+    position = 2
+    while position < MAX_HEADER_BYTES:
+        marker = f.read(4)
+        if len(marker) < 4 or marker[0] != 0xFF:
+            return None
+        marker_type = marker[1]
+        if marker_type in (JPEG_SOS, JPEG_EOI):
+            return None
+        (length,) = struct.unpack('>H', marker[2:])
+        if marker_type == JPEG_APP1:
+            segment = f.read(length - 2)
+            if segment.startswith(EXIF_HEADER):
+                return segment[len(EXIF_HEADER):]
+        else:
+            f.seek(length - 2, 1)
+        position += 2 + length
+    return None
+
+
+def _png_exif_block(f):
+    """
+    Step through the PNG chunks before the image data and return the eXIf
+    chunk, or None if there isn't one.
+    """
+    position = len(PNG_SIGNATURE)
+    while position < MAX_HEADER_BYTES:
+        header = f.read(8)
+        if len(header) < 8:
+            return None
+        length, chunk_type = struct.unpack('>L4s', header)
+        if chunk_type == b'eXIf':
+            return f.read(length)
+        if chunk_type in (b'IDAT', b'IEND'):
+            return None
+        f.seek(length + 4, 1)  # skip data and CRC
+        position += 12 + length
+    return None
+
+
+def read_exif_fields(filepath):
+    """
+    Return raw (DateTimeOriginal, DateTime, Model) by reading only the file
+    header.
+    Raises UnsupportedFormat if the file isn't a JPEG, PNG, TIFF or HEIF.
+    """
+    with open(filepath, 'rb') as f:
+        return read_exif_fields_from(f)
+
+
+def read_exif_fields_from(f):
+    """
+    read_exif_fields() for an open, seekable file, which may be just the
+    start of the file, eg in memory.
+    """
+    tiff = exif_block(f)
+    if tiff is None:
+        return None, None, None
+
+    return parse_tiff_fields(tiff)
+
+
+def exif_block(f):
+    """
+    Return the TIFF block holding the EXIF data of an open, seekable image,
+    or None if it has none. Raises UnsupportedFormat if the file isn't a
+    JPEG, PNG, TIFF or HEIF.
+    """
+    signature = f.read(8)
+    if signature.startswith(JPEG_SOI):
+        f.seek(2)
+        tiff = _jpeg_exif_block(f)
+    elif signature == PNG_SIGNATURE:
+        tiff = _png_exif_block(f)
+    elif signature[:4] in (b'II*\x00', b'MM\x00*'):
+        f.seek(0)
+        tiff = f.read(TIFF_PREFIX_BYTES)
+    elif signature[4:8] == b'ftyp':
+        tiff = heif_exif_block(f)
+    else:
+        raise UnsupportedFormat('unknown image header')
+    return tiff
+
+
+def exif_thumbnail(tiff):
+    """
+    Return (thumbnail, orientation) from a TIFF block: the JPEG thumbnail
+    the camera stored in IFD1, or None, and the Orientation of the main
+    image, or None.
+    """
+    if tiff[:4] == b'II*\x00':
+        byte_order = '<'
+    elif tiff[:4] == b'MM\x00*':
+        byte_order = '>'
+    else:
+        raise UnsupportedFormat('not a TIFF header')
+
+    (ifd0_offset,) = struct.unpack_from(byte_order + 'L', tiff, 4)
+    ifd0 = _read_ifd(tiff, byte_order, ifd0_offset, (EXIF_ORIENTATION,))
+    orientation = None
+    if EXIF_ORIENTATION in ifd0:
+        value_type, _, value = ifd0[EXIF_ORIENTATION]
+        if value_type == TIFF_SHORT:
+            (orientation,) = struct.unpack_from(byte_order + 'H', value)
+
+    # the offset of IFD1 follows IFD0's entries
+    (entry_count,) = struct.unpack_from(byte_order + 'H', tiff, ifd0_offset)
+    (ifd1_offset,) = struct.unpack_from(byte_order + 'L', tiff, ifd0_offset + 2 + 12 * entry_count)
+    if not ifd1_offset or ifd1_offset >= len(tiff):
+        return None, orientation
+    ifd1 = _read_ifd(tiff, byte_order, ifd1_offset,
+                     (EXIF_THUMBNAIL_OFFSET, EXIF_THUMBNAIL_LENGTH))
+    if EXIF_THUMBNAIL_OFFSET not in ifd1 or EXIF_THUMBNAIL_LENGTH not in ifd1:
+        return None, orientation
+    (offset,) = struct.unpack(byte_order + 'L', ifd1[EXIF_THUMBNAIL_OFFSET][2])
+    (length,) = struct.unpack(byte_order + 'L', ifd1[EXIF_THUMBNAIL_LENGTH][2])
+    thumbnail = tiff[offset:offset + length]
+    if len(thumbnail) != length or not thumbnail.startswith(JPEG_SOI):
+        return None, orientation
+    return thumbnail, orientation
+
+
+def pillow_open(filepath):
+    """
+    Image.open, importing Pillow on first use and registering the HEIF
+    plugin the first time a HEIF file is opened.
+    """
+    global _heif_registered
+
+    # python -m pip install Pillow
+    from PIL import Image
+
+    if not _heif_registered and filepath.lower().endswith(HEIF_EXTENSIONS):
+        # python -m pip install Pillow-heif (this provides support for heic files)
+        from pillow_heif import register_heif_opener
+        register_heif_opener()
+        _heif_registered = True
+
+    return Image.open(filepath)
+
+
+def pillow_exif_fields(filepath):
+    """
+    Return raw (DateTimeOriginal, DateTime, Model) using Pillow. This decodes
+    the container so is only used when the header reader can't cope.
+    """
+    date_original = date = model = None
+    try:
+        with pillow_open(filepath) as im:
+            exif = im.getexif()
+            if exif is not None:
+                date = exif.get(EXIF_DATATIME)
+                model = exif.get(EXIF_MODEL)
+                ifd_data = exif.get_ifd(EXIF_OFFSET)
+                if ifd_data is not None:
+                    date_original = ifd_data.get(EXIF_DATATIME_ORIGINAL)
+    except Exception as ex:
+        #  print(f'Info: {filepath}: no exif date:', ex)
+        None
+
+    return date_original, date, model
+
+
+def exif_fields(filepath):
+    """
+    Return (date taken, date modified, camera model). The dates are
+    'YYYY-MM-DD' strings from the DateTimeOriginal and DateTime EXIF fields.
+    Any may be None.
+    """
+    try:
+        date_original, date, model = read_exif_fields(filepath)
+    except (UnsupportedFormat, struct.error, ValueError, IndexError):
+        date_original, date, model = pillow_exif_fields(filepath)
+    except OSError:
+        return None, None, None
+
+    return exif_date_to_str(date_original), exif_date_to_str(date), exif_text(model)
+
+
+def exif_dates(filepath):
+    """
+    Return (date taken, date modified) as for exif_fields().
+    """
+    return exif_fields(filepath)[:2]
+
+
+def embedded_dates(name, f):
+    """
+    Return the FileDates in the header of f, an open, seekable file called
+    name, or None if the header reader finds no date. Unlike file_dates(),
+    Pillow isn't tried and there's no fallback to the file's time, so f can
+    be the start of a file held in memory, eg from an archive.
+    """
+    if is_video(name):
+        date_original = video_date_from(f)
+        if date_original is None:
+            return None
+        return FileDates(date_original, SOURCE_VIDEO, date_original, None)
+
+    try:
+        date_original, date, model = read_exif_fields_from(f)
+    except (UnsupportedFormat, struct.error, ValueError, IndexError, OSError):
+        return None
+    date_original, date, model = \
+        exif_date_to_str(date_original), exif_date_to_str(date), exif_text(model)
+    if date_original is not None:
+        return FileDates(date_original, SOURCE_DATE_ORIGINAL, date_original, date, model)
+    if date is not None:
+        return FileDates(date, SOURCE_DATE, date_original, date, model)
+    return None
+
+
+def filestamp_to_utc_date_str(d):
+    year, month, day, hour, minute, second = time.gmtime(d)[
+        :-3]
+    return "%d-%02d-%02d" % (year, month, day)
+
+
+def file_dates(filepath, st=None, read_exif=True):
+    """
+    Return the FileDates for filepath. The EXIF date taken is preferred, then
+    the EXIF date modified and finally the file's ctime (as a UTC date). For
+    videos, read_exif reads the recording date from the video's header
+    instead, which is returned as the date taken.
+    """
+    date_original = date_modified = model = None
+    if read_exif and is_video(filepath):
+        date_original = video_date(filepath)
+        if date_original is not None:
+            return FileDates(date_original, SOURCE_VIDEO, date_original, None)
+    elif read_exif:
+        date_original, date_modified, model = exif_fields(filepath)
+
+    if date_original is not None:
+        return FileDates(date_original, SOURCE_DATE_ORIGINAL, date_original, date_modified,
+                         model)
+    if date_modified is not None:
+        return FileDates(date_modified, SOURCE_DATE, date_original, date_modified, model)
+
+    if st is None:
+        st = os.stat(filepath)
+    return FileDates(filestamp_to_utc_date_str(st.st_ctime), SOURCE_CTIME,
+                     date_original, date_modified, model)
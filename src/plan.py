@@ -0,0 +1,142 @@
+"""
+=============================================================================
+File: plan.py
+Description: The plan of a run of fetch-photos.py: every copy to make, with
+its date and destination decided, and every file skipped, with why. The
+plan can be written out to inspect, or to check before copying anything
+(--plan-only). The copies can be made in the order the files lie on disk,
+by inode number or by the first block of the file (FIEMAP), rather than in
+folder order, which saves seeking on hard disks and fragmented FAT cards.
+Author: Praful https://github.com/Praful/fetch-photos
+Licence: GPL v3
+=============================================================================
+"""
+import json
+import shutil
+import struct
+from collections import namedtuple
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from io_scheduler import nearest_existing
+
+ORDER_WALK = 'walk'
+ORDER_INODE = 'inode'
+ORDER_EXTENT = 'extent'
+ORDERS = (ORDER_WALK, ORDER_INODE, ORDER_EXTENT)
+
+ACTION_COPY = 'copy'
+ACTION_LINK = 'link'
+
+# from linux/fs.h and linux/fiemap.h
+FS_IOC_FIEMAP = 0xC020660B
+FIEMAP_HEADER = '=QQLLLL'  # start, length, flags, mapped extents, extent count, reserved
+FIEMAP_EXTENT = '=QQQQQLLLL'  # logical, physical, length, reserved * 2, flags, reserved * 3
+
+# source: the file to copy; st: its stat; date: the date folder; task: the
+# copy task and its leading arguments, as given to the scheduler
+PlannedCopy = namedtuple('PlannedCopy', 'source st date filename dest action task')
+
+
+def first_block(filepath):
+    """
+    The physical offset of the start of filepath on its device, or None if
+    the file system can't say.
+    """
+    if fcntl is None:
+        return None
+    header_size = struct.calcsize(FIEMAP_HEADER)
+    buffer = bytearray(struct.pack(FIEMAP_HEADER, 0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0) +
+                       bytes(struct.calcsize(FIEMAP_EXTENT)))
+    try:
+        with open(filepath, 'rb') as f:
+            fcntl.ioctl(f.fileno(), FS_IOC_FIEMAP, buffer)
+    except OSError:
+        return None
+    mapped = struct.unpack_from(FIEMAP_HEADER, buffer)[3]
+    if not mapped:
+        return None  # empty file
+    return struct.unpack_from(FIEMAP_EXTENT, buffer, header_size)[1]
+
+
+def free_space(folder):
+    return shutil.disk_usage(nearest_existing(folder)).free
+
+
+class Plan:
+    """
+    Skips are written to plan_file, if given, as they're decided and the
+    copies at the end, in the order they'll be made. Not thread safe.
+    """
+
+    def __init__(self, plan_file=None):
+        self.copies = []
+        self.sources_by_dest = {}
+        self.file = open(plan_file, 'w', encoding='utf-8') if plan_file else None
+
+    def _write(self, record):
+        if self.file is not None:
+            self.file.write(json.dumps(record) + '\n')
+
+    def add(self, copy):
+        self.copies.append(copy)
+        self.sources_by_dest[copy.dest] = copy.source
+
+    def skip(self, source, reason, dest=None):
+        self._write({'op': 'skip', 'source': source, 'reason': reason, 'dest': dest})
+
+    def claimed_by(self, dest):
+        """
+        The source planned to be copied to dest, if any.
+        """
+        return self.sources_by_dest.get(dest)
+
+    def bytes_needed(self):
+        return sum(copy.st.st_size for copy in self.copies if copy.action == ACTION_COPY)
+
+    def ordered(self, order):
+        """
+        Return the copies in the order to make them: by source device and
+        then by where the files are on it, with links, which read nothing,
+        last. With ORDER_EXTENT, files whose blocks can't be found are placed
+        by inode.
+        """
+        def key(copy):
+            position = copy.st.st_ino
+            if order == ORDER_EXTENT:
+                block = first_block(copy.source)
+                if block is not None:
+                    position = block
+            return copy.action == ACTION_LINK, copy.st.st_dev, position
+
+        if order == ORDER_WALK:
+            return sorted(self.copies, key=lambda copy: copy.action == ACTION_LINK)
+        return sorted(self.copies, key=key)
+
+    def close(self, copies, dest_root, order):
+        """
+        Write the copies, in order, and a summary to the plan file. Returns
+        the summary.
+        """
+        for copy in copies:
+            self._write({'op': copy.action, 'source': copy.source, 'dest': copy.dest,
+                         'date': copy.date, 'size': copy.st.st_size,
+                         'device': copy.st.st_dev, 'inode': copy.st.st_ino})
+        needed = self.bytes_needed()
+        free = free_space(dest_root)
+        summary = {
+            'op': 'summary',
+            'order': order,
+            'copies': sum(copy.action == ACTION_COPY for copy in copies),
+            'links': sum(copy.action == ACTION_LINK for copy in copies),
+            'bytes_needed': needed,
+            'bytes_free': free,
+            'enough_space': needed <= free,
+        }
+        self._write(summary)
+        if self.file is not None:
+            self.file.close()
+        return summary
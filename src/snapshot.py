@@ -0,0 +1,159 @@
+"""
+=============================================================================
+File: snapshot.py
+Description: Snapshots of the folders in a source, so a rerun over an
+archive that hardly changes only lists the folders that did. For each
+folder the snapshot keeps its mtime, the number of entries, a digest of
+their names and its sub-folders. On the next run a folder whose mtime is
+unchanged isn't listed and its files aren't yielded; its sub-folders, taken
+from the snapshot, are still stat'ed since a change further down doesn't
+touch the parent's mtime. That is a stat per folder rather than per file.
+A folder whose mtime changed but whose entries have the same names is
+treated as unchanged too.
+
+A file changed in place, keeping its name, doesn't change its folder's
+mtime so isn't noticed. That's fine for photo archives, where files are
+added rather than edited, but it's why snapshots are only used when asked.
+Author: Praful https://github.com/Praful/fetch-photos
+Licence: GPL v3
+=============================================================================
+"""
+import hashlib
+import json
+import os
+import time
+from collections import namedtuple
+
+DEFAULT_SNAPSHOT_FOLDER = os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+    'fetch-photos', 'snapshots')
+
+# a folder changed within this long of being listed may change again within
+# the same mtime tick (2 seconds on FAT), so isn't trusted next time
+RACY_SECONDS = 2
+
+FolderRecord = namedtuple('FolderRecord', 'mtime entries files digest subdirs')
+
+
+def snapshot_file(*settings):
+    """
+    The default snapshot file for a run with the given settings, eg the
+    script, source folders, destination and filters. Runs with different
+    settings don't share snapshots since a folder unchanged for one may
+    hold files the other hasn't handled.
+    """
+    key = hashlib.blake2b(json.dumps(settings).encode('utf-8'), digest_size=16).hexdigest()
+    return os.path.join(DEFAULT_SNAPSHOT_FOLDER, f'{key}.json')
+
+
+def push_folders(stack, dirpath, names, skip_dir):
+    paths = [os.path.join(dirpath, name) for name in names]
+    stack.extend(reversed([path for path in paths if skip_dir is None or not skip_dir(path)]))
+
+
+def names_digest(names):
+    h = hashlib.blake2b(digest_size=16)
+    for name in sorted(names):
+        h.update(os.fsencode(name) + b'\0')
+    return h.hexdigest()
+
+
+class Snapshot:
+    """
+    The snapshot in filepath, if there is one, and the one being made by
+    this run, which save() replaces it with. Not thread safe.
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.old = {}
+        self.new = {}
+        self.retry_folders = set()
+        self.skipped_folders = 0
+        self.skipped_files = 0
+        try:
+            with open(filepath, encoding='utf-8') as f:
+                self.old = {folder: FolderRecord(*record)
+                            for folder, record in json.load(f).items()}
+        except FileNotFoundError:
+            pass
+        except (ValueError, TypeError) as ex:
+            print(f'====> {filepath}: ignoring unreadable snapshot: {ex}')
+
+    def walk(self, root, skip_dir=None):
+        """
+        Yield an os.DirEntry for each file under root in a folder that has
+        changed since the snapshot, in the order file_walker.walk_files()
+        does, recording every folder for the new snapshot.
+        """
+        stack = [root]
+        while stack:
+            dirpath = stack.pop()
+            try:
+                mtime = os.stat(dirpath).st_mtime_ns
+            except OSError as ex:
+                print(f'====> {dirpath}: cannot list folder: {ex}')
+                continue
+
+            old = self.old.get(dirpath)
+            if old is not None and old.mtime == mtime:
+                self.skip(dirpath, old, stack, skip_dir)
+                continue
+
+            try:
+                with os.scandir(dirpath) as it:
+                    entries = sorted(it, key=lambda entry: entry.name)
+            except OSError as ex:
+                print(f'====> {dirpath}: cannot list folder: {ex}')
+                continue
+
+            files = []
+            subdirs = []
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                if entry.is_dir():
+                    subdirs.append(entry.name)
+                elif entry.is_file():
+                    files.append(entry)
+
+            if time.time_ns() - mtime < RACY_SECONDS * 1_000_000_000:
+                mtime = None
+            record = FolderRecord(mtime, len(entries), len(files),
+                                  names_digest(entry.name for entry in entries), subdirs)
+            if old is not None and old.digest == record.digest:
+                self.skip(dirpath, record, stack, skip_dir)
+                continue
+
+            self.new[dirpath] = record
+            yield from files
+            push_folders(stack, dirpath, subdirs, skip_dir)
+
+    def skip(self, dirpath, record, stack, skip_dir):
+        self.new[dirpath] = record
+        self.skipped_folders += 1
+        self.skipped_files += record.files
+        push_folders(stack, dirpath, record.subdirs, skip_dir)
+
+    def retry(self, filepath):
+        """
+        Note that filepath wasn't handled, eg it couldn't be copied, so its
+        folder is listed again next time.
+        """
+        self.retry_folders.add(os.path.dirname(filepath))
+
+    def save(self):
+        """
+        Replace the snapshot file with the folders seen by this run.
+        """
+        records = {folder: record for folder, record in self.new.items()
+                   if folder not in self.retry_folders}
+        os.makedirs(os.path.dirname(self.filepath) or '.', exist_ok=True)
+        temp_file = self.filepath + '.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(records, f, separators=(',', ':'))
+        os.replace(temp_file, self.filepath)
+
+    def __str__(self):
+        return (f'{self.skipped_folders} unchanged folders skipped '
+                f'({self.skipped_files} files)')
@@ -0,0 +1,149 @@
+"""
+=============================================================================
+File: thumbnails.py
+Description: Make thumbnails of photos as they're copied, into a tree
+alongside the library with the same date folders, so there's no second pass
+over the library to make them afterwards. The thumbnail the camera stored
+in the EXIF data is used when it's big enough, which needs only the EXIF
+header, already in memory for files read from an archive. Otherwise the
+photo is opened in draft mode: a JPEG is scaled down by the decoder in the
+DCT domain (by up to 8 times) rather than decoded at full size, and for a
+HEIC pillow-heif decodes its thumbnail image instead of the main one.
+Thumbnails are made in a pool of processes so decoding doesn't hold up the
+copies, from the copy just written, whose data is still in the page cache.
+Author: Praful https://github.com/Praful/fetch-photos
+Licence: GPL v3
+=============================================================================
+"""
+import io
+import os
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from executors import QUEUE_DEPTH_PER_WORKER, make_executor
+from photo_metadata import UnsupportedFormat, exif_block, exif_thumbnail, pillow_open
+
+THUMBNAIL_SIZE = 256
+THUMBNAIL_QUALITY = 85
+THUMBNAIL_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.heic', '.heif')
+
+# how the thumbnail was made
+FROM_EXIF = 'exif'
+FROM_DRAFT = 'draft'
+
+# EXIF Orientation -> PIL.Image.Transpose names
+ORIENTATION_TRANSPOSE = {2: 'FLIP_LEFT_RIGHT', 3: 'ROTATE_180', 4: 'FLIP_TOP_BOTTOM',
+                         5: 'TRANSPOSE', 6: 'ROTATE_270', 7: 'TRANSVERSE', 8: 'ROTATE_90'}
+
+
+def wants_thumbnail(filename):
+    return filename.lower().endswith(THUMBNAIL_EXTENSIONS)
+
+
+def thumbnail_path(thumbnail_root, date_folder, filename):
+    return os.path.join(thumbnail_root, date_folder, filename + '.jpg')
+
+
+def stored_thumbnail(f):
+    """
+    Return (thumbnail, orientation) from the EXIF data of an open image;
+    see photo_metadata.exif_thumbnail(). Both are None if there's no EXIF.
+    """
+    try:
+        tiff = exif_block(f)
+        if tiff is None:
+            return None, None
+        return exif_thumbnail(tiff)
+    except (UnsupportedFormat, ValueError, IndexError, OSError):
+        return None, None
+
+
+def make_thumbnail(image_file, thumbnail_file, size=THUMBNAIL_SIZE, header=None):
+    """
+    Worker task: write a JPEG no bigger than size x size of image_file to
+    thumbnail_file. header, if given, is the start of image_file, so its
+    EXIF thumbnail can be found without reading the file. Returns FROM_EXIF
+    or FROM_DRAFT.
+    """
+    # python -m pip install Pillow
+    from PIL import Image, ImageOps
+
+    if header is not None:
+        thumbnail, orientation = stored_thumbnail(io.BytesIO(header))
+    else:
+        with open(image_file, 'rb') as f:
+            thumbnail, orientation = stored_thumbnail(f)
+
+    im = None
+    if thumbnail is not None:
+        im = Image.open(io.BytesIO(thumbnail))
+        if max(im.size) >= size:
+            im.load()
+            if orientation in ORIENTATION_TRANSPOSE:
+                im = im.transpose(getattr(Image.Transpose, ORIENTATION_TRANSPOSE[orientation]))
+            made = FROM_EXIF
+        else:
+            im = None
+
+    if im is None:
+        with pillow_open(image_file) as original:
+            original.draft('RGB', (size, size))
+            im = ImageOps.exif_transpose(original)
+            im.load()
+        made = FROM_DRAFT
+
+    im.thumbnail((size, size))
+    if im.mode != 'RGB':
+        im = im.convert('RGB')
+    os.makedirs(os.path.dirname(thumbnail_file), exist_ok=True)
+    temp_file = thumbnail_file + '.tmp'
+    im.save(temp_file, 'JPEG', quality=THUMBNAIL_QUALITY)
+    os.replace(temp_file, thumbnail_file)
+    return made
+
+
+class Thumbnailer:
+    """
+    Makes thumbnails under thumbnail_root in a pool of worker processes,
+    inline with none. Only use from one thread and call close() when done.
+    """
+
+    def __init__(self, thumbnail_root, size=THUMBNAIL_SIZE, workers=0):
+        self.thumbnail_root = thumbnail_root
+        self.size = size
+        self.pool = make_executor(ProcessPoolExecutor, workers)
+        self.depth = workers * QUEUE_DEPTH_PER_WORKER
+        self.pending = deque()
+        self.counts = Counter()
+
+    def submit(self, image_file, date_folder, filename, header=None):
+        """
+        Queue a thumbnail of image_file, just copied to date_folder as
+        filename, if it's a photo that hasn't got one.
+        """
+        if not wants_thumbnail(filename):
+            return
+        thumbnail_file = thumbnail_path(self.thumbnail_root, date_folder, filename)
+        if os.path.exists(thumbnail_file):
+            return
+        future = self.pool.submit(make_thumbnail, image_file, thumbnail_file, self.size, header)
+        self.pending.append((image_file, future))
+        self.drain(self.depth)
+
+    def drain(self, limit):
+        while len(self.pending) > limit:
+            image_file, future = self.pending.popleft()
+            try:
+                self.counts[future.result()] += 1
+            except Exception as ex:
+                print(f'====> {image_file}: cannot make thumbnail: {ex}')
+                self.counts['errors'] += 1
+
+    def close(self):
+        self.drain(0)
+        self.pool.shutdown()
+
+    def __str__(self):
+        made = self.counts[FROM_EXIF] + self.counts[FROM_DRAFT]
+        return (f'{made} made ({self.counts[FROM_EXIF]} from EXIF thumbnails), '
+                f'{self.counts["errors"]} failed')
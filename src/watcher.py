@@ -0,0 +1,286 @@
+"""
+=============================================================================
+File: watcher.py
+Description: Watch source folders for new files, for fetch-photos.py --watch.
+On Linux inotify is used, through ctypes so there's nothing to install;
+elsewhere, or if the system's inotify watch limit is reached, the folders
+are listed every few seconds instead. A file is only handed on once its
+size and modification time have stopped changing for a while, so files
+still being written, eg by a phone sync app, aren't copied half finished.
+Waiting for events costs no CPU; the files seen are only stat'ed while
+some are still settling.
+Author: Praful https://github.com/Praful/fetch-photos
+Licence: GPL v3
+=============================================================================
+"""
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import time
+
+from file_walker import walk_files
+
+WATCH_AUTO = 'auto'
+WATCH_INOTIFY = 'inotify'
+WATCH_POLL = 'poll'
+WATCH_METHODS = (WATCH_AUTO, WATCH_INOTIFY, WATCH_POLL)
+
+# from linux/inotify.h
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_ONLYDIR
+
+EVENT_HEADER = 'iIII'  # wd, mask, cookie, length of name
+EVENT_HEADER_SIZE = struct.calcsize(EVENT_HEADER)
+READ_SIZE = 64 * 1024
+
+
+class PathEntry:
+    """
+    Stands in for the os.DirEntry of a file found other than by scandir.
+    """
+
+    def __init__(self, path, st=None):
+        self.path = path
+        self._stat = st
+
+    def stat(self):
+        if self._stat is None:
+            self._stat = os.stat(self.path)
+        return self._stat
+
+
+def walk_dirs(root, skip_dir=None):
+    """
+    Yield root and the folders under it, skipping hidden ones as
+    file_walker.walk_files() does.
+    """
+    stack = [root]
+    while stack:
+        dirpath = stack.pop()
+        yield dirpath
+        try:
+            with os.scandir(dirpath) as it:
+                for entry in it:
+                    if (entry.is_dir(follow_symlinks=False) and not entry.name.startswith('.')
+                            and (skip_dir is None or not skip_dir(entry.path))):
+                        stack.append(entry.path)
+        except OSError:
+            pass
+
+
+def load_inotify():
+    """
+    Return libc if it has inotify, else None.
+    """
+    name = ctypes.util.find_library('c')
+    try:
+        libc = ctypes.CDLL(name, use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, 'inotify_init1'):
+        return None
+    libc.inotify_add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+    return libc
+
+
+class InotifyEvents:
+    """
+    Paths created or changed under roots, from inotify. Raises OSError if
+    the roots can't be watched.
+    """
+
+    def __init__(self, libc, roots, skip_dir=None):
+        self.libc = libc
+        self.skip_dir = skip_dir
+        self.folders = {}  # watch descriptor -> folder
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            ex = ctypes.get_errno()
+            raise OSError(ex, os.strerror(ex))
+        try:
+            for root in roots:
+                self.watch_tree(root)
+        except OSError:
+            self.close()
+            raise
+
+    def watch(self, folder):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(folder), WATCH_MASK)
+        if wd < 0:
+            ex = ctypes.get_errno()
+            if ex == errno.ENOSPC:
+                raise OSError(ex, 'inotify watch limit reached; see '
+                              '/proc/sys/fs/inotify/max_user_watches', folder)
+            if ex not in (errno.ENOENT, errno.ENOTDIR):
+                raise OSError(ex, os.strerror(ex), folder)
+            return
+        # the same folder moved keeps its descriptor; record its new path
+        self.folders[wd] = folder
+
+    def watch_tree(self, root):
+        for folder in walk_dirs(root, self.skip_dir):
+            self.watch(folder)
+
+    def close(self):
+        os.close(self.fd)
+
+    def read(self, timeout):
+        """
+        Wait up to timeout seconds (None for ever) for events. Returns
+        (paths, rescan): the files that may be new or changed, and whether
+        events were lost so the caller should rescan everything.
+        """
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return [], False
+
+        data = os.read(self.fd, READ_SIZE)
+        paths = []
+        rescan = False
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = struct.unpack_from(EVENT_HEADER, data, offset)
+            name = data[offset + EVENT_HEADER_SIZE:offset + EVENT_HEADER_SIZE + length]
+            offset += EVENT_HEADER_SIZE + length
+
+            if mask & IN_Q_OVERFLOW:
+                rescan = True
+                continue
+            if mask & IN_IGNORED:
+                self.folders.pop(wd, None)
+                continue
+            folder = self.folders.get(wd)
+            name = os.fsdecode(name.rstrip(b'\0'))
+            if folder is None or not name or name.startswith('.'):
+                continue
+
+            path = os.path.join(folder, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and \
+                        (self.skip_dir is None or not self.skip_dir(path)):
+                    # files may have arrived before the watch was added
+                    self.watch_tree(path)
+                    paths.extend(entry.path for entry in walk_files(path, self.skip_dir))
+            else:
+                paths.append(path)
+        return paths, rescan
+
+
+class PollEvents:
+    """
+    Paths created or changed under roots, found by listing them every
+    interval seconds.
+    """
+
+    def __init__(self, roots, skip_dir=None, interval=10):
+        self.roots = roots
+        self.skip_dir = skip_dir
+        self.interval = interval
+        self.files = self.list_files()
+        self.next_poll = time.monotonic() + interval
+
+    def list_files(self):
+        files = {}
+        for root in self.roots:
+            for entry in walk_files(root, self.skip_dir):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                files[entry.path] = (st.st_size, st.st_mtime_ns)
+        return files
+
+    def close(self):
+        pass
+
+    def read(self, timeout):
+        wait = self.next_poll - time.monotonic()
+        if timeout is not None and timeout < wait:
+            time.sleep(timeout)
+            return [], False
+        time.sleep(max(wait, 0))
+        self.next_poll = time.monotonic() + self.interval
+
+        files = self.list_files()
+        paths = [path for path, signature in files.items()
+                 if self.files.get(path) != signature]
+        self.files = files
+        return paths, False
+
+
+class Watcher:
+    """
+    Yields batches of files under roots that have appeared or changed and
+    then stayed the same size and age for settle seconds. Call close() when
+    done. skip_dir is as for file_walker.walk_files(); excluded files are
+    left to the caller.
+    """
+
+    def __init__(self, roots, skip_dir=None, settle=2.0, method=WATCH_AUTO, poll_interval=10):
+        self.roots = roots
+        self.skip_dir = skip_dir
+        self.settle = settle
+        self.events = None
+        if method != WATCH_POLL:
+            libc = load_inotify()
+            if libc is None and method == WATCH_INOTIFY:
+                raise OSError(errno.ENOSYS, 'inotify is not available')
+            if libc is not None:
+                try:
+                    self.events = InotifyEvents(libc, roots, skip_dir)
+                except OSError as ex:
+                    if method == WATCH_INOTIFY:
+                        raise
+                    print(f'====> Cannot use inotify ({ex}); polling instead')
+        if self.events is None:
+            self.events = PollEvents(roots, skip_dir, poll_interval)
+        self.method = WATCH_POLL if isinstance(self.events, PollEvents) else WATCH_INOTIFY
+
+    def close(self):
+        self.events.close()
+
+    def all_files(self):
+        return [entry.path for root in self.roots for entry in walk_files(root, self.skip_dir)]
+
+    def batches(self):
+        """
+        Yield a list of PathEntry at a time, for ever.
+        """
+        # path -> (size, mtime) when last looked at, and when that changed
+        settling = {}
+        while True:
+            # with nothing settling, sleep until there's an event
+            timeout = self.settle / 2 if settling else None
+            paths, rescan = self.events.read(timeout)
+            if rescan:
+                print('====> Missed some file events; checking all files')
+                paths = self.all_files()
+            now = time.monotonic()
+            for path in paths:
+                settling[path] = (None, now)
+
+            ready = []
+            for path, (signature, changed) in list(settling.items()):
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    # gone already, eg a temporary file renamed
+                    del settling[path]
+                    continue
+                current = (st.st_size, st.st_mtime_ns)
+                if current != signature:
+                    settling[path] = (current, now)
+                elif now - changed >= self.settle:
+                    del settling[path]
+                    ready.append(PathEntry(path, st))
+            if ready:
+                yield ready
@@ -0,0 +1,70 @@
+import importlib.util
+import os
+import struct
+import sys
+
+import pytest
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+sys.path.insert(0, SRC)
+
+
+@pytest.fixture
+def load_script():
+    """
+    Import one of the scripts in src, whose names have hyphens, as a module.
+    """
+    def load(name):
+        spec = importlib.util.spec_from_file_location(
+            name.replace('-', '_'), os.path.join(SRC, f'{name}.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+
+    return load
+
+
+def tiff_with_date(date_original):
+    """
+    A minimal little-endian TIFF whose EXIF IFD has DateTimeOriginal, given
+    as 'YYYY:MM:DD HH:MM:SS'.
+    """
+    value = date_original.encode('ascii') + b'\0'
+    ifd0 = 8
+    exif_ifd = ifd0 + 2 + 12 + 4
+    value_offset = exif_ifd + 2 + 12 + 4
+    return (b'II*\x00' + struct.pack('<L', ifd0) +
+            struct.pack('<HHHLL', 1, 34665, 4, 1, exif_ifd) + struct.pack('<L', 0) +
+            struct.pack('<HHHLL', 1, 36867, 2, len(value), value_offset) +
+            struct.pack('<L', 0) + value)
+
+
+def jpeg_with_date(path, date):
+    """
+    Write a small JPEG to path whose EXIF has DateTime, given as
+    'YYYY:MM:DD HH:MM:SS'.
+    """
+    from PIL import Image
+
+    exif = Image.Exif()
+    exif[306] = date  # DateTime
+    Image.new('RGB', (8, 8)).save(path, exif=exif)
+
+
+def vanishing(walk, name):
+    """
+    walk, eg file_walker.walk_files, but the entry called name can't be
+    stat'ed, as if it was removed after its folder was listed.
+    """
+    class Vanished:
+        def __init__(self, entry):
+            self.path, self.name = entry.path, entry.name
+
+        def stat(self, follow_symlinks=True):
+            raise FileNotFoundError(2, 'No such file or directory', self.path)
+
+    def walk_vanishing(root, skip_dir=None):
+        for entry in walk(root, skip_dir):
+            yield Vanished(entry) if entry.name == name else entry
+
+    return walk_vanishing
@@ -0,0 +1,34 @@
+import io
+import tarfile
+import zipfile
+
+from archive_source import iter_members
+
+
+def add_tar_file(tf, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    tf.addfile(info, io.BytesIO(data))
+
+
+def test_tar_members_with_dot_slash_prefix_are_read(tmp_path):
+    archive = tmp_path / 'export.tgz'
+    with tarfile.open(archive, 'w:gz') as tf:
+        add_tar_file(tf, './IMG_1.JPG', b'one')
+        add_tar_file(tf, './2019/IMG_2.JPG', b'two')
+        add_tar_file(tf, './.hidden/IMG_3.JPG', b'three')
+
+    members = [(member, f.read()) for member, f in iter_members(str(archive))]
+
+    assert [(member.name, data) for member, data in members] == \
+        [('IMG_1.JPG', b'one'), ('IMG_2.JPG', b'two')]
+    assert members[1][0].path == str(archive / '2019' / 'IMG_2.JPG')
+
+
+def test_zip_members_with_dot_slash_prefix_are_read(tmp_path):
+    archive = tmp_path / 'export.zip'
+    with zipfile.ZipFile(archive, 'w') as zf:
+        zf.writestr('./IMG_1.JPG', b'one')
+        zf.writestr('__MACOSX/._IMG_1.JPG', b'fork')
+
+    assert [member.name for member, _ in iter_members(str(archive))] == ['IMG_1.JPG']
@@ -0,0 +1,14 @@
+from conftest import tiff_with_date, vanishing
+
+
+def test_a_file_that_vanishes_is_an_error(tmp_path, load_script):
+    check_dates = load_script('check-dates')
+    check_dates.walk_files = vanishing(check_dates.walk_files, 'gone.tif')
+    for name in ('a.tif', 'gone.tif', 'b.tif'):
+        (tmp_path / name).write_bytes(tiff_with_date('2019:07:08 10:11:12'))
+
+    stats = check_dates.move_files(str(tmp_path), None, None, False)
+
+    assert stats['files'] == 3
+    assert stats['errors'] == 1
+    assert stats['checked'] == 2
@@ -0,0 +1,52 @@
+import errno
+import os
+
+import pytest
+
+import copy_engine
+from copy_engine import atomic_copy, commit
+
+
+def test_commit_never_replaces_an_existing_file(tmp_path):
+    temp = tmp_path / '.IMG_1.JPG.fetch-tmp'
+    temp.write_bytes(b'new')
+    dest = tmp_path / 'IMG_1.JPG'
+    dest.write_bytes(b'old')
+
+    with pytest.raises(FileExistsError):
+        commit(str(temp), str(dest))
+
+    assert dest.read_bytes() == b'old'
+
+
+def test_commit_without_hard_links_checks_for_the_file(tmp_path, monkeypatch):
+    def no_links(src, dst):
+        raise OSError(errno.EPERM, 'no hard links on this file system')
+
+    monkeypatch.setattr(os, 'link', no_links)
+    temp = tmp_path / 'temp'
+    temp.write_bytes(b'new')
+    dest = tmp_path / 'IMG_1.JPG'
+    dest.write_bytes(b'old')
+
+    with pytest.raises(FileExistsError):
+        commit(str(temp), str(dest))
+    assert dest.read_bytes() == b'old'
+
+    dest.unlink()
+    commit(str(temp), str(dest))
+    assert dest.read_bytes() == b'new'
+    assert not temp.exists()
+
+
+def test_atomic_copy_leaves_no_temporary_file_when_destination_exists(tmp_path):
+    src = tmp_path / 'src.jpg'
+    src.write_bytes(b'new')
+    dest = tmp_path / 'dest.jpg'
+    dest.write_bytes(b'old')
+
+    with pytest.raises(FileExistsError):
+        atomic_copy(str(src), str(dest), copy_engine.copy)
+
+    assert dest.read_bytes() == b'old'
+    assert sorted(os.listdir(tmp_path)) == ['dest.jpg', 'src.jpg']
@@ -0,0 +1,40 @@
+import builtins
+import errno
+import hashlib
+import io
+
+import fan_out
+from checksums import READ_CHUNK
+from fan_out import write_to_all
+
+
+def test_write_to_all_writes_every_destination(tmp_path):
+    data = bytes(range(256)) * (READ_CHUNK // 64)
+    temps = [str(tmp_path / 'a'), str(tmp_path / 'b')]
+
+    results, digest = write_to_all(io.BytesIO(data[100:]), temps, 'sha256', data[:100])
+
+    assert results == [None, None]
+    assert digest == hashlib.sha256(data).hexdigest()
+    assert all(open(temp, 'rb').read() == data for temp in temps)
+
+
+def test_a_failed_destination_does_not_stop_the_others(tmp_path, monkeypatch):
+    class FullDisk(io.BytesIO):
+        def write(self, chunk):
+            raise OSError(errno.ENOSPC, 'no space left on device')
+
+    def fake_open(path, mode='r'):
+        return FullDisk() if path.endswith('full') else builtins.open(path, mode)
+
+    monkeypatch.setattr(fan_out, 'open', fake_open, raising=False)
+    data = b'x' * (READ_CHUNK * 20)
+    full = tmp_path / 'full'
+    full.write_bytes(b'')
+    temps = [str(full), str(tmp_path / 'ok')]
+
+    results, _ = write_to_all(io.BytesIO(data), temps)
+
+    assert isinstance(results[0], OSError) and results[1] is None
+    assert not full.exists()
+    assert (tmp_path / 'ok').read_bytes() == data
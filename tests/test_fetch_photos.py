@@ -0,0 +1,35 @@
+import os
+import zipfile
+
+import pytest
+
+from conftest import jpeg_with_date
+
+
+def temp_files(root):
+    return [name for _, _, names in os.walk(root) for name in names
+            if name.endswith('.fetch-tmp')]
+
+
+def test_interrupted_archive_run_leaves_no_temporary_files(tmp_path, load_script, monkeypatch):
+    fetch = load_script('fetch-photos')
+    jpeg_with_date(tmp_path / 'IMG_1.JPG', '2019:07:08 10:11:12')
+    archive = tmp_path / 'takeout.zip'
+    with zipfile.ZipFile(archive, 'w') as zf:
+        zf.write(tmp_path / 'IMG_1.JPG', 'Photos/IMG_1.JPG')
+    library = tmp_path / 'library'
+
+    def killed(temp_file, dest_file):
+        raise KeyboardInterrupt
+
+    with monkeypatch.context() as m:
+        m.setattr(fetch, 'commit', killed)
+        with pytest.raises(KeyboardInterrupt):
+            fetch.move_files(str(archive), str(library), None, None, False)
+    assert temp_files(library) == ['.IMG_1.JPG.fetch-tmp']
+
+    # not copied again, so not written over
+    stats = fetch.move_files(str(archive), str(library), 'IMG_1', None, False)
+
+    assert stats['excluded'] == 1
+    assert temp_files(library) == []
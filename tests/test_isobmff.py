@@ -0,0 +1,116 @@
+import calendar
+import io
+import struct
+
+import pytest
+
+from conftest import tiff_with_date
+from isobmff import MP4_EPOCH_OFFSET, heif_exif_block, video_date_from
+from photo_metadata import parse_tiff_fields
+
+RECORDED = calendar.timegm((2021, 5, 1, 12, 0, 0)) + MP4_EPOCH_OFFSET
+
+
+def box(box_type, payload=b''):
+    return struct.pack('>L4s', 8 + len(payload), box_type) + payload
+
+
+def large_box(box_type, payload=b''):
+    # size 1: the real size follows as 64 bits
+    return struct.pack('>L4sQ', 1, box_type, 16 + len(payload)) + payload
+
+
+def full_box(box_type, version, payload=b''):
+    return box(box_type, bytes([version, 0, 0, 0]) + payload)
+
+
+def mvhd(version, created=RECORDED):
+    if version == 1:
+        times = struct.pack('>QQ', created, created)
+    else:
+        times = struct.pack('>LL', created, created)
+    return full_box(b'mvhd', version, times + bytes(80))
+
+
+class CountingReader(io.BytesIO):
+    """
+    A file in memory that counts the bytes read from it.
+    """
+    def __init__(self, data):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+FTYP = box(b'ftyp', b'isom' + bytes(4) + b'isommp42')
+
+
+@pytest.mark.parametrize('version', [0, 1])
+def test_mvhd_versions(version):
+    video = FTYP + box(b'moov', mvhd(version)) + box(b'mdat', bytes(100))
+
+    assert video_date_from(io.BytesIO(video)) == '2021-05-01'
+
+
+def test_moov_after_mdat_is_found_without_reading_mdat():
+    video = CountingReader(FTYP + box(b'mdat', bytes(1024 * 1024)) + box(b'moov', mvhd(0)))
+
+    assert video_date_from(video) == '2021-05-01'
+    assert video.bytes_read < 1024
+
+
+def test_64_bit_box_size():
+    video = FTYP + large_box(b'mdat', bytes(1000)) + box(b'moov', mvhd(1))
+
+    assert video_date_from(io.BytesIO(video)) == '2021-05-01'
+
+
+def test_day_tag_is_preferred():
+    # QuickTime udta/©day: text length and language, then the text
+    day = box(b'\xa9day', struct.pack('>HH', 24, 0) + b'2021-04-30T23:30:00+0100')
+    video = FTYP + box(b'moov', mvhd(0) + box(b'udta', day))
+
+    assert video_date_from(io.BytesIO(video)) == '2021-04-30'
+
+
+def infe(item_id, item_type):
+    return full_box(b'infe', 2, struct.pack('>HH4s', item_id, 0, item_type) + b'\0')
+
+
+def heif(item_types, exif_item=b''):
+    """
+    A HEIF file with an item per type in item_types, numbered from 1, and
+    the data of the Exif item, if any, in mdat.
+    """
+    def build(exif_offset):
+        iinf = full_box(b'iinf', 0, struct.pack('>H', len(item_types)) +
+                        b''.join(infe(i, t) for i, t in enumerate(item_types, 1)))
+        # 32-bit offsets and lengths, no base offset
+        items = b''.join(struct.pack('>HHHLL', i, 0, 1, exif_offset, len(exif_item))
+                         for i in range(1, len(item_types) + 1))
+        iloc = full_box(b'iloc', 0, bytes([0x44, 0x00]) + struct.pack('>H', len(item_types)) +
+                        items)
+        hdlr = full_box(b'hdlr', 0, bytes(4) + b'pict' + bytes(13))
+        return box(b'ftyp', b'heic' + bytes(4) + b'mif1heic') + \
+            full_box(b'meta', 0, hdlr + iinf + iloc)
+
+    start = len(build(0))
+    return io.BytesIO(build(start + 8) + box(b'mdat', exif_item))
+
+
+def test_heif_exif_item():
+    tiff = tiff_with_date('2019:07:08 10:11:12')
+    photo = heif([b'hvc1', b'Exif'], struct.pack('>L', 6) + b'Exif\0\0' + tiff)
+
+    block = heif_exif_block(photo)
+
+    assert block == tiff
+    assert parse_tiff_fields(block)[0] == b'2019:07:08 10:11:12\0'
+
+
+def test_heif_without_exif_item():
+    assert heif_exif_block(heif([b'hvc1', b'grid'])) is None
@@ -0,0 +1,29 @@
+import os
+
+import metadata_cache
+from metadata_cache import MetadataCache
+from photo_metadata import FileDates
+
+
+def last_seen(cache, filepath):
+    return cache.db.execute('SELECT last_seen FROM file_dates WHERE path = ?',
+                            (os.path.abspath(filepath),)).fetchone()[0]
+
+
+def test_entries_are_stamped_when_written(tmp_path, monkeypatch):
+    clock = [1_000_000_000.0]
+    monkeypatch.setattr(metadata_cache.time, 'time', lambda: clock[0])
+    photo = tmp_path / 'IMG_1.JPG'
+    photo.write_bytes(b'photo')
+    dates = FileDates('2019-07-08', 'DateTimeOriginal', '2019-07-08', None)
+    cache = MetadataCache(str(tmp_path / 'cache.sqlite'))
+
+    # as in a --watch run that has been going for days
+    clock[0] += 3 * 24 * 60 * 60
+    cache.put(str(photo), photo.stat(), dates)
+    assert last_seen(cache, photo) == int(clock[0])
+
+    clock[0] += 2 * metadata_cache.TOUCH_INTERVAL
+    assert cache.get(str(photo), photo.stat()) == dates
+    assert last_seen(cache, photo) == int(clock[0])
+    cache.close()
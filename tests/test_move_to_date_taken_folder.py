@@ -0,0 +1,60 @@
+import os
+
+from conftest import jpeg_with_date, tiff_with_date, vanishing
+
+
+def test_exif_dated_tiff_in_place_is_not_moved(tmp_path, load_script):
+    move = load_script('move-to-date-taken-folder-2')
+    folder = tmp_path / '2019-07-08'
+    folder.mkdir()
+    photo = folder / 'scan.tif'
+    photo.write_bytes(tiff_with_date('2019:07:08 10:11:12'))
+
+    stats = move.update_file_location(str(tmp_path), None, None, False)
+
+    assert photo.exists()
+    assert stats['in_place'] == 1
+    assert stats['moved'] == 0
+    assert sorted(os.listdir(tmp_path)) == ['2019-07-08']
+
+
+def test_moving_keeps_the_cache_entry_of_the_moved_file(tmp_path, load_script):
+    from metadata_cache import MetadataCache
+
+    move = load_script('move-to-date-taken-folder')
+    check_dates = load_script('check-dates')
+    source = tmp_path / 'card'
+    source.mkdir()
+    photo = source / 'IMG_1.JPG'
+    jpeg_with_date(photo, '2019:07:08 10:11:12')
+    # as imported by the old fetch-photos.py, into the folder of its ctime
+    library = tmp_path / 'library'
+    old_folder = library / move.filestamp_to_local_date_str(photo.stat().st_ctime)
+    old_folder.mkdir(parents=True)
+    old_file = old_folder / 'IMG_1.JPG'
+    old_file.write_bytes(photo.read_bytes())
+
+    cache = MetadataCache(str(tmp_path / 'cache.sqlite'))
+    check_dates.move_files(str(library), None, None, False, cache)
+    move.update_file_location(str(source), str(library), None, None, False, cache)
+
+    new_file = library / '2019-07-08' / 'IMG_1.JPG'
+    assert new_file.exists() and not old_file.exists()
+    assert cache.get(str(old_file), new_file.stat()) is None
+    assert cache.get(str(new_file), new_file.stat()).date == '2019-07-08'
+    assert cache.get(str(photo), photo.stat()) is not None
+    cache.close()
+
+
+def test_a_file_that_vanishes_is_an_error(tmp_path, load_script):
+    move = load_script('move-to-date-taken-folder-2')
+    move.walk_files = vanishing(move.walk_files, 'gone.tif')
+    folder = tmp_path / '2019-07-08'
+    folder.mkdir()
+    for name in ('a.tif', 'gone.tif'):
+        (folder / name).write_bytes(tiff_with_date('2019:07:08 10:11:12'))
+
+    stats = move.update_file_location(str(tmp_path), None, None, False)
+
+    assert stats['errors'] == 1
+    assert stats['in_place'] == 1
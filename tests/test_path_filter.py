@@ -0,0 +1,29 @@
+import os
+
+from path_filter import PathFilter
+
+
+def test_only_folder_globs_skip_folders():
+    path_filter = PathFilter(['glob:*.mov', 'cache', 'glob:thumbnail-cache/'])
+    skip_dir = path_filter.dir_filter()
+
+    assert not skip_dir(os.path.join('DCIM', 'trip.mov'))
+    assert not skip_dir(os.path.join('DCIM', 'cache'))
+    assert skip_dir(os.path.join('DCIM', 'thumbnail-cache'))
+
+
+def test_files_in_folders_that_are_not_skipped_are_still_excluded():
+    path_filter = PathFilter(['glob:*.mov', 'cache', 'glob:thumbnail-cache/'])
+
+    assert path_filter.excluded(os.path.join('DCIM', 'clip.mov'))
+    assert not path_filter.excluded(os.path.join('DCIM', 'trip.mov', 'IMG_1.JPG'))
+    assert path_filter.excluded(os.path.join('DCIM', 'cache', 'IMG_1.JPG'))
+    assert path_filter.excluded(os.path.join('DCIM', 'thumbnail-cache', 'IMG_1.JPG'))
+    # a file of that name isn't a folder
+    folders_only = PathFilter('glob:thumbnail-cache/')
+    assert not folders_only.excluded(os.path.join('DCIM', 'thumbnail-cache'))
+
+
+def test_includes_stop_folders_being_skipped():
+    assert PathFilter('glob:thumbnail-cache/', 'keep').dir_filter() is None
+    assert PathFilter('cache').dir_filter() is None
@@ -0,0 +1,78 @@
+import pytest
+from PIL import Image, features
+
+import photo_metadata
+from photo_metadata import (EXIF_DATATIME, EXIF_DATATIME_ORIGINAL, EXIF_HEADER, EXIF_MODEL,
+                            EXIF_OFFSET, exif_fields, parse_tiff_fields, pillow_exif_fields,
+                            read_exif_fields)
+
+DATE_ORIGINAL = '2019:07:08 10:11:12'
+DATE = '2020:01:02 03:04:05'
+MODEL = 'ILCE-7M3'
+
+
+def make_exif(endian='<'):
+    exif = Image.Exif()
+    exif.endian = endian
+    exif[EXIF_DATATIME] = DATE
+    exif[EXIF_MODEL] = MODEL
+    exif.get_ifd(EXIF_OFFSET)[EXIF_DATATIME_ORIGINAL] = DATE_ORIGINAL
+    return exif
+
+
+def text(fields):
+    return tuple(photo_metadata.exif_text(value) for value in fields)
+
+
+def save(path, fmt, endian='<'):
+    Image.new('RGB', (16, 16)).save(path, fmt, exif=make_exif(endian))
+    return str(path)
+
+
+@pytest.mark.parametrize('endian', ['<', '>'])
+def test_jpeg_app1(tmp_path, endian):
+    photo = save(tmp_path / 'IMG_1.JPG', 'JPEG', endian)
+
+    assert text(read_exif_fields(photo)) == (DATE_ORIGINAL, DATE, MODEL)
+    assert text(read_exif_fields(photo)) == text(pillow_exif_fields(photo))
+
+
+@pytest.mark.parametrize('endian', ['<', '>'])
+def test_tiff_byte_orders(tmp_path, endian):
+    tiff = make_exif(endian).tobytes()[len(EXIF_HEADER):]
+    assert tiff[:2] == (b'II' if endian == '<' else b'MM')
+    scan = tmp_path / 'scan.tif'
+    scan.write_bytes(tiff)
+
+    assert text(parse_tiff_fields(tiff)) == (DATE_ORIGINAL, DATE, MODEL)
+    assert text(read_exif_fields(str(scan))) == (DATE_ORIGINAL, DATE, MODEL)
+    pillow = Image.Exif()
+    pillow.load(tiff)
+    assert text(parse_tiff_fields(tiff)) == text((
+        pillow.get_ifd(EXIF_OFFSET).get(EXIF_DATATIME_ORIGINAL),
+        pillow.get(EXIF_DATATIME), pillow.get(EXIF_MODEL)))
+
+
+def test_png_exif_chunk(tmp_path):
+    photo = save(tmp_path / 'screenshot.png', 'PNG')
+
+    assert text(read_exif_fields(photo)) == (DATE_ORIGINAL, DATE, MODEL)
+    assert text(read_exif_fields(photo)) == text(pillow_exif_fields(photo))
+
+
+def test_no_exif(tmp_path):
+    photo = tmp_path / 'IMG_2.JPG'
+    Image.new('RGB', (16, 16)).save(photo, 'JPEG')
+
+    assert read_exif_fields(str(photo)) == (None, None, None)
+    assert exif_fields(str(photo)) == (None, None, None)
+
+
+def test_other_formats_fall_back_to_pillow(tmp_path):
+    if not features.check('webp'):
+        pytest.skip('Pillow built without WebP')
+    photo = save(tmp_path / 'IMG_3.webp', 'WEBP')
+
+    with pytest.raises(photo_metadata.UnsupportedFormat):
+        read_exif_fields(photo)
+    assert exif_fields(photo) == ('2019-07-08', '2020-01-02', MODEL)